@@ -1,10 +1,11 @@
 import sys
 from PyQt6.uic import loadUi
 from PyQt6 import QtWidgets
-from PyQt6.QtWidgets import QApplication, QMessageBox
+from PyQt6.QtWidgets import QApplication
 from src.user_interface.startScreen import startScreen
 from src.data_processing.database import connect_to_database, create_file_name_tables, close_database
-from src.user_interface.scraping_ui import scrapeCRKN
+from src.user_interface.sync_scheduler import SyncScheduler
+from src.utility.folder_watcher import FolderWatcher
 from src.utility.settings_manager import Settings
 from src.utility.logger import m_logger
 import os
@@ -37,11 +38,10 @@ def main():
         create_file_name_tables(connection_obj)
         close_database(connection_obj)
 
-    if settings_manager.get_setting('allow_CRKN') == "True":
-        reply = QMessageBox.question(None, 'Update CRKN' if language == "English" else "Mettre à jour de RCDR",
-                                     'Would you like to update CRKN database before proceeding?' if language == "English" else "Souhaitez-vous mettre à jour la base de données du RCDR avant de continuer ?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
-        if reply == QMessageBox.StandardButton.Yes:
-            scrapeCRKN()
+    # Keep CRKN data up to date in the background while the app is idle
+    SyncScheduler.get_instance().start()
+    # Upload local files dropped into the watched folder, if one is set
+    FolderWatcher.get_instance().start()
 
     sys.exit(app.exec())
 
@@ -5,18 +5,35 @@ Some functions can also be re-used for the local file uploads (compare_file)
 I tested new files and the same files, but not when the file has a newer date (to update)
 """
 import requests.exceptions
-import time
 from bs4 import BeautifulSoup
 import requests
 import pandas as pd
 from src.utility.settings_manager import Settings
-from src.data_processing import database
-from PyQt6.QtCore import QTimer, QThread, pyqtSignal
+from src.data_processing import (chunked_ingest, database, schema, string_dictionary, sync_journal, sync_pipeline,
+                                 sync_plan, table_sync, validation, xlsx_reader)
+from src.data_processing.chunked_ingest import read_delimited_preamble
+from src.data_processing.download_cache import DownloadCache
+from src.data_processing.institution_registry import InstitutionRegistry
+from src.data_processing.sync_pipeline import SyncPipeline
+from src.data_processing.shadow_tables import SHADOW_PREFIX, ShadowSync, drop_shadow_tables
+from src.data_processing.string_dictionary import StringDictionary
+from src.data_processing.sync_journal import SyncJournal
+from src.data_processing.http_session import RetryPolicy, get_session
+from PyQt6.QtCore import pyqtSignal
 from src.utility.logger import m_logger
+from src.utility.worker import WorkerThread
 import os
+import sqlite3
+import threading
+import time
+import zipfile
 
 settings_manager = Settings()
 
+# Held by the running CRKN sync - the Update button and the sync scheduler both start ScrapingThreads, and two syncs
+# would drop each other's shadow tables and share one sync journal
+sync_lock = threading.Lock()
+
 """
 Ethan Penney
 March 18, 2024
@@ -24,90 +41,98 @@ Created a class variant of scraping functions that are threaded and emit signals
 """
 
 
-class ScrapingThread(QThread):
-    def __init__(self):
+class ScrapingThread(WorkerThread):
+    def __init__(self, auto_confirm=False):
         super().__init__()
-
-    def run(self):
-        self.scrapeCRKN()
-
-    progress_update = pyqtSignal(int)
-    file_changes_signal = pyqtSignal(int)
+        # Apply the sync plan without asking the user (background syncs)
+        self.auto_confirm = auto_confirm
+        # Institutions of the first CRKN file loaded in a sync, saved to the settings once the sync is committed
+        self.CRKN_institutions = None
+
+    def run_task(self):
+        if not sync_lock.acquire(blocking=False):
+            m_logger.info("A CRKN sync is already running, not starting another one")
+            if settings_manager.get_setting("language") == "English":
+                self.error_signal.emit("A CRKN update is already running. Please wait for it to finish.")
+            else:
+                self.error_signal.emit("Une mise à jour du RCDR est déjà en cours. Veuillez attendre qu'elle se termine.")
+            return
+        try:
+            self.scrapeCRKN()
+        finally:
+            sync_lock.release()
+
+    def task_failed(self, error):
+        if settings_manager.get_setting("language") == "English":
+            self.error_signal.emit(f"Unexpected Error: The CRKN update stopped. {error}")
+        else:
+            self.error_signal.emit(f"Erreur inattendue : La mise à jour du RCDR s'est arrêtée. {error}")
+
+    # File name, bytes downloaded, total bytes (None if unknown) - object so sizes over 2 GB fit
+    download_progress = pyqtSignal(str, object, object)
+    # Stage name -> throughput statistics of the sync pipeline (SyncPipeline.get_stats)
+    stage_stats = pyqtSignal(object)
+    # SyncPlan of the files to add, update and remove - the UI asks the user to confirm it
+    file_changes_signal = pyqtSignal(object)
     error_signal = pyqtSignal(str)
 
-    def retry_scrape(self, attempt, max_attempt=3):
-        """ Attempt to scrape again if connection is lost in the middle of scraping"""
-        if attempt >= max_attempt:
-            return False
-        # wait for 1 second before retrying
-        time.sleep(1)
-        return True
-
     def scrapeCRKN(self):
         crkn_url = settings_manager.get_setting('CRKN_url')
         self.progress_update.emit(0)
         """Scrape the CRKN website for listed ebook files."""
         error = ""
         error_message = ""
-        attempt = 0
 
         # Show the user scraping has started
         self.progress_update.emit(5)
 
-        while attempt < 3:
-            try:
-                # Make a request to the CRKN website
-                response = requests.get(crkn_url)
-                # Check if request was successful (status 200)
-                response.raise_for_status()
-                # If request successful, process text
-                page_text = response.text
-                # Exit loop on successful scrape
-                break
-
-            except requests.exceptions.HTTPError as http_err:
-                # Handle HTTP errors
-                if settings_manager.get_setting("language") == "English":
-                    error_message = ("Server Connection Error: Please make sure you are connected "
-                                     "to your internet and the CRKN URL is ")
-                    "updated in the Settings page."
-                else:
-                    error_message = ("Erreur de connexion au serveur : Veuillez vous assurer que vous êtes connecté à "
-                                     "votre internet et que l'URL de CRKN est mise à jour dans la page des paramètres.")
-                error = http_err
-                page_text = None
-                if not self.retry_scrape(attempt):
-                    return
-            except requests.exceptions.ConnectionError as conn_err:
-                # Handle errors like refused connections
-                if settings_manager.get_setting("language") == "English":
-                    error_message = ("Internet Connection Error: Please make sure you are connected "
-                                     "to your internet.")
-                else:
-                    error_message = ("Erreur de Connexion Internet : Veuillez vous assurer que "
-                                     "vous êtes connecté à votre internet.")
-                error = conn_err
-                page_text = None
-                if not self.retry_scrape(attempt):
-                    return
-            except requests.exceptions.Timeout as timeout_err:
-                # Handle request timeout
-                if settings_manager.get_setting("language") == "English":
-                    error_message = "Connection Timeout: Please try again later."
-                else:
-                    error_message = "Délai de connexion dépassé : Veuillez essayer de mettre à jour CRKN à nouveau."
-                error = timeout_err
-                page_text = None
-            except Exception as e:
-                # Handle any other exceptions
-                if settings_manager.get_setting("language") == "English":
-                    error_message = ("Unexpected Error: Please make sure you are connected "
-                                     "to the internet.")
-                else:
-                    error_message = "Erreur inattendue : Veuillez réessayer plus tard."
-                error = e
-                page_text = None
-            attempt += 1
+        cache = DownloadCache()
+        session = get_session()
+        retry_policy = RetryPolicy.from_settings()
+        try:
+            # Make a (conditional) request to the CRKN website, retrying transient errors
+            # Raises for unsuccessful status once the retries are used up
+            listing = retry_policy.call(cache.fetch, crkn_url, session=session)
+            # If request successful, process text
+            page_text = listing.read_text()
+
+        except requests.exceptions.HTTPError as http_err:
+            # Handle HTTP errors
+            if settings_manager.get_setting("language") == "English":
+                error_message = ("Server Connection Error: Please make sure you are connected "
+                                 "to your internet and the CRKN URL is updated in the Settings page.")
+            else:
+                error_message = ("Erreur de connexion au serveur : Veuillez vous assurer que vous êtes connecté à "
+                                 "votre internet et que l'URL de CRKN est mise à jour dans la page des paramètres.")
+            error = http_err
+            page_text = None
+        except requests.exceptions.ConnectionError as conn_err:
+            # Handle errors like refused connections
+            if settings_manager.get_setting("language") == "English":
+                error_message = ("Internet Connection Error: Please make sure you are connected "
+                                 "to your internet.")
+            else:
+                error_message = ("Erreur de Connexion Internet : Veuillez vous assurer que "
+                                 "vous êtes connecté à votre internet.")
+            error = conn_err
+            page_text = None
+        except requests.exceptions.Timeout as timeout_err:
+            # Handle request timeout
+            if settings_manager.get_setting("language") == "English":
+                error_message = "Connection Timeout: Please try again later."
+            else:
+                error_message = "Délai de connexion dépassé : Veuillez essayer de mettre à jour CRKN à nouveau."
+            error = timeout_err
+            page_text = None
+        except Exception as e:
+            # Handle any other exceptions
+            if settings_manager.get_setting("language") == "English":
+                error_message = ("Unexpected Error: Please make sure you are connected "
+                                 "to the internet.")
+            else:
+                error_message = "Erreur inattendue : Veuillez réessayer plus tard."
+            error = e
+            page_text = None
 
         # Log and display error message
         if page_text is None:
@@ -115,153 +140,309 @@ class ScrapingThread(QThread):
             self.error_signal.emit(error_message)
             return
 
+        connection = database.connect_to_database()
+        # Databases created before the file catalog had hash columns
+        database.create_file_name_tables(connection)
+        journal = SyncJournal(os.path.join(cache.cache_dir, "sync_journal.json"))
+
+        # Listing is unchanged and was already synced into the current file catalog - skip parsing it again
+        if listing.is_processed(database.get_catalog_fingerprint(connection)):
+            m_logger.info("CRKN listing unchanged since last update, nothing to do.")
+            # Nothing left to resume
+            journal.clear()
+            with database.write_lock:
+                drop_shadow_tables(connection)
+            database.close_database(connection)
+            self.progress_update.emit(100)
+            return
+
         # Get list of links that end in xlsx, csv, or tsv from the CRKN website link
         soup = BeautifulSoup(page_text, "html.parser")
         links = soup.find_all('a', href=lambda href: href and (href.endswith('.xlsx') or href.endswith('.csv') or href.endswith('.tsv')))
 
-        connection = database.connect_to_database()
-
-        # List of files that need to be updated/added to the local database
-        files_to_update = []
-        # All CRKN tables - by end it will just have the ones to remove
-        files_to_remove = [file for file in database.get_tables(connection) if not file.startswith("local_")]
-
-        # Check if links on CRKN website need to be added/updated in local database
-        i = 0
-        for link in links:
-            i += 1
-            progress = 10 + int((i / len(links)) * 20)
-            self.progress_update.emit(progress)
-            file_link = link.get("href")
-            file_first, file_date = split_CRKN_file_name(file_link)
-            result = compare_file([file_first, file_date], "CRKN", connection)
-
-            # If result (update or insert into), add to update list
-            if result:
-                files_to_update.append([link, result])
-
-            try:
-                files_to_remove.remove(file_first)
-            except ValueError:
-                pass
+        # Compare the listed files to the file catalog (read once) - what to add, update and remove
+        self.progress_update.emit(10)
+        listed_files = [(*split_CRKN_file_name(link.get("href")), link.get("href")) for link in links]
+        plan = sync_plan.plan_sync(listed_files, sync_plan.load_catalog(connection, "CRKN"))
+        # Files of an interrupted sync that are still in the plan are resumed, the shadow tables of the rest are dropped
+        journal.prune([(file["file_name"], file["file_date"]) for file, _ in plan.downloads()])
+        with database.write_lock:
+            drop_shadow_tables(connection, keep=journal.loaded_tables())
+        self.progress_update.emit(30)
 
         # Ask user if they want to perform scraping (slightly time-consuming)
-        file_changes = len(files_to_update) + len(files_to_remove)
-        if file_changes > 0:
-            self.file_changes_signal.emit(file_changes)
-            ans = self.wait_for_response()
+        synced = True
+        if plan.change_count() > 0:
+            if self.auto_confirm and not plan.can_apply_unconfirmed():
+                # Nobody is there to confirm - skip the sync, the user can review it from the settings page
+                m_logger.warning(f"CRKN listing is missing {len(plan.deletes)} of the {plan.catalog_size()} files in "
+                                 f"the database, not applying the background sync")
+                if settings_manager.get_setting("language") == "English":
+                    self.error_signal.emit(f"The CRKN listing is missing {len(plan.deletes)} of the "
+                                           f"{plan.catalog_size()} files in the database, so the update was not "
+                                           f"applied. Update from the settings page to review the changes.")
+                else:
+                    self.error_signal.emit(f"La liste du RCDR ne contient pas {len(plan.deletes)} des "
+                                           f"{plan.catalog_size()} fichiers de la base de données, la mise à jour n'a "
+                                           f"donc pas été appliquée. Effectuez la mise à jour depuis la page des "
+                                           f"paramètres pour vérifier les changements.")
+                ans = "N"
+            elif self.auto_confirm:
+                ans = "Y"
+            else:
+                ans = self.ask(self.file_changes_signal, plan)
+            synced = ans == "Y"
             if ans == "Y":
+                # Load every change into shadow tables, and only swap them in if the whole sync succeeded
+                shadow = ShadowSync(connection, "CRKN")
+                self.CRKN_institutions = None
+                files_to_update = plan.downloads()
                 if len(files_to_update) > 0:
-                    self.download_files(files_to_update, connection)
-                if len(files_to_remove) > 0:
-                    i = 0
-                    for file in files_to_remove:
-                        i += 1
-                        progress = 90 + int((i / len(files_to_remove)) * 9)
-                        self.progress_update.emit(progress)
-                        update_tables([file], "CRKN", connection, "DELETE")
+                    synced = self.download_files(files_to_update, connection, shadow, journal, cache, session,
+                                                 retry_policy)
+                for file in plan.deletes:
+                    shadow.remove(file)
+                if synced:
+                    self.progress_update.emit(95)
+                    try:
+                        with database.write_lock:
+                            shadow.commit()
+                        journal.clear()
+                    except sqlite3.Error as e:
+                        synced = False
+                        journal.clear()
+                        if settings_manager.get_setting("language") == "English":
+                            self.error_signal.emit(f"The updated CRKN files could not be saved to the database: {e}")
+                        else:
+                            self.error_signal.emit(f"Les fichiers CRKN mis à jour n'ont pas pu être enregistrés "
+                                                   f"dans la base de données : {e}")
+                else:
+                    # Keep the files that were loaded, so the next sync only has to do the rest
+                    with database.write_lock:
+                        shadow.discard(keep=journal.loaded_tables())
+                if synced and self.CRKN_institutions is not None:
+                    InstitutionRegistry.get_instance().add_CRKN_institutions(self.CRKN_institutions)
+
+        # Remember the catalog this listing produced, so an unchanged listing can be skipped next time
+        if synced:
+            cache.mark_processed(crkn_url, database.get_catalog_fingerprint(connection))
+            # Earlier versions of the files are listed under other URLs - their cached copies are not needed any more
+            root_url = settings_manager.get_setting("CRKN_root_url")
+            cache.retain([crkn_url] + [root_url + link.get("href") for link in links])
 
         database.close_database(connection)
         self.progress_update.emit(100)
 
-    def wait_for_response(self):
-        # This function halts the execution of the thread until response is received
-        self.response = None
-        while self.response is None:
-            self.msleep(100)  # Sleep to avoid busy waiting
-        return self.response
-
-
+    def download_progress_callback(self, file_name, step=512 * 1024):
+        """
+        Make a callback for DownloadCache.fetch that emits download_progress at most once per step bytes.
+        :param file_name: name of the file being downloaded
+        :param step: number of bytes between signals, so the GUI is not flooded with one signal per chunk
+        :return: function(bytes_done, bytes_total)
+        """
+        last_emitted = [-step]
 
+        def callback(done, total):
+            if done - last_emitted[0] >= step or done == total:
+                last_emitted[0] = done
+                self.download_progress.emit(file_name, done, total)
+        return callback
     
-    def receive_response(self, response):
-        self.response = response
-    
-    def download_files(self, files, connection):        
+    def download_files(self, files, connection, shadow, journal, cache=None, session=None, retry_policy=None):
         """
-        For all files that need downloading from CRKN, do so and store in local database.
-        :param files: list of files to download from CRKN
+        For all files that need downloading from CRKN, do so and load them into shadow tables.
+        Runs as a staged pipeline (see sync_pipeline): files are downloaded through the download cache, parsed and
+        validated (in worker processes, see sync_pipeline.get_parse_processes), and loaded by this thread, with the
+        stages overlapping. The live tables are only replaced when the caller commits the shadow tables.
+        Each file's progress is recorded in the sync journal: files an earlier, unfinished sync already loaded are taken
+        from their shadow tables, and verified earlier downloads are reused without contacting the server.
+        Files whose bytes (content hash) or rows (row hash) match the stored version are not loaded again - only their
+        file catalog entry and File_Name column are updated when the sync is committed.
+        :param files: list of files to download from CRKN - (file dictionary, command) from SyncPlan.downloads
         :param connection: database connection object
+        :param shadow: ShadowSync the files are staged in
+        :param journal: SyncJournal recording the stage each file reached
+        :param cache: DownloadCache to fetch files through (a new one by default)
+        :param session: requests session to download with (the shared session by default)
+        :param retry_policy: RetryPolicy for each download (from settings by default)
+        :return: True if every file was downloaded and staged, False otherwise
         """
-        language = settings_manager.get_setting("language")
-        try:
-            i = 0
-            scraped_institutions = False
-            for [link, command] in files:
-                i += 1
-                progress = 30 + int((i / len(files)) * 30)
-                self.progress_update.emit(progress)
-                file_link = link.get("href")
-
-                # Get which type of file it is (xlsx, csv, or tsv)
-                file_type = file_link.split(".")[-1]
-
-                # Platform, date/version number
-                file_first, file_date = split_CRKN_file_name(file_link)
-
-                # Write file to temporary local file
-                with open(f"{os.path.abspath(os.path.dirname(__file__))}/temp.{file_type}", 'wb') as file:
-                    response = requests.get(settings_manager.get_setting("CRKN_root_url") + file_link)
-                    file.write(response.content)
-
-                # Convert file into dataframe
-                if file_type == "xlsx":
-                    file_df = file_to_dataframe_excel(file_link.split("/")[-1], f"{os.path.abspath(os.path.dirname(__file__))}/temp.xlsx")
-                elif file_type == "tsv":
-                    file_df = file_to_dataframe_tsv(file_link.split("/")[-1], f"{os.path.abspath(os.path.dirname(__file__))}/temp.tsv")
-                else:
-                    file_df = file_to_dataframe_csv(file_link.split("/")[-1], f"{os.path.abspath(os.path.dirname(__file__))}/temp.csv")
-
-                # Check if in correct format, if it is, upload and update tables
-                valid_format = check_file_format(file_df)
-                if valid_format is True:
-                    upload_to_database(file_df, file_first, connection)
-                    update_tables([file_first, file_date], "CRKN", connection, command)
-                    if not scraped_institutions:
-                        # Scrape CRKN institution list from valid CRKN file once
-                        headers = file_df.columns.to_list()
-                        insts = headers[8:-2]
-                        settings_manager.add_CRKN_institutions(insts)
-                        scraped_institutions = True
+        if cache is None:
+            cache = DownloadCache()
+        if session is None:
+            session = get_session()
+        if retry_policy is None:
+            retry_policy = RetryPolicy.from_settings()
+        root_url = settings_manager.get_setting("CRKN_root_url")
+        loaded = []
+        # Hashes of the stored version of every file
+        stored_hashes = database.get_file_hashes(connection, "CRKN")
+
+        # Resume - files already loaded by an unfinished sync of the same plan only need to be staged again
+        remaining = []
+        for file, command in files:
+            entry = journal.get(file["file_name"], file["file_date"])
+            if (entry is not None and entry["stage"] == sync_journal.LOADED
+                    and shadow.restore(file["file_name"], file["file_date"], command, entry["row_count"],
+                                       entry.get("content_hash"), entry.get("row_hash"))):
+                m_logger.info(f"Resuming with already loaded file {file['file_name']}")
+                if self.CRKN_institutions is None:
+                    self.CRKN_institutions = table_sync.get_table_columns(
+                        connection, SHADOW_PREFIX + file["file_name"])[8:-2]
+                loaded.append(file["file_name"])
+            else:
+                remaining.append((file, command))
+
+        def download(entry):
+            file, command = entry
+            file_link = file["link"]
+            file_name = file_link.split("/")[-1]
+            # Reuse a verified download of an unfinished sync
+            journal_entry = journal.get(file["file_name"], file["file_date"])
+            path = journal.verified_download(journal_entry)
+            if path is None:
+                # Stream file into the cache (revalidated if a copy is already cached)
+                result = retry_policy.call(cache.fetch, root_url + file_link, session=session,
+                                           progress_callback=self.download_progress_callback(file_name))
+                path = result.path
+                content_hash = result.content_hash
+                journal.record(file["file_name"], file["file_date"], sync_journal.DOWNLOADED,
+                               content_hash=content_hash, path=path)
+            else:
+                content_hash = journal_entry["content_hash"]
+            job = {"file_name": file_name, "path": path, "file_first": file["file_name"],
+                   "file_date": file["file_date"], "command": command, "content_hash": content_hash,
+                   "stored": stored_hashes.get(file["file_name"], (None, None)) if command == "UPDATE" else (None, None)}
+            return job, os.path.getsize(path)
+
+        def stage_unchanged(job, row_hash):
+            # Same bytes or same rows as the stored version - nothing to load
+            m_logger.info(f"{job['file_name']} is unchanged from the stored version, only updating its metadata")
+            shadow.stage_metadata(job["file_first"], job["file_date"], job["file_name"], job["content_hash"], row_hash)
+            loaded.append(job["file_name"])
+            self.progress_update.emit(30 + int((len(loaded) / len(files)) * 60))
+            return 0
+
+        def load(job):
+            file_name, file_df, file_first, file_date = job["file_name"], job["df"], job["file_first"], job["file_date"]
+            if job["valid_format"] is not True:
+                raise Exception(f"{file_name} was not in the correct format, so it was not uploaded. "
+                                f"{job['valid_format']}")
+            journal.record(file_first, file_date, sync_journal.VALIDATED)
+            if job.get("streamed") is not None:
+                # Large file - validated and written chunk by chunk, straight into the shadow table
+                shadow_table = shadow.create(file_first)
+                result = chunked_ingest.ingest_file(file_name, job["path"], job["streamed"], shadow_table, connection,
+                                                    progress_callback=self.chunk_progress_callback(
+                                                        file_name, len(loaded), len(files)),
+                                                    skip_row_hash=job["stored"][1])
+                if isinstance(result, str) or not result.written:
+                    shadow.drop(file_first)
+                if isinstance(result, str):
+                    raise Exception(f"{file_name} was not in the correct format, so it was not uploaded. {result}")
+                if not result.written:
+                    return stage_unchanged(job, result.row_hash)
+                columns, row_count, row_hash = result.columns, result.rows, result.row_hash
+            elif file_df is None or job["row_hash"] == job["stored"][1]:
+                return stage_unchanged(job, job["row_hash"])
+            else:
+                shadow_table = shadow.create(file_first, file_df.columns.to_list())
+                if upload_to_database(file_df, shadow_table, connection) is None:
+                    raise Exception(f"{file_name} could not be written to the database.")
+                columns, row_count, row_hash = file_df.columns.to_list(), len(file_df), job["row_hash"]
+            shadow.stage(file_first, file_date, job["command"], columns, row_count, job["content_hash"], row_hash)
+            journal.record(file_first, file_date, sync_journal.LOADED, row_count=row_count, row_hash=row_hash)
+            if self.CRKN_institutions is None:
+                # Scrape CRKN institution list from valid CRKN file once - saved if the sync is committed
+                self.CRKN_institutions = columns[8:-2]
+            loaded.append(file_name)
+            self.progress_update.emit(30 + int((len(loaded) / len(files)) * 60))
+            return row_count
+
+        def load_locked(job):
+            # Held for each file, not for the downloads - uploads wait for one file to load, not for the whole sync
+            with database.write_lock:
+                return load(job)
+
+        pipeline = SyncPipeline(download, parse_and_validate, load_locked,
+                                parse_processes=sync_pipeline.get_parse_processes(len(remaining)),
+                                stats_callback=self.stage_stats_callback())
+        failures = pipeline.run(remaining)
+
+        if failures:
+            details = []
+            for item, stage, error in failures:
+                if stage == "download":
+                    details.append(f"{item[0]['link'].split('/')[-1]}: could not be downloaded ({error})")
                 else:
-                    m_logger.error(f"The file was not in the correct format, so it was not uploaded. {valid_format}")
-                    self.error_signal.emit(f"The file was not in the correct format, so it was not uploaded.\n{valid_format}")
-
-        # Handle connection loss in middle of scraping
-        except requests.exceptions.HTTPError as http_err:
-            # Handle HTTP errors
-            error_message = "Server Connection Error: Connection to the server was lost. Some files may have been scraped, but not all files."
-            m_logger.error(error_message)
-            self.error_signal.emit(error_message)
-        except requests.exceptions.ConnectionError as conn_err:
-            # Handle errors like refused connections
-            error_message = "Internet Connection Error: Connection to the internet was lost. Some files may have been scraped, but not all files."
-            m_logger.error(error_message)
-            self.error_signal.emit(error_message)
-        except requests.exceptions.Timeout as timeout_err:
-            # Handle request timeout
-            error_message = "Connection Timeout: The connection was too slow. Some files may have been scraped, but not all files."
-            m_logger.error(error_message)
-            self.error_signal.emit(error_message)
-        except Exception as e:
-            # Handle any other exceptions
-            error_message = "Unexpected Error: Please try again later. Some files may have been scraped, but not all files."
+                    details.append(str(error))
+            error_message = (f"{len(failures)} of {len(files)} files could not be updated, so no changes were saved. "
+                             f"The next update will resume from where this one stopped.\n" + "\n".join(details))
             m_logger.error(error_message)
             self.error_signal.emit(error_message)
+        return len(failures) == 0
 
-        # Remove temp.xlsx used for uploading files
-        try:
-            os.remove(f"{os.path.abspath(os.path.dirname(__file__))}/temp.xlsx")
-        except FileNotFoundError:
-            pass
-        try:
-            os.remove(f"{os.path.abspath(os.path.dirname(__file__))}/temp.csv")
-        except FileNotFoundError:
-            pass
-        try:
-            os.remove(f"{os.path.abspath(os.path.dirname(__file__))}/temp.tsv")
-        except FileNotFoundError:
-            pass
+    def chunk_progress_callback(self, file_name, done_files, total_files):
+        """
+        Make a progress callback for chunked_ingest.ingest_file, moving the progress bar through the share of the
+        file being loaded.
+        :param file_name: name of the file being loaded
+        :param done_files: number of files already loaded
+        :param total_files: number of files in the sync
+        :return: function(rows, bytes_read, bytes_total)
+        """
+        def callback(rows, done, total):
+            m_logger.info(f"Loaded {rows} rows of {file_name} ({done} of {total} bytes)")
+            fraction = done / total if total else 1
+            self.progress_update.emit(30 + int(((done_files + fraction) / total_files) * 60))
+        return callback
+
+    def stage_stats_callback(self, interval=0.5):
+        """
+        Make a stats callback for SyncPipeline that emits stage_stats at most once per interval seconds.
+        :param interval: seconds between signals
+        :return: function(stats)
+        """
+        last_emitted = [0.0]
+
+        def callback(stats):
+            now = time.monotonic()
+            if now - last_emitted[0] >= interval:
+                last_emitted[0] = now
+                self.stage_stats.emit(stats)
+        return callback
+
+
+def parse_and_validate(job):
+    """
+    Parse a downloaded file into a dataframe and check its format - the parse stage of ScrapingThread.download_files.
+    Module-level so it can run in a worker process.
+    Files with the same content hash as the stored version are not parsed at all (df is None), and neither are large
+    files (streamed is added - the file type, see chunked_ingest).
+    :param job: dictionary - file_name, path, file_first, file_date, command, content_hash and stored (the
+    (content_hash, row_hash) of the stored version)
+    :return: (job with df, valid_format (True or error string) and row_hash added, 1)
+    """
+    job = dict(job)
+    stored_content_hash, stored_row_hash = job["stored"]
+    if job["content_hash"] is not None and job["content_hash"] == stored_content_hash:
+        job.update(df=None, valid_format=True, row_hash=stored_row_hash)
+        return job, 1
+
+    # Large files are not parsed here - they are validated and written in chunks by the load stage
+    file_type = detect_file_type(job["path"], job["file_name"])
+    if chunked_ingest.use_streaming(job["path"], file_type):
+        job.update(df=None, valid_format=True, row_hash=None, streamed=file_type)
+        return job, 1
+
+    # Convert file into dataframe (type detected from the contents)
+    file_df = file_to_dataframe(job["file_name"], job["path"])
+
+    # Check if in correct format
+    valid_format = check_file_format(file_df)
+    job.update(df=file_df, valid_format=valid_format,
+               row_hash=table_sync.row_hash(file_df) if valid_format is True else None)
+    return job, 1
 
 
 def compare_file(file, method, connection):
@@ -329,6 +510,7 @@ def update_tables(file, method, connection, command):
                 cursor.execute(f"DROP TABLE {file[0]}")
             else:
                 cursor.execute(f"DROP TABLE [local_{file[0]}]")
+            string_dictionary.prune(connection)
         # Commit changes on successful operation
         connection.commit()
     except Exception as e:
@@ -354,156 +536,200 @@ def split_CRKN_file_name(file_name):
 def file_to_dataframe_excel(file_name, file):
     """
     Convert Excel file to pandas dataframe.
-    File can be either a file or a URL link to a file.
+    The PA-Rights sheet is streamed in read-only mode (see xlsx_reader), with every value read as a string, but the
+    dataframe holds the whole sheet - large files are written batch by batch instead (see chunked_ingest.ingest_xlsx).
     :param file_name: the file name being uploaded
     :param file: local file to convert to dataframe
     :return: dataframe, or error string
     """
     try:
-        df = pd.read_excel(file, sheet_name="PA-Rights")
-
-        # Check top left cell for platform, return if missing (catch in check_file_format)
-        platform = df.columns[0]
-        if platform == "Unnamed: 0":
-            m_logger.error("File to Dataframe failed - No Platform listed.")
-            return "No Platform"
+        with xlsx_reader.PARightsSheet(file) as sheet:
+            # Check top left cell for platform, return if missing (catch in check_file_format)
+            platform = sheet.platform
+            if platform is None:
+                m_logger.error("File to Dataframe failed - No Platform listed.")
+                return "No Platform"
 
-        # Remove top two rows, set header
-        df = df.set_axis(df.values[1], axis="columns")
-        df = df.drop([0, 1])
+            # Build the dataframe from the row batches, header already set from the preamble
+            frames = [pd.DataFrame(batch, columns=sheet.header, dtype=object) for batch in sheet.batches()]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=sheet.header, dtype=object)
 
         # Add platform and file_name to dataframe
         df["Platform"] = platform
         df["File_Name"] = file_name
-        df = df.reset_index(drop=True)
         return df
-    except ValueError:
+    except (KeyError, ValueError, zipfile.BadZipFile):
         m_logger.error("Incorrect sheet name in excel file (PA-Rights did not exist).")
         return "PA-Rights"
 
 
-def file_to_dataframe_csv(file_name, file):
+# Extensions of the files that can be uploaded
+SUPPORTED_FILE_TYPES = ("xlsx", "csv", "tsv")
+
+
+def detect_file_type(file, file_name=""):
+    """
+    Detect the type of an xlsx, csv or tsv file. Only files with one of those extensions are read - the contents decide
+    which of the three the file really is (e.g. a tab separated file named .csv), falling back to the extension when
+    they are ambiguous.
+    :param file: local file path
+    :param file_name: file name, used for its extension
+    :return: "xlsx", "csv", "tsv", or None if the file is not any of them
+    """
+    extension = file_name.split(".")[-1].lower() if "." in file_name else None
+    if extension not in SUPPORTED_FILE_TYPES:
+        return None
+    with open(file, "rb") as f:
+        start = f.read(64 * 1024)
+
+    # xlsx files are zip archives with a workbook part - other zip files (docx, zip) are not read
+    if start.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(file) as archive:
+                return "xlsx" if "xl/workbook.xml" in archive.namelist() else None
+        except zipfile.BadZipFile:
+            return None
+    if b"\x00" in start:
+        return None
+
+    # Delimited text - whichever separator appears more in the first few lines
+    lines = start.splitlines()[:5]
+    tabs = sum(line.count(b"\t") for line in lines)
+    commas = sum(line.count(b",") for line in lines)
+    if tabs > commas:
+        return "tsv"
+    if commas > tabs:
+        return "csv"
+    return extension if extension in ("csv", "tsv") else None
+
+
+def file_to_dataframe(file_name, file):
     """
-    Convert csv file to pandas dataframe.
-    File can be either a file or a URL link to a file.
+    Convert a CRKN/local file (xlsx, csv, or tsv - detected from the contents) to pandas dataframe.
+    The preamble (platform in the first cell, a skipped row, then the header row) is read separately, and the body is
+    read once with that header - no copies of the whole file are made to find the header.
     :param file_name: the file name being uploaded
     :param file: local file to convert to dataframe
-    :return: dataframe, or error string
+    :return: dataframe, "No Platform" or "PA-Rights" error string, or None if the file type is not supported
     """
-    try:
-        df = pd.read_csv(file)
+    file_type = detect_file_type(file, file_name)
+    if file_type == "xlsx":
+        return file_to_dataframe_excel(file_name, file)
+    if file_type in ("csv", "tsv"):
+        return file_to_dataframe_delimited(file_name, file, "\t" if file_type == "tsv" else ",")
+    return None
 
-        # Check top left cell for platform, return if missing (catch in check_file_format)
-        platform = df.columns[0]
-        if platform == "Unnamed: 0":
-            m_logger.error("File to Dataframe failed - No Platform listed.")
-            return "No Platform"
 
-        # Remove top two rows, set header
-        df = df.set_axis(df.values[1], axis="columns")
-        df = df.drop([0, 1])
-
-        # Add platform and file_name to dataframe
-        df["Platform"] = platform
-        df["File_Name"] = file_name
-        df = df.reset_index(drop=True)
-        return df
-    except Exception:
-        m_logger.error("File to Dataframe failed - Unable to read csv file.")
-        return "PA-Rights"
-
-
-def file_to_dataframe_tsv(file_name, file):
+def read_file_header(file_name, file):
     """
-        Convert tsv file to pandas dataframe.
-        File can be either a file or a URL link to a file.
-        :param file_name: the file name being uploaded
-        :param file: local file to convert to dataframe
-        :return: dataframe, or error string
-        """
-    try:
-        df = pd.read_table(file)
-
-        # Check top left cell for platform, return if missing (catch in check_file_format)
-        platform = df.columns[0]
-        if platform == "Unnamed: 0":
-            m_logger.error("File to Dataframe failed - No Platform listed.")
-            return "No Platform"
+    Read only the header row of a CRKN/local file (xlsx, csv, or tsv), without reading the data rows - enough to find
+    its institution columns before it is parsed.
+    :param file_name: the file name being uploaded
+    :param file: local file path
+    :return: list of header names, or None if the file could not be read
+    """
+    file_type = detect_file_type(file, file_name)
+    if file_type == "xlsx":
+        try:
+            with xlsx_reader.PARightsSheet(file) as sheet:
+                return sheet.header
+        except (KeyError, ValueError, zipfile.BadZipFile):
+            return None
+    if file_type in ("csv", "tsv"):
+        for encoding in ("utf-8-sig", "latin-1"):
+            try:
+                with open(file, "r", encoding=encoding, newline="") as f:
+                    return read_delimited_preamble(f, "\t" if file_type == "tsv" else ",")[1]
+            except UnicodeDecodeError:
+                continue
+    return None
 
-        # Remove top two rows, set header
-        df = df.set_axis(df.values[1], axis="columns")
-        df = df.drop([0, 1])
 
-        # Add platform and file_name to dataframe
-        df["Platform"] = platform
-        df["File_Name"] = file_name
-        df = df.reset_index(drop=True)
-        return df
-    except Exception:
-        m_logger.error("File to Dataframe failed - Unable to read tsv file.")
-        return "PA-Rights"
+def file_to_dataframe_delimited(file_name, file, separator):
+    """
+    Convert csv or tsv file to pandas dataframe, with every value read as a string.
+    :param file_name: the file name being uploaded
+    :param file: local file to convert to dataframe
+    :param separator: "," for csv, "\t" for tsv
+    :return: dataframe, or error string
+    """
+    file_type = "tsv" if separator == "\t" else "csv"
+    for encoding in ("utf-8-sig", "latin-1"):
+        try:
+            with open(file, "r", encoding=encoding, newline="") as f:
+                # Check top left cell for platform, return if missing (catch in check_file_format)
+                platform, header = read_delimited_preamble(f, separator)
+                if platform is None:
+                    m_logger.error("File to Dataframe failed - No Platform listed.")
+                    return "No Platform"
+
+                # Body is read in one pass, continuing from where the preamble ended
+                df = pd.read_csv(f, sep=separator, header=None, names=header, usecols=range(len(header)),
+                                 dtype=str, keep_default_na=False, na_values=[""], skip_blank_lines=True)
+
+            # Add platform and file_name to dataframe
+            df["Platform"] = platform
+            df["File_Name"] = file_name
+            return df
+        except UnicodeDecodeError:
+            continue
+        except Exception:
+            break
+    m_logger.error(f"File to Dataframe failed - Unable to read {file_type} file.")
+    return "PA-Rights"
 
 
 def upload_to_database(df, table_name, connection):
     """
     Upload file dataframe to table in database.
+    If the table already exists with the same columns and the sync_mode setting is "incremental" (the default), only
+    the rows that changed are written (see table_sync). Otherwise the table is replaced with one created with the typed
+    schema (see schema).
     :param df: dataframe with data
     :param table_name: table to insert data into
     :param connection: database connection object
+    :return: dictionary of counts - inserted, updated, deleted, unchanged - or None if the upload failed
     """
+    incremental = settings_manager.get_setting("sync_mode") != "replace"
+    columns = df.columns.to_list()
+    if (incremental and table_sync.get_table_columns(connection, table_name) == columns
+            and schema.is_typed(connection, table_name)):
+        try:
+            return table_sync.sync_table(df, table_name, connection)
+        except Exception as e:
+            m_logger.error(f"Failed to sync data to {table_name}: {e}. Database remains unchanged.")
+            return None
 
+    column_list = ", ".join(f"[{column}]" for column in columns)
+    placeholders = ", ".join("?" for _ in columns)
     try:
-        df.to_sql(
-            name=table_name,
-            con=connection,
-            if_exists="replace",
-            index=False
-        )
+        # Values are converted before they are inserted (dates included), so nothing has to be fixed afterwards
         cursor = connection.cursor()
-        # Fixes the date format in the database directly; removes the seconds
-        cursor.execute(f'''
-            UPDATE {table_name}
-            SET title_metadata_last_modified = strftime('%Y-%m-%d', title_metadata_last_modified)
-        ''')
+        cursor.execute(f"DROP TABLE IF EXISTS [{table_name}];")
+        schema.create_table(cursor, table_name, columns)
+        prepared = StringDictionary(connection).encode(table_sync.prepare_dataframe(df))
+        cursor.executemany(f"INSERT INTO [{table_name}] ({column_list}) VALUES ({placeholders})",
+                           prepared.itertuples(index=False, name=None))
         connection.commit()
+        return {"inserted": len(df), "updated": 0, "deleted": 0, "unchanged": 0}
     except Exception as e:
         # Rollback in case of error
         connection.rollback()
         m_logger.error(f"Failed to upload data to {table_name}: {e}. Database remains unchanged.")
+        return None
 
 
 def check_file_format(file_df):
     """
-    Checks the incoming file format to see if it is correct
+    Checks the incoming file format to see if it is correct (see validation)
     :param file_df: dataframe with file info (or None if unable to turn into dataframe
-    :return: True if valid, error string if not
+    :return: True if valid, error string (the full validation report) if not
     """
 
     if isinstance(file_df, pd.DataFrame):
-        header_row = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code",
-                      "collection_name", "title_metadata_last_modified"]
-        headers = file_df.columns.to_list()
-
-        # Header row is incorrect (too short or headers don't match)
-        if len(headers) <= 8 or not headers[:8] == header_row:
-            m_logger.error("The header row is incorrect")
-            return "The header row is incorrect."
-
-        # Title, ISBN and Y/N Column complete
-        df_series = file_df.count()
-        rows = file_df.shape[0]
-        if df_series["Title"] != rows:
-            m_logger.error("Missing title data")
-            return "Missing title data."
-        # if df_series["Platform_eISBN"] != rows:
-        #     m_logger.error("Missing ISBN data")
-        #     return "Missing Platform_eISBN data."
-        for institution_column in df_series[8:-2]:
-            if institution_column != rows:
-                m_logger.error("Missing Y/N data")
-                return "Missing Y/N data"
-
-        return True
+        validator = validation.Validator()
+        validator.update(file_df)
+        return validator.result()
 
     # Failed to read the file into dataframe - return error instead
     elif file_df == "No Platform":
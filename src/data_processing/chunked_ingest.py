@@ -0,0 +1,267 @@
+"""
+Memory-bounded ingestion of large csv/tsv and xlsx files.
+
+file_to_dataframe reads a whole file into one dataframe, which for a multi-million-row export takes several GB. Instead,
+ingest_file reads the file in chunks of CHUNK_ROWS rows (csv/tsv with pd.read_csv, xlsx with the batches of
+xlsx_reader.PARightsSheet) and writes each chunk with executemany as soon as it is validated, so memory stays the same
+whatever the size of the file. The table is replaced inside a single transaction - if the file turns out to be invalid,
+it is rolled back and the stored table is left as it was.
+
+Validation runs incrementally (validation.Validator, over every chunk so the report covers the whole file), and so
+does the row hash (table_sync.RowHasher).
+Files at least as large as the streaming_threshold_mb setting are ingested this way (see use_streaming).
+"""
+import csv
+import io
+import os
+import zipfile
+import pandas as pd
+from src.data_processing import schema, table_sync, validation, xlsx_reader
+from src.data_processing.string_dictionary import StringDictionary
+from src.utility.logger import m_logger
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+
+CHUNK_ROWS = 50_000
+DEFAULT_THRESHOLD_MB = 100
+
+def use_streaming(file, file_type):
+    """
+    Check if a file should be ingested in chunks instead of read into one dataframe.
+    :param file: local file path
+    :param file_type: "xlsx", "csv" or "tsv" (see Scraping.detect_file_type)
+    :return: True for files at least streaming_threshold_mb megabytes large - for xlsx files, the uncompressed size of
+    their parts, since that is what is read
+    """
+    if file_type == "xlsx":
+        try:
+            with zipfile.ZipFile(file) as archive:
+                size = sum(info.file_size for info in archive.infolist())
+        except zipfile.BadZipFile:
+            return False
+    elif file_type in ("csv", "tsv"):
+        size = os.path.getsize(file)
+    else:
+        return False
+    threshold = settings_manager.get_setting("streaming_threshold_mb")
+    if threshold is None:
+        threshold = DEFAULT_THRESHOLD_MB
+    return size >= float(threshold) * 1024 * 1024
+
+
+def read_delimited_preamble(file, separator):
+    """
+    Read the preamble of a csv/tsv file.
+    :param file: open text file, left positioned at the first data row
+    :param separator: "," or "\t"
+    :return: (platform or None, list of header names)
+    """
+    reader = csv.reader(file, delimiter=separator)
+    first_row = next(reader, [])
+    next(reader, None)
+    header = next(reader, [])
+    platform = first_row[0].strip() if first_row and first_row[0].strip() else None
+    # Drop trailing empty header cells
+    while header and not header[-1].strip():
+        header.pop()
+    return platform, header
+
+
+class CountingReader(io.RawIOBase):
+    """Binary file wrapper counting the bytes read through it, for progress by bytes."""
+
+    def __init__(self, file):
+        self.file = file
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.file.readinto(buffer)
+        self.bytes_read += count or 0
+        return count
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class IngestResult:
+    """
+    Outcome of ingest_file.
+    columns - columns of the table (header, Platform, File_Name)
+    rows - number of rows written
+    row_hash - table_sync.row_hash of the file
+    written - False if the rows matched skip_row_hash, so the transaction was rolled back
+    """
+
+    def __init__(self, columns, rows, row_hash, written):
+        self.columns = columns
+        self.rows = rows
+        self.row_hash = row_hash
+        self.written = written
+
+    def counts(self):
+        """
+        :return: dictionary of counts like Scraping.upload_to_database - inserted, updated, deleted, unchanged
+        """
+        if not self.written:
+            return {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": self.rows}
+        return {"inserted": self.rows, "updated": 0, "deleted": 0, "unchanged": 0}
+
+
+def ingest_delimited(file_name, file, separator, table_name, connection, chunk_rows=CHUNK_ROWS,
+                     progress_callback=None, skip_row_hash=None):
+    """
+    Replace a table with the contents of a csv/tsv file, read and written chunk by chunk in one transaction.
+    :param file_name: the file name being uploaded (File_Name column)
+    :param file: local file path
+    :param separator: "," for csv, "\t" for tsv
+    :param table_name: table to replace
+    :param connection: database connection object
+    :param chunk_rows: rows per chunk
+    :param progress_callback: function(rows, bytes_read, bytes_total) called after every chunk
+    :param skip_row_hash: row hash of the stored version - if the file has the same rows, nothing is written
+    :return: IngestResult, or error string (as from Scraping.check_file_format) if the file is invalid - the table is
+    left unchanged
+    """
+    file_type = "tsv" if separator == "\t" else "csv"
+    total = os.path.getsize(file)
+    for encoding in ("utf-8-sig", "latin-1"):
+        try:
+            return ingest_with_encoding(file_name, file, separator, encoding, table_name, connection, chunk_rows,
+                                        progress_callback, skip_row_hash, total)
+        except UnicodeDecodeError:
+            continue
+    m_logger.error(f"Chunked ingest failed - Unable to read {file_type} file.")
+    return f"The {file_type} file could not be read."
+
+
+def ingest_with_encoding(file_name, file, separator, encoding, table_name, connection, chunk_rows, progress_callback,
+                         skip_row_hash, total):
+    reader = CountingReader(open(file, "rb"))
+    text = io.TextIOWrapper(io.BufferedReader(reader), encoding=encoding, newline="")
+    try:
+        # Check top left cell for platform (caught by the format check)
+        platform, header = read_delimited_preamble(text, separator)
+        if platform is None:
+            m_logger.error("Chunked ingest failed - No Platform listed.")
+            return "No Platform listed in cell A1."
+        chunks = pd.read_csv(text, sep=separator, header=None, names=header, usecols=range(len(header)), dtype=str,
+                             keep_default_na=False, na_values=[""], skip_blank_lines=True, chunksize=chunk_rows)
+        return write_chunks(file_name, platform, header, chunks, table_name, connection, skip_row_hash,
+                            None if progress_callback is None else
+                            lambda rows: progress_callback(rows, reader.bytes_read, total))
+    finally:
+        text.close()
+
+
+def ingest_xlsx(file_name, file, table_name, connection, chunk_rows=CHUNK_ROWS, progress_callback=None,
+                skip_row_hash=None):
+    """
+    Replace a table with the contents of the PA-Rights sheet of an xlsx file, streamed (see xlsx_reader) and written
+    chunk by chunk in one transaction.
+    :param file_name: the file name being uploaded (File_Name column)
+    :param file: local file path
+    :param table_name: table to replace
+    :param connection: database connection object
+    :param chunk_rows: rows per chunk
+    :param progress_callback: function(rows, bytes_read, bytes_total) called after every chunk - bytes of the sheet XML
+    :param skip_row_hash: row hash of the stored version - if the file has the same rows, nothing is written
+    :return: IngestResult, or error string (as from Scraping.check_file_format) if the file is invalid - the table is
+    left unchanged
+    """
+    try:
+        sheet = xlsx_reader.PARightsSheet(file)
+    except (KeyError, ValueError, zipfile.BadZipFile):
+        m_logger.error("Chunked ingest failed - Incorrect sheet name in excel file (PA-Rights did not exist).")
+        return "The 'PA-Rights' sheet does not exist."
+    with sheet:
+        if sheet.platform is None:
+            m_logger.error("Chunked ingest failed - No Platform listed.")
+            return "No Platform listed in cell A1."
+        chunks = (pd.DataFrame(batch, columns=sheet.header, dtype=object) for batch in sheet.batches(chunk_rows))
+        return write_chunks(file_name, sheet.platform, sheet.header, chunks, table_name, connection, skip_row_hash,
+                            None if progress_callback is None else
+                            lambda rows: progress_callback(rows, sheet.bytes_read, sheet.size))
+
+
+def ingest_file(file_name, file, file_type, table_name, connection, chunk_rows=CHUNK_ROWS, progress_callback=None,
+                skip_row_hash=None):
+    """
+    Replace a table with the contents of a file, read and written chunk by chunk in one transaction.
+    :param file_name: the file name being uploaded (File_Name column)
+    :param file: local file path
+    :param file_type: "xlsx", "csv" or "tsv" (see Scraping.detect_file_type)
+    :param table_name: table to replace
+    :param connection: database connection object
+    :param chunk_rows: rows per chunk
+    :param progress_callback: function(rows, bytes_read, bytes_total) called after every chunk
+    :param skip_row_hash: row hash of the stored version - if the file has the same rows, nothing is written
+    :return: IngestResult, or error string (as from Scraping.check_file_format) if the file is invalid
+    """
+    if file_type == "xlsx":
+        return ingest_xlsx(file_name, file, table_name, connection, chunk_rows, progress_callback, skip_row_hash)
+    return ingest_delimited(file_name, file, "\t" if file_type == "tsv" else ",", table_name, connection, chunk_rows,
+                            progress_callback, skip_row_hash)
+
+
+def write_chunks(file_name, platform, header, chunks, table_name, connection, skip_row_hash=None, chunk_done=None):
+    """
+    Replace a table with chunks of rows, validated and written one after another in one transaction.
+    :param file_name: the file name being uploaded (File_Name column)
+    :param platform: platform of the file (Platform column)
+    :param header: names of the file's columns
+    :param chunks: iterable of dataframes with the header columns
+    :param table_name: table to replace
+    :param connection: database connection object
+    :param skip_row_hash: row hash of the stored version - if the file has the same rows, nothing is written
+    :param chunk_done: function(rows) called after every chunk with the number of rows read so far
+    :return: IngestResult, or error string if the file is invalid - the table is left unchanged
+    """
+    columns = header + ["Platform", "File_Name"]
+    validator = validation.Validator()
+    if not validator.update(pd.DataFrame(columns=columns)):
+        return validator.result()
+
+    hasher = table_sync.RowHasher()
+    column_list = ", ".join(f"[{column}]" for column in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    if connection.in_transaction:
+        connection.commit()
+    cursor = connection.cursor()
+    cursor.execute("BEGIN;")
+    dictionary = StringDictionary(connection)
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS [{table_name}];")
+        schema.create_table(cursor, table_name, columns)
+        for chunk in chunks:
+            chunk["Platform"] = platform
+            chunk["File_Name"] = file_name
+            # Once the file is invalid, the rest is only read to complete the validation report
+            if not validator.update(chunk):
+                continue
+            hasher.update(chunk)
+            prepared = dictionary.encode(table_sync.prepare_dataframe(chunk))
+            cursor.executemany(f"INSERT INTO [{table_name}] ({column_list}) VALUES ({placeholders})",
+                               prepared.itertuples(index=False, name=None))
+            if chunk_done is not None:
+                chunk_done(validator.rows)
+
+        if not validator.report.is_valid():
+            connection.rollback()
+            return validator.result()
+        row_hash = hasher.hexdigest()
+        if skip_row_hash is not None and row_hash == skip_row_hash:
+            # Same rows as the stored table - keep it as it is
+            connection.rollback()
+            return IngestResult(columns, validator.rows, row_hash, False)
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    validator.result()
+    m_logger.info(f"Ingested {validator.rows} rows into {table_name} in chunks")
+    return IngestResult(columns, validator.rows, row_hash, True)
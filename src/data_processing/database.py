@@ -1,29 +1,48 @@
 """
 DATABASE STRUCTURE:
 
-Table 1: CRKN_file_names: (file_name, file_date)
+Table 1: CRKN_file_names: (file_name, file_date, content_hash, row_hash)
         - Contains a list of all the tables that contain CRKN file data
         - file_name = first part of file link name on CRKN website
         - file_date = date and version number of file link name on CRKN website
+        - content_hash = SHA-256 of the file's bytes
+        - row_hash = hash of the file's rows, ignoring row order and file name (see table_sync.row_hash)
 
-Table 2: local_file_names: (file_name, file_date)
+Table 2: local_file_names: (file_name, file_date, content_hash, row_hash)
         - Contains a list of all the tables that contain local file data
         - NOTE: Does not include "local_" that is at the beginning of the actual tables
         - file_name = entire file name that is uploaded (without the extension)
         - file_date = the actual date that the file was uploaded to the database
+        - content_hash, row_hash = as for CRKN_file_names
+
+Table 3: string_dictionary: (id, value)
+        - Every distinct string of the encoded columns, stored once (see string_dictionary)
+        - Strings no table uses any more are pruned when a file is removed (see string_dictionary.prune)
 
 Other Tables:
         - All other tables are tables listed in the two tables above
         - For CRKN_file_names - direct references (file_name)
         - For local_file_names - "local_" + file_name
+        - Created with the typed schema (see schema) - institution columns hold 1/0 for Y/N, and Publisher,
+          agreement_code, collection_name, Platform and File_Name hold ids of string_dictionary strings
 """
 
+import hashlib
 import sqlite3
+import threading
+from src.data_processing import schema, string_dictionary
 from src.utility.logger import m_logger
 from src.utility.settings_manager import Settings
 
 settings_manager = Settings()
 
+# Seconds a connection waits for another connection's write to finish before failing with "database is locked"
+BUSY_TIMEOUT = 60
+
+# Held by the background writers while they write (the CRKN sync for each file it loads and for its commit, uploads
+# while they load their files), so they write one after another instead of failing on each other's locks
+write_lock = threading.Lock()
+
 
 def connect_to_database():
     """
@@ -32,7 +51,10 @@ def connect_to_database():
     """
     m_logger.info(f"Opening connection to the database.")
     database_name = settings_manager.get_setting('database_name')
-    return sqlite3.connect(database_name)
+    connection = sqlite3.connect(database_name, timeout=BUSY_TIMEOUT)
+    # Write-ahead log - searches can keep reading while a background sync writes
+    connection.execute("PRAGMA journal_mode=WAL;")
+    return connection
 
 
 def close_database(connection):
@@ -80,6 +102,45 @@ def get_tables(connection):
     return get_CRKN_tables(connection) + get_local_tables(connection)
 
 
+def get_catalog_fingerprint(connection):
+    """
+    Get a fingerprint of the CRKN file catalog (CRKN_file_names), which changes whenever a CRKN file is added,
+    updated, or removed. Used to tell if a CRKN listing has already been synced into this database.
+    :param connection: database connection object
+    :return: hex digest string
+    """
+    try:
+        rows = connection.execute("SELECT file_name, file_date FROM CRKN_file_names ORDER BY file_name;").fetchall()
+    except sqlite3.Error:
+        rows = []
+    return hashlib.sha256(repr(rows).encode()).hexdigest()
+
+
+def get_file_hashes(connection, method):
+    """
+    Get the content and row hashes of every file in a file catalog.
+    :param connection: database connection object
+    :param method: CRKN or local
+    :return: dictionary of file_name -> (content_hash, row_hash), either of which may be None
+    """
+    rows = connection.execute(f"SELECT file_name, content_hash, row_hash FROM {method}_file_names;").fetchall()
+    return {file_name: (content_hash, row_hash) for file_name, content_hash, row_hash in rows}
+
+
+def set_file_hashes(connection, method, file_name, content_hash, row_hash):
+    """
+    Store the content and row hashes of a file in its file catalog.
+    :param connection: database connection object
+    :param method: CRKN or local
+    :param file_name: file name (table name, without "local_" for local files)
+    :param content_hash: SHA-256 of the file's bytes
+    :param row_hash: table_sync.row_hash of the file's rows
+    """
+    connection.execute(f"UPDATE {method}_file_names SET content_hash = ?, row_hash = ? WHERE file_name = ?;",
+                       (content_hash, row_hash, file_name))
+    connection.commit()
+
+
 def create_file_name_tables(connection):
     """
     Create default database tables - CRKN_file_names and local_file_names
@@ -98,7 +159,8 @@ def create_file_name_tables(connection):
         # If table doesn't exist, create new table for CRKN file info
         if not list_of_tables:
             m_logger.info("CRKN_file_names table does not exist, creating new one")
-            cursor.execute("CREATE TABLE CRKN_file_names(file_name VARCHAR(255), file_date VARCHAR(255));")
+            cursor.execute("CREATE TABLE CRKN_file_names(file_name VARCHAR(255), file_date VARCHAR(255), "
+                           "content_hash VARCHAR(64), row_hash VARCHAR(64));")
 
         # Empty list for next check
         list_of_tables.clear()
@@ -109,7 +171,17 @@ def create_file_name_tables(connection):
         # If table does not exist, create new table for local file info
         if not list_of_tables:
             m_logger.info("local_file_names table does not exist, creating new one")
-            cursor.execute("CREATE TABLE local_file_names(file_name VARCHAR(255), file_date VARCHAR(255));")
+            cursor.execute("CREATE TABLE local_file_names(file_name VARCHAR(255), file_date VARCHAR(255), "
+                           "content_hash VARCHAR(64), row_hash VARCHAR(64));")
+
+        # Tables created before the hash columns existed
+        for method in ["CRKN", "local"]:
+            columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({method}_file_names);").fetchall()]
+            for column in ["content_hash", "row_hash"]:
+                if column not in columns:
+                    m_logger.info(f"Adding {column} column to {method}_file_names")
+                    cursor.execute(f"ALTER TABLE {method}_file_names ADD COLUMN {column} VARCHAR(64);")
+        string_dictionary.create_table(connection)
         # Commit changes
         connection.commit()
     except sqlite3.Error as e:
@@ -118,6 +190,26 @@ def create_file_name_tables(connection):
         connection.rollback()
 
 
+# Rows fetched at a time by iter_search
+SEARCH_BATCH_ROWS = 10_000
+
+
+def get_search_query(institution):
+    """
+    Get the base query of a search - the columns shown in the search results, with the access flag and the encoded
+    strings decoded (see schema and string_dictionary).
+    :param institution: institution whose access is shown
+    :return: SQL query without any search terms, for search_database - table_name is replaced by each table
+    """
+    # Access flags are stored as 1/0 (Y/N in tables loaded before the typed schema)
+    return (f"SELECT CASE [{institution}] WHEN 1 THEN 'Y' WHEN 0 THEN 'N' ELSE [{institution}] END, "
+            f"{string_dictionary.decode_expression('File_Name')}, {string_dictionary.decode_expression('Platform')}, "
+            f"Title, {string_dictionary.decode_expression('Publisher')}, Platform_YOP, Platform_eISBN, OCN, "
+            f"{string_dictionary.decode_expression('agreement_code')}, "
+            f"{string_dictionary.decode_expression('collection_name')}, title_metadata_last_modified "
+            f"FROM table_name WHERE ")
+
+
 def search_database(connection, query, terms, searchTypes):
     """
     Database searching functionality.
@@ -128,38 +220,69 @@ def search_database(connection, query, terms, searchTypes):
     :return: list of all matching results throughout all tables
     """
     results = []
+    for _, _, rows in iter_search(connection, query, terms, searchTypes):
+        results.extend(rows)
+    return results
+
+
+def iter_search(connection, query, terms, searchTypes, batch_rows=SEARCH_BATCH_ROWS):
+    """
+    Run a search, yielding the results in batches as they are read from the cursor, so they never have to be held in
+    memory all at once (see export).
+    :param connection: database connection object
+    :param query: SQL query - base query without any actual search terms
+    :param terms: list of terms being searched
+    :param searchTypes: list of searchTypes for each corresponding term
+    :param batch_rows: rows per batch
+    :return: generator of (number of tables searched, number of tables, list of rows)
+    """
+    from src.data_processing.institution_registry import InstitutionRegistry
     cursor = connection.cursor()
 
     list_of_tables = get_tables(connection)
+    institution = settings_manager.get_setting("institution")
+    # Table -> column of the institution, in the tables that have one
+    institution_tables = InstitutionRegistry.get_instance().tables(connection, institution)
 
     # Constructs the final query with all terms
+    parameters = []
     for i in range(len(terms)):
         # initial query won't use OR
         if i > 0:
             query += " OR "
         if '*' in terms[i]:
-            terms[i] = terms[i].replace("*", "%")
             query += f"{searchTypes[i]} LIKE ?"
+            parameters.append(terms[i].replace("*", "%"))
         else:
             if searchTypes[i] == "Title":
                 query += f"LOWER({searchTypes[i]}) = LOWER(?)"
+                parameters.append(terms[i])
+            elif searchTypes[i] == "Platform_eISBN":
+                # ISBNs are stored in canonical form - tables loaded before the typed schema keep them as written
+                query += f"{searchTypes[i]} IN (?, ?)"
+                parameters += [terms[i], schema.canonical_isbns([terms[i]])[0]]
             else:
                 query += f"{searchTypes[i]} = ?"
+                parameters.append(terms[i])
 
-    # Searches for matching items through each table one by one and adds any matches to the list
-    for table in list_of_tables:
-        # Get institutions from each table
-        institutions = cursor.execute(f'select * from [{table}]')
-        institutions = [description[0] for description in institutions.description[8:-2]]
-
+    # Searches for matching items through each table one by one
+    for table_number, table in enumerate(list_of_tables, start=1):
         # Only search table if it has the institution
-        if settings_manager.get_setting("institution") in institutions:
+        if table in institution_tables:
             formatted_query = query.replace("table_name", f"[{table}]")
+            # The file may spell the institution differently (see normalize_name)
+            if institution_tables[table] != institution:
+                formatted_query = formatted_query.replace(f"[{institution}]", f"[{institution_tables[table]}]")
             # executes the final fully-formatted query
-            cursor.execute(formatted_query, terms)
+            cursor.execute(formatted_query, parameters)
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                yield table_number, len(list_of_tables), rows
+        yield table_number, len(list_of_tables), []
+
 
-            results.extend(cursor.fetchall())
-    return results
 def get_table_data(connection, table_name):
     """
     Retrieve information from a specific table in the database.
@@ -0,0 +1,330 @@
+"""
+Persistent, content-addressed cache for files downloaded from the CRKN website.
+
+Every downloaded file is stored once under the SHA-256 of its contents, and an index (index.json) maps each URL to
+the stored file along with the ETag and Last-Modified headers the server sent for it. Later requests for the same URL
+are revalidated with If-None-Match/If-Modified-Since, so a 304 response costs no transfer at all.
+
+Callers can also record that the data behind a URL has been fully processed (mark_processed), which lets them skip
+re-parsing when the server reports the file as unchanged.
+
+When a URL gets new contents, the file of its old contents is deleted unless another URL still uses it, so the cache
+holds one copy of the latest version of each file (prune removes files left over from earlier versions of the cache).
+CRKN publishes every version of a file under a new URL, so after a sync the entries of the URLs that are no longer
+listed are dropped as well (retain).
+
+Downloads are streamed in fixed-size chunks into a uniquely named temporary file (download_temp_dir setting), with the
+size and hash checked while streaming, so memory use stays flat no matter how large the file is.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import requests
+from src.utility.logger import m_logger
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+
+# Size of each chunk read from the network and written to disk
+CHUNK_SIZE = 64 * 1024
+
+# Name of a stored file - SHA-256 of its contents, and the extension of its URL
+STORED_FILE = re.compile(r"[0-9a-f]{64}(\.[^.]*)?")
+
+
+class DownloadIntegrityError(Exception):
+    """Raised when a downloaded file does not match its expected size or hash."""
+
+
+def get_cache_directory():
+    """
+    Get the directory the download cache lives in.
+    :return: download_cache_dir setting, or a download_cache folder next to the settings file
+    """
+    cache_dir = settings_manager.get_setting("download_cache_dir")
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.dirname(settings_manager.settings_file), "download_cache")
+    return cache_dir
+
+
+def get_temp_directory(cache_dir):
+    """
+    Get the directory partially downloaded files are written to.
+    :param cache_dir: directory of the download cache, used for the default
+    :return: download_temp_dir setting, or a tmp folder inside the cache directory
+    """
+    temp_dir = settings_manager.get_setting("download_temp_dir")
+    if not temp_dir:
+        temp_dir = os.path.join(cache_dir, "tmp")
+    return temp_dir
+
+
+def hash_file(path):
+    """
+    Get the SHA-256 of a file, reading it in chunks.
+    :param path: file path
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stream_to_file(response, directory, progress_callback=None, expected_hash=None):
+    """
+    Stream a response body in chunks to a uniquely named temporary file, checking its integrity on the way.
+    :param response: requests response opened with stream=True
+    :param directory: directory to create the temporary file in
+    :param progress_callback: optional function(bytes_done, bytes_total) - bytes_total is None if unknown
+    :param expected_hash: optional SHA-256 hex digest the contents must match
+    :return: (path of the temporary file, SHA-256 hex digest, size in bytes)
+    """
+    os.makedirs(directory, exist_ok=True)
+    # Content-Length is only the body size when the body is not compressed in transit
+    content_length = response.headers.get("Content-Length")
+    encoded = response.headers.get("Content-Encoding", "identity") != "identity"
+    total = int(content_length) if content_length and content_length.isdigit() and not encoded else None
+    sha256 = hashlib.sha256()
+    size = 0
+
+    file_descriptor, temp_path = tempfile.mkstemp(suffix=".part", dir=directory)
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if not chunk:
+                    continue
+                file.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+                if progress_callback is not None:
+                    progress_callback(size, total)
+
+        # Connection dropped early, or the body does not match what was expected
+        if total is not None and size != total:
+            raise DownloadIntegrityError(f"Expected {total} bytes but received {size} - {response.url}")
+        content_hash = sha256.hexdigest()
+        if expected_hash is not None and content_hash != expected_hash:
+            raise DownloadIntegrityError(f"Hash mismatch for {response.url}")
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    finally:
+        response.close()
+    return temp_path, content_hash, size
+
+
+class CacheResult:
+    """
+    Outcome of a DownloadCache.fetch call.
+    path - local file holding the contents of the URL
+    content_hash - SHA-256 hex digest of the contents
+    not_modified - True if the server answered 304 and nothing was transferred
+    processed - fingerprint passed to mark_processed for these exact contents, or None
+    """
+
+    def __init__(self, url, path, content_hash, not_modified, processed, encoding=None):
+        self.url = url
+        self.path = path
+        self.content_hash = content_hash
+        self.not_modified = not_modified
+        self.processed = processed
+        self.encoding = encoding
+
+    def is_processed(self, fingerprint=True):
+        """
+        Check if these contents were already processed against the given fingerprint.
+        :param fingerprint: value describing the state the contents were processed into (e.g. the file catalog)
+        :return: True if the same contents were already processed into the same state
+        """
+        return self.processed is not None and self.processed == fingerprint
+
+    def read_text(self):
+        """
+        Read the cached contents as text, using the encoding reported by the server.
+        :return: string contents of the file
+        """
+        with open(self.path, "r", encoding=self.encoding or "utf-8", errors="replace") as file:
+            return file.read()
+
+
+class DownloadCache:
+    def __init__(self, cache_dir=None, temp_dir=None):
+        if cache_dir is None:
+            cache_dir = get_cache_directory()
+        self.cache_dir = cache_dir
+        self.temp_dir = temp_dir if temp_dir is not None else get_temp_directory(cache_dir)
+        self.index_path = os.path.join(cache_dir, "index.json")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self.load_index()
+        self.prune()
+
+    def load_index(self):
+        """
+        Load the URL index from disk.
+        :return: dictionary of url -> cache entry (empty if there is no readable index)
+        """
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save_index(self):
+        """Write the URL index to disk, replacing the old one atomically."""
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.index, file, indent=4)
+        os.replace(temp_path, self.index_path)
+
+    def is_referenced(self, file):
+        """
+        :param file: name of a stored file
+        :return: True if an index entry uses the file
+        """
+        return any(entry.get("file") == file for entry in self.index.values())
+
+    def remove_file(self, file):
+        """
+        Delete a stored file if no index entry uses it.
+        :param file: name of the stored file
+        """
+        if self.is_referenced(file):
+            return
+        try:
+            os.remove(os.path.join(self.cache_dir, file))
+            m_logger.info(f"Removed superseded cached file {file}")
+        except FileNotFoundError:
+            pass
+
+    def prune(self):
+        """
+        Delete the stored files no index entry uses.
+        :return: number of files deleted
+        """
+        referenced = {entry.get("file") for entry in self.index.values()}
+        removed = 0
+        for entry in os.scandir(self.cache_dir):
+            # Only stored files - never the index, the temp directory or anything else in the folder
+            if entry.is_file() and STORED_FILE.fullmatch(entry.name) and entry.name not in referenced:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError as e:
+                    m_logger.error(f"Could not remove cached file {entry.name}: {e}")
+        return removed
+
+    def retain(self, urls):
+        """
+        Drop the index entries of every other URL, and delete the files only they used.
+        :param urls: URLs to keep, e.g. the listing page and the files it lists
+        :return: number of files deleted
+        """
+        urls = set(urls)
+        dropped = [url for url in self.index if url not in urls]
+        if not dropped:
+            return 0
+        for url in dropped:
+            del self.index[url]
+        self.save_index()
+        m_logger.info(f"Dropped {len(dropped)} cached URLs that are no longer listed")
+        return self.prune()
+
+    def get_entry(self, url):
+        """
+        Get the cache entry for a URL if its file is still on disk.
+        :param url: the URL
+        :return: entry dictionary, or None
+        """
+        entry = self.index.get(url)
+        if entry is None or not os.path.exists(os.path.join(self.cache_dir, entry["file"])):
+            return None
+        return entry
+
+    def fetch(self, url, session=None, progress_callback=None, expected_hash=None, **kwargs):
+        """
+        Get the contents of a URL, revalidating any cached copy with a conditional request.
+        :param url: the URL to download
+        :param session: object with a requests-style get method (requests.Session), defaults to the requests module
+        :param progress_callback: optional function(bytes_done, bytes_total) called as chunks arrive
+        :param expected_hash: optional SHA-256 hex digest the downloaded contents must match
+        :param kwargs: extra keyword arguments passed to get (e.g. timeout)
+        :return: CacheResult
+        """
+        if session is None:
+            session = requests
+        entry = self.get_entry(url)
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = session.get(url, headers=headers, stream=True, **kwargs)
+
+        # Cached copy is still current, nothing was transferred
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            m_logger.info(f"Not modified, using cached copy - {url}")
+            return self.result_for(url, entry, not_modified=True)
+
+        if response.status_code >= 400:
+            response.close()
+        response.raise_for_status()
+        temp_path, content_hash, size = stream_to_file(response, self.temp_dir, progress_callback, expected_hash)
+        file = content_hash + os.path.splitext(url.split("?")[0])[1]
+        path = os.path.join(self.cache_dir, file)
+
+        # Same bytes may already be stored under another URL
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            # shutil.move falls back to a copy if the temp directory is on another drive
+            shutil.move(temp_path, path)
+
+        # Identical contents keep their processed fingerprint so they are not parsed again
+        processed = entry.get("processed") if entry is not None and entry["hash"] == content_hash else None
+        old_file = self.index.get(url, {}).get("file")
+        entry = {
+            "hash": content_hash,
+            "file": file,
+            "size": size,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "encoding": response.encoding,
+            "processed": processed
+        }
+        self.index[url] = entry
+        self.save_index()
+        # The old contents are superseded
+        if old_file is not None and old_file != file:
+            self.remove_file(old_file)
+        m_logger.info(f"Downloaded {size} bytes - {url}")
+        return self.result_for(url, entry, not_modified=False)
+
+    def result_for(self, url, entry, not_modified):
+        """
+        Build a CacheResult from a cache entry.
+        :param url: the URL
+        :param entry: cache entry dictionary
+        :param not_modified: True if the server answered 304
+        :return: CacheResult
+        """
+        return CacheResult(url, os.path.join(self.cache_dir, entry["file"]), entry["hash"], not_modified,
+                           entry.get("processed"), entry.get("encoding"))
+
+    def mark_processed(self, url, fingerprint=True):
+        """
+        Record that the cached contents of a URL have been fully processed.
+        :param url: the URL
+        :param fingerprint: JSON-serializable value describing the resulting state (e.g. the file catalog)
+        """
+        if url in self.index:
+            self.index[url]["processed"] = fingerprint
+            self.save_index()
@@ -0,0 +1,148 @@
+"""
+Holdings report - every title the selected institution has perpetual access to, across all CRKN and local files.
+
+The report is a single SQL statement: the rows where the institution's column is Y are read from every table that has
+the column (UNION ALL), deduplicated by identifier - the canonical eISBN, else the OCN, else the title - keeping the
+most recently modified row of each title, and streamed from the cursor in batches (see export.export_rows). SQLite
+sorts on disk as needed, so memory stays flat however many titles there are.
+SQLite joins at most MAX_COMPOUND_SELECT SELECTs with UNION ALL, so with more tables than that the rows are first
+collected into a temporary table, MAX_COMPOUND_SELECT tables at a time, and deduplicated from there.
+"""
+import time
+from src.data_processing import string_dictionary
+from src.data_processing.institution_registry import InstitutionRegistry
+from src.utility.logger import m_logger
+
+HEADERS = ["File_Name", "Platform", "Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code",
+           "collection_name", "title_metadata_last_modified", "Sources"]
+
+# Rows fetched at a time
+BATCH_ROWS = 10_000
+
+# Most SELECTs SQLite allows in one compound SELECT (SQLITE_MAX_COMPOUND_SELECT)
+MAX_COMPOUND_SELECT = 500
+
+# Rows of the institution collected from every table, when there are too many tables for one query
+ROWS_TABLE = "temp.holdings_rows"
+
+# Identifier rows are deduplicated by - eISBNs of tables loaded before the typed schema can still have hyphens
+IDENTIFIER = ("COALESCE(NULLIF(UPPER(REPLACE(REPLACE(CAST(Platform_eISBN AS TEXT), '-', ''), ' ', '')), ''), "
+              "'OCN:' || CAST(OCN AS TEXT), 'Title:' || LOWER(TRIM(Title)))")
+
+
+def get_institution_tables(connection, institution):
+    """
+    Get the tables that have a column for an institution.
+    :param connection: database connection object
+    :param institution: institution name
+    :return: dictionary of table name -> name of the institution's column in that table
+    """
+    return InstitutionRegistry.get_instance().tables(connection, institution)
+
+
+def select_holdings(tables):
+    """
+    Build the query of the rows the institution has access to.
+    :param tables: dictionary of table name -> column of the institution (at most MAX_COMPOUND_SELECT tables)
+    :return: SQL query - one SELECT per table, joined with UNION ALL
+    """
+    decoded = {column: string_dictionary.decode_expression(column) for column in string_dictionary.ENCODED_COLUMNS}
+    # Access flags are 1 in typed tables, Y in tables loaded before the typed schema
+    return " UNION ALL ".join(
+        f"SELECT {decoded['File_Name']} AS File_Name, {decoded['Platform']} AS Platform, Title, "
+        f"{decoded['Publisher']} AS Publisher, Platform_YOP, Platform_eISBN, OCN, "
+        f"{decoded['agreement_code']} AS agreement_code, {decoded['collection_name']} AS collection_name, "
+        f"title_metadata_last_modified FROM [{table}] WHERE [{column}] IN (1, 'Y')"
+        for table, column in tables.items())
+
+
+def build_query(holdings):
+    """
+    Build the report query.
+    :param holdings: SQL query of the rows to report (see select_holdings)
+    :return: SQL query - one row per title, with the number of rows (files) it was found in, sorted by title
+    """
+    return (f"SELECT File_Name, Platform, Title, Publisher, Platform_YOP, Platform_eISBN, OCN, agreement_code, "
+            f"collection_name, title_metadata_last_modified, Sources FROM ("
+            f"SELECT *, ROW_NUMBER() OVER (PARTITION BY identifier ORDER BY title_metadata_last_modified DESC) AS rank, "
+            f"COUNT(*) OVER (PARTITION BY identifier) AS Sources "
+            f"FROM (SELECT *, {IDENTIFIER} AS identifier FROM ({holdings}))) "
+            f"WHERE rank = 1 ORDER BY LOWER(Title), identifier;")
+
+
+def collect_rows(connection, tables):
+    """
+    Copy the rows the institution has access to into ROWS_TABLE, MAX_COMPOUND_SELECT tables at a time.
+    :param connection: database connection object
+    :param tables: dictionary of table name -> column of the institution
+    :return: SQL query of the collected rows
+    """
+    items = list(tables.items())
+    connection.execute(f"DROP TABLE IF EXISTS {ROWS_TABLE};")
+    for start in range(0, len(items), MAX_COMPOUND_SELECT):
+        holdings = select_holdings(dict(items[start:start + MAX_COMPOUND_SELECT]))
+        if start == 0:
+            connection.execute(f"CREATE TABLE {ROWS_TABLE} AS {holdings};")
+        else:
+            connection.execute(f"INSERT INTO {ROWS_TABLE} {holdings};")
+    connection.commit()
+    return f"SELECT * FROM {ROWS_TABLE}"
+
+
+class HoldingsReport:
+    """
+    Report of one institution - iterate over batches() to read it, then summary() for the counts and timing.
+    """
+
+    def __init__(self, connection, institution, batch_rows=BATCH_ROWS):
+        self.connection = connection
+        self.institution = institution
+        self.batch_rows = batch_rows
+        self.tables = {}
+        self.titles = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+    def batches(self):
+        """
+        Run the report query.
+        :return: generator of (progress percentage, list of rows) - progress is only known at the end (100)
+        """
+        start = time.monotonic()
+        self.tables = get_institution_tables(self.connection, self.institution)
+        if not self.tables:
+            self.seconds = time.monotonic() - start
+            return
+        collected = len(self.tables) > MAX_COMPOUND_SELECT
+        holdings = collect_rows(self.connection, self.tables) if collected else select_holdings(self.tables)
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(build_query(holdings))
+            while True:
+                rows = cursor.fetchmany(self.batch_rows)
+                if not rows:
+                    break
+                self.titles += len(rows)
+                # Sources is the last column
+                self.rows += sum(row[-1] for row in rows)
+                yield 0, rows
+        finally:
+            cursor.close()
+            if collected:
+                self.connection.execute(f"DROP TABLE IF EXISTS {ROWS_TABLE};")
+        self.seconds = time.monotonic() - start
+        m_logger.info(f"Holdings report of {self.institution}: {self.titles} titles from {self.rows} rows in "
+                      f"{len(self.tables)} tables, {self.seconds:.1f}s")
+        yield 100, []
+
+    def summary(self, english=True):
+        """
+        :param english: language of the summary
+        :return: counts and timing of the report
+        """
+        duplicates = self.rows - self.titles
+        if english:
+            return (f"{self.titles} titles from {len(self.tables)} files ({duplicates} duplicate rows removed) "
+                    f"in {self.seconds:.1f} seconds.")
+        return (f"{self.titles} titres de {len(self.tables)} fichiers ({duplicates} lignes en double supprimées) "
+                f"en {self.seconds:.1f} secondes.")
@@ -0,0 +1,127 @@
+"""
+Shared HTTP session and retry policy used for all requests to the CRKN website.
+
+One requests.Session is shared by the listing request and every file download, so connections to CRKN_root_url are
+pooled and kept alive instead of paying a new TCP/TLS handshake per request. Transient failures are retried by a
+RetryPolicy using exponential backoff with jitter, so a flaky network does not cost a whole sync.
+"""
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from src.data_processing.download_cache import DownloadIntegrityError
+from src.utility.logger import m_logger
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class RetryPolicy:
+    """
+    Decides which failures are worth retrying and how long to wait between attempts.
+    max_attempts - total number of attempts, including the first one
+    backoff_factor - delay before the first retry in seconds, doubled for every retry after that
+    max_backoff - upper limit on the delay between attempts in seconds
+    retry_statuses - HTTP status codes that are treated as transient
+    timeout - per-request (connect, read) timeout in seconds
+    """
+
+    def __init__(self, max_attempts=3, backoff_factor=1.0, max_backoff=30.0,
+                 retry_statuses=(408, 429, 500, 502, 503, 504), timeout=(10, 60)):
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_statuses = set(retry_statuses)
+        self.timeout = timeout
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Create a retry policy from the retry_attempts, retry_backoff and request_timeout settings, where set.
+        :return: RetryPolicy
+        """
+        policy = cls()
+        if settings_manager.get_setting("retry_attempts") is not None:
+            policy.max_attempts = int(settings_manager.get_setting("retry_attempts"))
+        if settings_manager.get_setting("retry_backoff") is not None:
+            policy.backoff_factor = float(settings_manager.get_setting("retry_backoff"))
+        if settings_manager.get_setting("request_timeout") is not None:
+            timeout = float(settings_manager.get_setting("request_timeout"))
+            policy.timeout = (min(timeout, 10), timeout)
+        return policy
+
+    def is_retryable(self, error):
+        """
+        Check if a failed attempt should be retried.
+        :param error: exception raised by the attempt
+        :return: True if the error is transient
+        """
+        if isinstance(error, requests.exceptions.HTTPError):
+            return error.response is not None and error.response.status_code in self.retry_statuses
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                  requests.exceptions.ChunkedEncodingError, DownloadIntegrityError))
+
+    def get_delay(self, attempt, error=None):
+        """
+        Get the time to wait before the next attempt - exponential backoff with full jitter, or the server's
+        Retry-After header if it sent one.
+        :param attempt: number of attempts made so far (1 after the first failure)
+        :param error: exception raised by the last attempt
+        :return: delay in seconds
+        """
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** (attempt - 1))))
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call a function that makes a request, retrying it on transient errors.
+        The policy's timeout is passed to the function unless a timeout keyword is given.
+        :param function: function to call (e.g. session.get or DownloadCache.fetch)
+        :param args: positional arguments for the function
+        :param kwargs: keyword arguments for the function
+        :return: return value of the function
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_attempts or not self.is_retryable(e):
+                    raise
+                delay = self.get_delay(attempt, e)
+                m_logger.warning(f"Attempt {attempt} of {self.max_attempts} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+
+def create_session(pool_size=4):
+    """
+    Create a requests session with a keep-alive connection pool.
+    :param pool_size: number of connections kept open per host
+    :return: requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Get the session shared by all CRKN requests, creating it on first use.
+    :return: requests.Session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
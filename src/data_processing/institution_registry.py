@@ -0,0 +1,145 @@
+"""
+Institution registry - the known institution names (the CRKN_institutions and local_institutions settings) and the
+tables that have a column for each institution, shared by upload, scraping, the settings page, search and the
+holdings report.
+
+Names are matched on their normalized form (normalize_name), so "Dalhousie  University" and "dalhousie university"
+are the same institution. Lookups are set/dict lookups on caches that are only rebuilt when they are out of date:
+    names - when one of the two settings lists is replaced or changes length (they are only appended to or removed
+            from, see Settings)
+    tables - when the list of file tables (see database.get_tables) or the schema of the database (PRAGMA
+             schema_version) changes, e.g. a file table is added or replaced
+Caches are replaced, never changed in place, so they can be read from the worker threads.
+Use InstitutionRegistry.get_instance().
+"""
+from src.data_processing import database, table_sync
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+
+
+def normalize_name(name):
+    """
+    :param name: institution name
+    :return: name compared by the registry - case folded, with runs of spaces collapsed and outer spaces removed
+    """
+    return " ".join(str(name).split()).casefold()
+
+
+class InstitutionRegistry:
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        # Settings lists the names were built from, normalized name -> registered name, names in display order
+        self.sources = None
+        self.registered = {}
+        self.ordered = []
+        # (database file, schema version, file tables) the tables were built from, normalized name -> {table: column}
+        self.tables_key = None
+        self.institution_tables = {}
+
+    def load_names(self):
+        lists = (settings_manager.get_setting("local_institutions") or [],
+                 settings_manager.get_setting("CRKN_institutions") or [])
+        sources = tuple((names, len(names)) for names in lists)
+        if self.sources is not None and all(names is old and length == old_length for (names, length), (old, old_length)
+                                            in zip(sources, self.sources)):
+            return
+        registered = {}
+        for name in lists[0] + lists[1]:
+            registered.setdefault(normalize_name(name), name)
+        self.registered = registered
+        self.ordered = list(registered.values())
+        self.sources = sources
+
+    def __contains__(self, name):
+        self.load_names()
+        return normalize_name(name) in self.registered
+
+    def names(self):
+        """
+        :return: list of the registered names - local institutions first, then CRKN, without duplicates
+        """
+        self.load_names()
+        return list(self.ordered)
+
+    def registered_name(self, name):
+        """
+        :param name: institution name, in any spelling
+        :return: the name as it is registered, None if it is not
+        """
+        self.load_names()
+        return self.registered.get(normalize_name(name))
+
+    def new_institutions(self, names):
+        """
+        Get the names that are not registered.
+        :param names: institution names, e.g. the institution columns of a file
+        :return: list of the new names, in order, without duplicates
+        """
+        self.load_names()
+        new, seen = [], set()
+        for name in names:
+            key = normalize_name(name)
+            if key not in self.registered and key not in seen:
+                seen.add(key)
+                new.append(name)
+        return new
+
+    def add_local_institutions(self, names):
+        """
+        Add the names that are not registered yet to the local list - settings.json is written once.
+        :param names: institution names
+        :return: list of the names added
+        """
+        new = self.new_institutions(names)
+        with settings_manager.batch():
+            for name in new:
+                settings_manager.add_local_institution(name)
+        return new
+
+    def add_CRKN_institutions(self, names):
+        """
+        Add the names that are not on the CRKN list yet to it - names also on the local list are added, since the CRKN
+        files have them.
+        :param names: institution columns of the CRKN files
+        """
+        known = {normalize_name(name) for name in settings_manager.get_setting("CRKN_institutions") or []}
+        new = []
+        for name in names:
+            key = normalize_name(name)
+            if key not in known:
+                known.add(key)
+                new.append(name)
+        settings_manager.add_CRKN_institutions(new)
+
+    def load_tables(self, connection):
+        file_name = connection.execute("PRAGMA database_list;").fetchone()[2]
+        tables = database.get_tables(connection)
+        key = (file_name, connection.execute("PRAGMA schema_version;").fetchone()[0], tuple(tables))
+        # In-memory databases have no file name to tell them apart
+        if key == self.tables_key and file_name:
+            return
+        institution_tables = {}
+        for table in tables:
+            # Institution columns are between the 8 header columns and Platform, File_Name
+            for column in table_sync.get_table_columns(connection, table)[8:-2]:
+                institution_tables.setdefault(normalize_name(column), {})[table] = column
+        self.institution_tables = institution_tables
+        self.tables_key = key
+
+    def tables(self, connection, institution):
+        """
+        Get the tables that have a column for an institution.
+        :param connection: database connection object
+        :param institution: institution name, in any spelling
+        :return: dictionary of table name -> name of the institution's column in that table
+        """
+        self.load_tables(connection)
+        return dict(self.institution_tables.get(normalize_name(institution), {}))
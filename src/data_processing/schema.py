@@ -0,0 +1,189 @@
+"""
+Typed column schema of the file tables.
+
+df.to_sql used to infer column types from the pandas dtypes, so every column ended up TEXT (or REAL, with OCNs stored
+as "123.0"), and the dates were fixed afterwards with a full-table UPDATE ... strftime. Instead, every file table is
+created with an explicit schema, and values are converted vectorized before they are inserted:
+    Platform_YOP, OCN - INTEGER
+    Platform_eISBN - TEXT, canonical form (digits and X only, see canonical_isbns)
+    institution columns - INTEGER access flag, 1 for Y and 0 for N
+    title_metadata_last_modified - DATE, ISO YYYY-MM-DD
+    Publisher, agreement_code, collection_name, Platform, File_Name - INTEGER id of the string (see string_dictionary)
+    everything else - TEXT
+Values that do not convert (a YOP range, a "Y/N" that is neither, a cell with two ISBNs) are kept as they were
+written in the file - SQLite stores them as TEXT in that row, so no data is lost.
+"""
+import pandas as pd
+from src.data_processing.string_dictionary import ENCODED_COLUMNS
+from src.data_processing.validation import ADDED_COLUMNS
+from src.utility.logger import m_logger
+
+INTEGER_COLUMNS = ["Platform_YOP", "OCN"]
+ISBN_COLUMN = "Platform_eISBN"
+DATE_COLUMN = "title_metadata_last_modified"
+# Institution columns start after the 8 header columns (see validation.HEADER_ROW)
+FIRST_INSTITUTION_COLUMN = 8
+
+FLAG_VALUES = {"Y": 1, "N": 0}
+
+
+def column_types(columns):
+    """
+    Get the declared type of every column of a file table.
+    :param columns: column names, in table order
+    :return: list of SQLite types
+    """
+    types = []
+    for index, column in enumerate(columns):
+        if column in INTEGER_COLUMNS or column in ENCODED_COLUMNS or is_flag_column(index, column):
+            types.append("INTEGER")
+        elif column == DATE_COLUMN:
+            types.append("DATE")
+        else:
+            types.append("TEXT")
+    return types
+
+
+def is_flag_column(index, column):
+    """
+    :param index: position of the column in the table
+    :param column: column name
+    :return: True for institution (Y/N access flag) columns
+    """
+    return index >= FIRST_INSTITUTION_COLUMN and column not in ADDED_COLUMNS
+
+
+def type_affinity(declared_type):
+    """
+    Get the SQLite affinity of a declared column type (CREATE TABLE ... AS SELECT keeps affinities, not type names).
+    :param declared_type: declared type, e.g. "INTEGER" or "DATE"
+    :return: INTEGER, TEXT, BLOB, REAL or NUMERIC
+    """
+    declared_type = (declared_type or "").upper()
+    if "INT" in declared_type:
+        return "INTEGER"
+    if any(name in declared_type for name in ("CHAR", "CLOB", "TEXT")):
+        return "TEXT"
+    if declared_type == "" or "BLOB" in declared_type:
+        return "BLOB"
+    if any(name in declared_type for name in ("REAL", "FLOA", "DOUB")):
+        return "REAL"
+    return "NUMERIC"
+
+
+def create_table(cursor, table_name, columns):
+    """
+    Create a file table with the typed schema.
+    :param cursor: database cursor
+    :param table_name: table to create (must not exist)
+    :param columns: column names, in table order
+    """
+    definitions = ", ".join(f"[{column}] {column_type}" for column, column_type in zip(columns, column_types(columns)))
+    cursor.execute(f"CREATE TABLE [{table_name}] ({definitions});")
+
+
+def is_typed(connection, table_name):
+    """
+    Check if a table was created with the typed schema - tables written before it have TEXT/REAL columns, and are
+    replaced (not synced row by row) the next time their file changes.
+    :param connection: database connection object
+    :param table_name: table name
+    :return: True if every column has the affinity of its schema type, False if not or if the table does not exist
+    """
+    info = connection.execute(f"PRAGMA table_info([{table_name}]);").fetchall()
+    if not info:
+        return False
+    columns = [row[1] for row in info]
+    return all(type_affinity(row[2]) == type_affinity(column_type)
+               for row, column_type in zip(info, column_types(columns)))
+
+
+def convert_integers(values):
+    """
+    :param values: column as a series
+    :return: object series - Python ints for whole numbers ("2020", "123.0"), the original value otherwise
+    """
+    text = values.astype("string").str.strip()
+    whole = text.str.fullmatch(r"\d{1,18}(\.0*)?").fillna(False).to_numpy(dtype=bool)
+    converted = values.astype(object)
+    if whole.any():
+        converted[whole] = text[whole].str.replace(r"\.0*$", "", regex=True).astype("int64").to_numpy(dtype=object)
+    return converted
+
+
+def canonical_isbns(values):
+    """
+    :param values: column (or list) of ISBNs
+    :return: object series - ISBNs with hyphens and spaces removed and an upper case X ("978-0-306-40615-7" ->
+    "9780306406157"), values that are not a single ISBN-10/13 unchanged
+    """
+    values = pd.Series(values)
+    canonical = values.astype("string").str.replace(r"[^0-9Xx]", "", regex=True).str.upper()
+    single = canonical.str.len().isin([10, 13]).fillna(False).to_numpy(dtype=bool)
+    converted = values.astype(object)
+    converted[single] = canonical[single].to_numpy(dtype=object)
+    return converted
+
+
+def convert_flags(values):
+    """
+    :param values: institution column as a series
+    :return: object series - 1 for Y, 0 for N (any case or spacing), the original value otherwise
+    """
+    # Fast path - most values are exactly Y or N
+    flags = values.map(FLAG_VALUES)
+    other = flags.isna().to_numpy(dtype=bool)
+    if other.any():
+        flags[other] = values[other].astype("string").str.strip().str.upper().map(FLAG_VALUES)
+    known = flags.notna().to_numpy(dtype=bool)
+    converted = values.astype(object)
+    converted[known] = flags[known].astype("int64").to_numpy(dtype=object)
+    return converted
+
+
+def convert_dates(values):
+    """
+    :param values: date column as a series
+    :return: object series - YYYY-MM-DD, None where the date could not be read (logged)
+    """
+    # ISO dates of any precision are read vectorized, other formats are read value by value
+    dates = pd.to_datetime(values, format="ISO8601", errors="coerce")
+    other = (dates.isna() & values.notna()).to_numpy(dtype=bool)
+    if other.any():
+        dates[other] = pd.to_datetime(values[other], format="mixed", errors="coerce")
+        unread = values[dates.isna() & values.notna()]
+        unread = unread[unread.astype("string").str.strip() != ""]
+        if len(unread) > 0:
+            m_logger.warning(f"{len(unread)} dates in {values.name} could not be read and are stored empty, "
+                             f"e.g. {unread.iloc[0]!r}")
+    return dates.dt.strftime("%Y-%m-%d").astype(object).where(dates.notna(), None)
+
+
+def convert_dataframe(df):
+    """
+    Get a copy of a file dataframe with every column converted to its schema type, and missing values as None - the
+    values that are inserted into the table (after the encoded columns are encoded, see string_dictionary).
+    :param df: file dataframe (or chunk of one)
+    :return: converted dataframe of object columns
+    """
+    converted = df.astype(object).where(df.notna(), None)
+    for index, column in enumerate(df.columns):
+        present = df[column].notna().to_numpy(dtype=bool)
+        if not present.any():
+            continue
+        values = df[column][present]
+        if column == DATE_COLUMN:
+            converted[column] = convert_dates(df[column])
+            continue
+        if column in INTEGER_COLUMNS:
+            values = convert_integers(values)
+        elif column == ISBN_COLUMN:
+            values = canonical_isbns(values)
+        elif is_flag_column(index, column):
+            values = convert_flags(values)
+        else:
+            values = values.astype(str)
+        column_values = converted[column].to_numpy(dtype=object).copy()
+        column_values[present] = values.to_numpy(dtype=object)
+        converted[column] = column_values
+    return converted
@@ -0,0 +1,225 @@
+"""
+Shadow tables used to apply a CRKN sync atomically.
+
+Every changed file is loaded into a shadow copy of its table (shadow__<table>) while searches keep reading the live
+tables. Once every file of the sync has been loaded, validated and indexed, the shadow tables are swapped in with
+renames - together with the file catalog changes and the removed files - inside one short transaction. If the sync
+fails or is interrupted before that, the live tables were never touched - the shadow tables are dropped, or kept for
+the next sync to resume from (see sync_journal).
+"""
+import sqlite3
+import uuid
+from src.data_processing import schema, table_sync
+from src.data_processing.string_dictionary import StringDictionary
+from src.utility.logger import m_logger
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+
+SHADOW_PREFIX = "shadow__"
+
+# Columns indexed on every loaded table - column name -> indexed expression (title searches compare LOWER(Title))
+INDEXED_COLUMNS = {
+    "Title": "LOWER([Title])",
+    "Platform_eISBN": "[Platform_eISBN]",
+    "OCN": "[OCN]"
+}
+
+
+def drop_shadow_tables(connection, keep=()):
+    """
+    Drop shadow tables left behind by a sync that was interrupted.
+    :param connection: database connection object
+    :param keep: live table names whose shadow tables are kept (loaded files of a sync that can be resumed)
+    """
+    keep = {SHADOW_PREFIX + table_name for table_name in keep}
+    tables = connection.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ? ESCAPE '\\';",
+                                (SHADOW_PREFIX.replace("_", "\\_") + "%",)).fetchall()
+    for (table,) in tables:
+        if table in keep:
+            continue
+        m_logger.info(f"Dropping leftover shadow table {table}")
+        connection.execute(f"DROP TABLE IF EXISTS [{table}];")
+    connection.commit()
+
+
+class ShadowSync:
+    """
+    Changes of one sync, staged in shadow tables until commit.
+    For each changed file: create(table, columns) -> load the file into the returned shadow table -> stage(...).
+    Files removed from the listing are staged with remove(table), and files whose rows did not change with
+    stage_metadata(...). commit() swaps everything in at once, discard() throws it all away.
+    """
+
+    def __init__(self, connection, method="CRKN"):
+        if method != "CRKN" and method != "local":
+            raise Exception("Incorrect method type (CRKN or local) to indicate type/location of file")
+        self.connection = connection
+        self.method = method
+        # Index names must be unique in the database, and keep their name when their table is renamed
+        self.token = uuid.uuid4().hex[:8]
+        # table name -> (shadow table name, file_date, command, content_hash, row_hash)
+        self.staged = {}
+        # table name -> (file_date, File_Name value, content_hash, row_hash)
+        self.metadata = {}
+        self.created = []
+        self.removed = []
+
+    def create(self, table_name, columns=None):
+        """
+        Get the shadow table to load a file into. It is only created here, as a copy of the live table, when the file
+        will be synced row by row (see Scraping.upload_to_database) - incremental sync mode, a typed live table, and
+        columns given and the same as the live table's, so only the changed rows need to be written to it. Otherwise
+        (streamed or replaced files, or new columns) nothing is copied, and the load creates the table.
+        :param table_name: live table name
+        :param columns: columns of the incoming file, None if the file is not synced row by row
+        :return: shadow table name to load the file into
+        """
+        shadow_name = SHADOW_PREFIX + table_name
+        cursor = self.connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS [{shadow_name}];")
+        incremental = settings_manager.get_setting("sync_mode") != "replace"
+        if (incremental and columns is not None and table_sync.get_table_columns(self.connection, table_name) == columns
+                and schema.is_typed(self.connection, table_name)):
+            schema.create_table(cursor, shadow_name, columns)
+            cursor.execute(f"INSERT INTO [{shadow_name}] SELECT * FROM [{table_name}];")
+        self.connection.commit()
+        if shadow_name not in self.created:
+            self.created.append(shadow_name)
+        return shadow_name
+
+    def stage(self, table_name, file_date, command, columns, row_count, content_hash=None, row_hash=None):
+        """
+        Validate a loaded shadow table, build its indexes, and stage it to replace the live table.
+        :param table_name: live table name
+        :param file_date: date/version number for the file catalog
+        :param command: file catalog command - INSERT INTO or UPDATE
+        :param columns: columns the table should have
+        :param row_count: number of rows the table should have
+        :param content_hash: SHA-256 of the file, for the file catalog
+        :param row_hash: table_sync.row_hash of the file, for the file catalog
+        """
+        shadow_name = SHADOW_PREFIX + table_name
+        stored_columns = table_sync.get_table_columns(self.connection, shadow_name)
+        if stored_columns != columns:
+            raise ValueError(f"{shadow_name} does not have the columns of the incoming file")
+        stored_rows = self.connection.execute(f"SELECT COUNT(*) FROM [{shadow_name}];").fetchone()[0]
+        if stored_rows != row_count:
+            raise ValueError(f"{shadow_name} has {stored_rows} rows, expected {row_count}")
+
+        cursor = self.connection.cursor()
+        for column, expression in INDEXED_COLUMNS.items():
+            if column in columns:
+                cursor.execute(f"CREATE INDEX [idx_{table_name}_{column}_{self.token}] "
+                               f"ON [{shadow_name}] ({expression});")
+        self.connection.commit()
+        self.staged[table_name] = (shadow_name, file_date, command, content_hash, row_hash)
+
+    def restore(self, table_name, file_date, command, row_count, content_hash=None, row_hash=None):
+        """
+        Stage a shadow table loaded by an earlier, unfinished sync (its indexes were built then).
+        :param table_name: live table name
+        :param file_date: date/version number for the file catalog
+        :param command: file catalog command - INSERT INTO or UPDATE
+        :param row_count: number of rows the table had when it was loaded
+        :param content_hash: SHA-256 of the file, for the file catalog
+        :param row_hash: table_sync.row_hash of the file, for the file catalog
+        :return: True if the shadow table is intact and was staged, False if the file has to be loaded again
+        """
+        shadow_name = SHADOW_PREFIX + table_name
+        if not table_sync.get_table_columns(self.connection, shadow_name):
+            return False
+        if self.connection.execute(f"SELECT COUNT(*) FROM [{shadow_name}];").fetchone()[0] != row_count:
+            return False
+        if shadow_name not in self.created:
+            self.created.append(shadow_name)
+        self.staged[table_name] = (shadow_name, file_date, command, content_hash, row_hash)
+        return True
+
+    def stage_metadata(self, table_name, file_date, file_name, content_hash, row_hash):
+        """
+        Stage a new version of a file whose rows are identical to the live table - only its file catalog entry and
+        File_Name column are updated on commit, nothing is loaded.
+        :param table_name: live table name
+        :param file_date: date/version number for the file catalog
+        :param file_name: new value of the File_Name column
+        :param content_hash: SHA-256 of the file, for the file catalog
+        :param row_hash: table_sync.row_hash of the file, for the file catalog
+        """
+        self.metadata[table_name] = (file_date, file_name, content_hash, row_hash)
+
+    def drop(self, table_name):
+        """
+        Drop the shadow table of a file that turned out not to need loading.
+        :param table_name: live table name
+        """
+        shadow_name = SHADOW_PREFIX + table_name
+        self.connection.execute(f"DROP TABLE IF EXISTS [{shadow_name}];")
+        self.connection.commit()
+        if shadow_name in self.created:
+            self.created.remove(shadow_name)
+        self.staged.pop(table_name, None)
+
+    def remove(self, table_name):
+        """
+        Stage a file to be removed - its table is dropped and its catalog entry deleted on commit.
+        :param table_name: live table name
+        """
+        self.removed.append(table_name)
+
+    def commit(self):
+        """
+        Swap every staged shadow table in and apply the file catalog changes, in one transaction.
+        Raises sqlite3.Error if the swap failed, in which case the database is left as it was.
+        """
+        if self.connection.in_transaction:
+            self.connection.commit()
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE;")
+            dictionary = StringDictionary(self.connection)
+            for table_name, (shadow_name, file_date, command, content_hash, row_hash) in self.staged.items():
+                cursor.execute(f"DROP TABLE IF EXISTS [{table_name}];")
+                cursor.execute(f"ALTER TABLE [{shadow_name}] RENAME TO [{table_name}];")
+                if command == "INSERT INTO":
+                    cursor.execute(f"INSERT INTO {self.method}_file_names (file_name, file_date, content_hash, "
+                                   f"row_hash) VALUES (?, ?, ?, ?);", (table_name, file_date, content_hash, row_hash))
+                else:
+                    cursor.execute(f"UPDATE {self.method}_file_names SET file_date = ?, content_hash = ?, "
+                                   f"row_hash = ? WHERE file_name = ?;", (file_date, content_hash, row_hash, table_name))
+            for table_name, (file_date, file_name, content_hash, row_hash) in self.metadata.items():
+                # Tables written before the string dictionary hold the file name itself
+                value = dictionary.id(file_name) if schema.is_typed(self.connection, table_name) else file_name
+                cursor.execute(f"UPDATE [{table_name}] SET File_Name = ?;", (value,))
+                cursor.execute(f"UPDATE {self.method}_file_names SET file_date = ?, content_hash = ?, "
+                               f"row_hash = ? WHERE file_name = ?;", (file_date, content_hash, row_hash, table_name))
+            for table_name in self.removed:
+                cursor.execute(f"DROP TABLE IF EXISTS [{table_name}];")
+                cursor.execute(f"DELETE FROM {self.method}_file_names WHERE file_name = ?;", (table_name,))
+            self.connection.commit()
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            m_logger.error(f"Failed to swap in synced tables: {e}. Database remains unchanged.")
+            self.discard()
+            raise
+        m_logger.info(f"Swapped in {len(self.staged)} tables, updated {len(self.metadata)} unchanged tables and removed "
+                      f"{len(self.removed)} tables")
+        self.created = []
+        self.staged = {}
+        self.metadata = {}
+        self.removed = []
+
+    def discard(self, keep=()):
+        """
+        Drop the shadow tables of this sync, leaving the live tables as they were.
+        :param keep: live table names whose shadow tables are kept for a later sync to resume with
+        """
+        keep = {SHADOW_PREFIX + table_name for table_name in keep}
+        for shadow_name in self.created:
+            if shadow_name not in keep:
+                self.connection.execute(f"DROP TABLE IF EXISTS [{shadow_name}];")
+        self.connection.commit()
+        self.created = []
+        self.staged = {}
+        self.metadata = {}
+        self.removed = []
@@ -0,0 +1,106 @@
+"""
+Dictionary encoding of the repeated text columns of the file tables.
+
+Publisher, Platform, collection_name, agreement_code and File_Name hold the same few strings on every row of a file
+(Platform and File_Name are added to every row by the file readers). Instead of repeating them, each distinct string
+is stored once in the shared string_dictionary table, and the file tables hold its integer id - the rows, the database
+file and the pages read by a search all get smaller.
+
+Values are encoded when they are written (StringDictionary.encode) and decoded by the queries that read them
+(decode_expression), so searches and exports still see the strings. Tables written before the encoding hold the
+strings themselves - decode_expression passes those through unchanged.
+
+Strings are never removed when a table is replaced by a new version of its file - the next version almost always uses
+them again. When a file is removed, prune deletes the strings that no table uses any more.
+"""
+import pandas as pd
+
+TABLE_NAME = "string_dictionary"
+ENCODED_COLUMNS = ["Publisher", "agreement_code", "collection_name", "Platform", "File_Name"]
+
+
+def create_table(connection):
+    """
+    Create the dictionary table if it does not exist.
+    :param connection: database connection object
+    """
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_NAME} (id INTEGER PRIMARY KEY, value TEXT UNIQUE NOT NULL);")
+
+
+def decode_expression(column):
+    """
+    Get the SQL expression reading an encoded column back as its strings.
+    :param column: column name
+    :return: SQL expression - the dictionary string for ids, the stored value for tables written before the encoding
+    """
+    return (f"CASE WHEN typeof([{column}]) = 'integer' THEN (SELECT value FROM {TABLE_NAME} WHERE id = [{column}]) "
+            f"ELSE [{column}] END")
+
+
+def prune(connection):
+    """
+    Delete the strings that no table uses any more, in the connection's current transaction.
+    :param connection: database connection object
+    :return: number of strings deleted
+    """
+    create_table(connection)
+    references = []
+    tables = connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name != ?;",
+                                (TABLE_NAME,)).fetchall()
+    # Every table with an encoded column - file tables, and the shadow tables of a sync that was interrupted
+    for (table,) in tables:
+        columns = [row[1] for row in connection.execute(f"PRAGMA table_info([{table}]);").fetchall()]
+        references += [f"SELECT [{column}] FROM [{table}] WHERE typeof([{column}]) = 'integer'"
+                       for column in ENCODED_COLUMNS if column in columns]
+    if not references:
+        return connection.execute(f"DELETE FROM {TABLE_NAME};").rowcount
+    return connection.execute(f"DELETE FROM {TABLE_NAME} WHERE id NOT IN ({' UNION '.join(references)});").rowcount
+
+
+class StringDictionary:
+    """
+    Ids of the dictionary strings, for one write to the database. New strings are added to the dictionary in the
+    connection's current transaction, so they are rolled back with the rows that use them - use a new instance for
+    every transaction.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.ids = None
+
+    def load(self):
+        if self.ids is None:
+            create_table(self.connection)
+            self.ids = dict(self.connection.execute(f"SELECT value, id FROM {TABLE_NAME};").fetchall())
+
+    def id(self, value):
+        """
+        Get the id of a string, adding it to the dictionary if it is new.
+        :param value: string
+        :return: integer id
+        """
+        self.load()
+        if value not in self.ids:
+            cursor = self.connection.execute(f"INSERT INTO {TABLE_NAME} (value) VALUES (?);", (value,))
+            self.ids[value] = cursor.lastrowid
+        return self.ids[value]
+
+    def encode(self, df):
+        """
+        Replace the strings of the encoded columns with their ids.
+        :param df: prepared dataframe (see table_sync.prepare_dataframe) - strings, None for missing values
+        :return: copy of the dataframe with integer ids (and None) in the encoded columns
+        """
+        self.load()
+        df = df.copy()
+        for column in ENCODED_COLUMNS:
+            if column not in df.columns:
+                continue
+            values = df[column]
+            present = values.notna().to_numpy(dtype=bool)
+            for value in pd.unique(values[present]):
+                self.id(value)
+            codes = values.to_numpy(dtype=object).copy()
+            codes[present] = values[present].map(self.ids).astype("int64").to_numpy(dtype=object)
+            df[column] = codes
+        return df
@@ -0,0 +1,133 @@
+"""
+Persistent journal of a CRKN sync, so a sync that was cut short (e.g. by a dropped connection) can be resumed.
+
+Every file in the sync plan moves through three stages, and the journal (sync_journal.json, next to the download cache
+index) records the last stage each file reached:
+    downloaded - the file is in the download cache (content_hash, path)
+    validated - the file was parsed and is in the correct format
+    loaded - the file is in its shadow table (row_count), waiting for the sync to be committed
+When a sync is restarted with the same plan, loaded files are taken straight from their shadow tables, and downloaded
+files are reused without contacting the server once their hash is verified, so only the remaining work is repeated.
+The journal is cleared once the sync commits.
+"""
+import json
+import os
+import threading
+from src.data_processing.download_cache import get_cache_directory, hash_file
+from src.utility.logger import m_logger
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+
+DOWNLOADED = "downloaded"
+VALIDATED = "validated"
+LOADED = "loaded"
+
+
+class SyncJournal:
+    """
+    Stage of every file of the current sync, saved to disk on every change. Safe to update from several threads.
+    Entries are kept per file name, with the file date/version they were recorded for - an entry for another date is
+    treated as missing.
+    """
+
+    def __init__(self, path=None, database_name=None):
+        if path is None:
+            path = os.path.join(get_cache_directory(), "sync_journal.json")
+        if database_name is None:
+            database_name = settings_manager.get_setting("database_name")
+        self.path = path
+        self.database_name = database_name
+        self.lock = threading.Lock()
+        self.files = self.load()
+
+    def load(self):
+        """
+        Load the journal from disk.
+        :return: dictionary of file name -> entry (empty if there is no readable journal, or it is for another database)
+        """
+        try:
+            with open(self.path, "r") as file:
+                journal = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        # Shadow tables of another database are of no use
+        if journal.get("database") != self.database_name:
+            return {}
+        return journal.get("files", {})
+
+    def save(self):
+        """Write the journal to disk, replacing the old one atomically. Call with the lock held."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"database": self.database_name, "files": self.files}, file, indent=4)
+        os.replace(temp_path, self.path)
+
+    def get(self, file_name, file_date):
+        """
+        Get the entry of a file.
+        :param file_name: file name (table name)
+        :param file_date: date/version number the entry has to be for
+        :return: copy of the entry dictionary - stage, file_date and the fields recorded with it - or None
+        """
+        with self.lock:
+            entry = self.files.get(file_name)
+            if entry is None or entry["file_date"] != file_date:
+                return None
+            return dict(entry)
+
+    def record(self, file_name, file_date, stage, **fields):
+        """
+        Record that a file reached a stage. Fields recorded for earlier stages of the same file date are kept.
+        :param file_name: file name (table name)
+        :param file_date: date/version number of the file
+        :param stage: DOWNLOADED, VALIDATED or LOADED
+        :param fields: values to store with the entry (content_hash, path, row_count)
+        """
+        with self.lock:
+            entry = self.files.get(file_name)
+            if entry is None or entry["file_date"] != file_date:
+                entry = {"file_date": file_date}
+            entry.update(fields)
+            entry["stage"] = stage
+            self.files[file_name] = entry
+            self.save()
+
+    def prune(self, files):
+        """
+        Forget every file that is not part of the current plan.
+        :param files: list of (file_name, file_date) still to be synced
+        """
+        keep = set(files)
+        with self.lock:
+            self.files = {file_name: entry for file_name, entry in self.files.items()
+                          if (file_name, entry["file_date"]) in keep}
+            self.save()
+
+    def clear(self):
+        """Forget every file - called once the sync is committed."""
+        with self.lock:
+            self.files = {}
+            self.save()
+
+    def loaded_tables(self):
+        """
+        :return: list of file names whose shadow table is loaded
+        """
+        with self.lock:
+            return [file_name for file_name, entry in self.files.items() if entry["stage"] == LOADED]
+
+    def verified_download(self, entry):
+        """
+        Get the downloaded file of an entry if it is still on disk with the recorded contents.
+        :param entry: entry dictionary from get
+        :return: file path, or None if the file has to be downloaded again
+        """
+        path = entry.get("path") if entry is not None else None
+        if not path or not os.path.exists(path):
+            return None
+        if hash_file(path) != entry.get("content_hash"):
+            m_logger.warning(f"Downloaded file {path} does not match the sync journal, downloading it again")
+            return None
+        return path
@@ -0,0 +1,226 @@
+"""
+Staged pipeline used to sync CRKN files: download -> parse/validate -> load.
+
+Each stage runs on its own thread and hands its results to the next stage through a bounded queue, so the network
+keeps downloading while pandas parses and the database writer loads. When a downstream stage falls behind, the bounded
+queue blocks the stage feeding it (backpressure), so at most a few files are held in memory at once.
+
+Parsing can optionally run in worker processes (parse_processes, see get_parse_processes), since parsing
+spreadsheets is CPU bound. Workers are started with spawn, not fork - a forked child of this multithreaded (Qt)
+process could inherit a lock another thread was holding, e.g. the logger's, and deadlock. Loading always happens on
+the thread that calls run, which keeps a single SQLite writer on the thread that owns the connection.
+
+Every stage keeps throughput statistics, passed to stats_callback as they change so the progress UI can show them.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from src.utility.logger import m_logger
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+
+# Marks the end of the items in a queue
+_DONE = object()
+
+
+class StageStats:
+    """Running totals for one pipeline stage - items handled, units (bytes or rows) and time spent working."""
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.units = 0
+        self.busy_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds, units=0):
+        """
+        Record one handled item.
+        :param seconds: time spent on the item
+        :param units: bytes or rows handled for the item
+        """
+        with self.lock:
+            self.items += 1
+            self.units += units
+            self.busy_seconds += seconds
+
+    def snapshot(self):
+        """
+        Get the current totals and throughput.
+        :return: dictionary - items, units, unit, items_per_second, units_per_second
+        """
+        with self.lock:
+            busy = self.busy_seconds
+            return {
+                "items": self.items,
+                "units": self.units,
+                "unit": self.unit,
+                "items_per_second": self.items / busy if busy else 0.0,
+                "units_per_second": self.units / busy if busy else 0.0
+            }
+
+
+def get_parse_processes(file_count):
+    """
+    Get the number of worker processes to parse files with, from the parse_processes setting - 0 for one per core,
+    otherwise at most that many (1 parses on the loading thread). There are never more workers than files, and a
+    single file is parsed on the loading thread, since starting a worker would cost more than it saves.
+    :param file_count: number of files to parse
+    :return: number of worker processes, 0 to parse on the loading thread
+    """
+    processes = min(int(settings_manager.get_setting("parse_processes") or 0) or os.cpu_count() or 1, file_count)
+    return processes if processes > 1 else 0
+
+
+class SyncPipeline:
+    """
+    download(item) -> (payload, bytes) runs on the download thread.
+    parse(payload) -> (payload, units) runs on the parse thread, or in a worker process if parse_processes > 0
+    (parse must then be a module-level function and the payload picklable).
+    load(payload) -> rows runs on the thread calling run.
+    An exception raised by a stage drops that item and is recorded in the failures returned by run.
+    """
+
+    def __init__(self, download, parse, load, queue_size=2, parse_processes=0, stats_callback=None):
+        self.download = download
+        self.parse = parse
+        self.load = load
+        self.queue_size = queue_size
+        self.parse_processes = parse_processes
+        self.stats_callback = stats_callback
+        self.stats = {
+            "download": StageStats("download", "bytes"),
+            "parse": StageStats("parse", "files"),
+            "load": StageStats("load", "rows")
+        }
+        self.failures = []
+        self.failures_lock = threading.Lock()
+
+    def get_stats(self):
+        """
+        Get a snapshot of every stage's statistics.
+        :return: dictionary of stage name -> StageStats.snapshot()
+        """
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+    def report_stats(self):
+        if self.stats_callback is not None:
+            self.stats_callback(self.get_stats())
+
+    def add_failure(self, item, stage, error):
+        m_logger.error(f"Sync pipeline {stage} stage failed: {error}")
+        with self.failures_lock:
+            self.failures.append((item, stage, error))
+
+    def run(self, items):
+        """
+        Run every item through the pipeline.
+        :param items: list of items for the download stage
+        :return: list of failures - (item or payload, stage name, exception)
+        """
+        parse_queue = queue.Queue(maxsize=self.queue_size)
+        load_queue = queue.Queue(maxsize=self.queue_size)
+
+        download_thread = threading.Thread(target=self.download_stage, args=(items, parse_queue), daemon=True)
+        parse_thread = threading.Thread(target=self.parse_stage, args=(parse_queue, load_queue), daemon=True)
+        download_thread.start()
+        parse_thread.start()
+
+        # Load stage - the single database writer
+        while True:
+            payload = load_queue.get()
+            if payload is _DONE:
+                break
+            start = time.perf_counter()
+            try:
+                rows = self.load(payload)
+                self.stats["load"].record(time.perf_counter() - start, rows or 0)
+            except Exception as e:
+                self.add_failure(payload, "load", e)
+            self.report_stats()
+
+        download_thread.join()
+        parse_thread.join()
+        return self.failures
+
+    def download_stage(self, items, parse_queue):
+        for item in items:
+            start = time.perf_counter()
+            try:
+                payload, size = self.download(item)
+            except Exception as e:
+                self.add_failure(item, "download", e)
+                continue
+            self.stats["download"].record(time.perf_counter() - start, size)
+            self.report_stats()
+            # Blocks while the parse stage is behind
+            parse_queue.put(payload)
+        parse_queue.put(_DONE)
+
+    def parse_stage(self, parse_queue, load_queue):
+        try:
+            if self.parse_processes > 0:
+                self.parse_in_processes(parse_queue, load_queue)
+            else:
+                while True:
+                    payload = parse_queue.get()
+                    if payload is _DONE:
+                        break
+                    self.finish_parse(payload, time.perf_counter(), lambda: self.parse(payload), load_queue)
+        except Exception as e:
+            # Parse stage cannot continue - let the download stage finish so it is not left blocked on the queue
+            self.add_failure(None, "parse", e)
+            while parse_queue.get() is not _DONE:
+                pass
+        finally:
+            load_queue.put(_DONE)
+
+    def finish_parse(self, payload, start, get_result, load_queue):
+        """
+        Collect the result of parsing one payload and pass it on to the load stage.
+        :param payload: payload that was parsed
+        :param start: time parsing started (time.perf_counter)
+        :param get_result: function returning the (result, units) of parse, or raising its exception
+        :param load_queue: queue of the load stage
+        """
+        try:
+            result, units = get_result()
+        except Exception as e:
+            self.add_failure(payload, "parse", e)
+            return
+        self.stats["parse"].record(time.perf_counter() - start, units)
+        self.report_stats()
+        # Blocks while the load stage is behind
+        load_queue.put(result)
+
+    def parse_in_processes(self, parse_queue, load_queue):
+        with ProcessPoolExecutor(max_workers=self.parse_processes,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            running = {}
+            finished_input = False
+            while not finished_input or running:
+                # Keep at most one job per worker in flight, so downloads wait instead of piling up
+                if not finished_input and len(running) < self.parse_processes:
+                    try:
+                        # Only block for the next download if nothing is being parsed
+                        payload = parse_queue.get(block=not running)
+                    except queue.Empty:
+                        payload = None
+                    if payload is _DONE:
+                        finished_input = True
+                    elif payload is not None:
+                        running[executor.submit(self.parse, payload)] = (payload, time.perf_counter())
+                        continue
+                if not running:
+                    continue
+                # Short timeout while input may still arrive, so free workers get the next download quickly
+                timeout = None if finished_input or len(running) >= self.parse_processes else 0.05
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    payload, start = running.pop(future)
+                    self.finish_parse(payload, start, future.result, load_queue)
@@ -0,0 +1,107 @@
+"""
+Sync planner - decides which CRKN files need to be added, updated or removed.
+
+The file catalog ({method}_file_names) is read once into a dictionary, and the files listed on the CRKN website are
+compared to it with set operations, so planning costs one query plus constant time per listed file (instead of up to two
+queries per file). The result is a SyncPlan, which the UI shows to the user and ScrapingThread then carries out. A plan
+only holds plain values, so it can be converted to and from a dictionary (e.g. to save it as JSON).
+"""
+
+INSERT = "INSERT INTO"
+UPDATE = "UPDATE"
+
+# Largest share of the catalog a sync nobody confirms may remove - a listing that is missing most of the files is more
+# likely a broken or redesigned page (or a wrong CRKN_url) than CRKN withdrawing them
+MAX_UNCONFIRMED_DELETE_SHARE = 0.5
+
+
+class SyncPlan:
+    """
+    Changes needed to bring the local database in line with the CRKN listing.
+    inserts - files that are new, as dictionaries {"file_name", "file_date", "link"}
+    updates - files with a new date/version, same form as inserts
+    deletes - names of files that are no longer listed
+    unchanged - number of listed files that are already up to date
+    """
+
+    def __init__(self, inserts=None, updates=None, deletes=None, unchanged=0):
+        self.inserts = inserts if inserts is not None else []
+        self.updates = updates if updates is not None else []
+        self.deletes = deletes if deletes is not None else []
+        self.unchanged = unchanged
+
+    def change_count(self):
+        """
+        :return: number of files that will be added, updated or removed
+        """
+        return len(self.inserts) + len(self.updates) + len(self.deletes)
+
+    def catalog_size(self):
+        """
+        :return: number of files in the catalog the plan was made from
+        """
+        return self.unchanged + len(self.updates) + len(self.deletes)
+
+    def can_apply_unconfirmed(self):
+        """
+        Check if the plan can be applied without asking the user (background syncs) - it must not remove more than
+        MAX_UNCONFIRMED_DELETE_SHARE of the catalog.
+        :return: True if the plan is safe to apply unconfirmed
+        """
+        return len(self.deletes) <= MAX_UNCONFIRMED_DELETE_SHARE * self.catalog_size()
+
+    def downloads(self):
+        """
+        Get the files that need to be downloaded, with the file catalog command for each.
+        :return: list of (file dictionary, INSERT INTO or UPDATE)
+        """
+        return [(file, INSERT) for file in self.inserts] + [(file, UPDATE) for file in self.updates]
+
+    def to_dict(self):
+        return {
+            "inserts": [dict(file) for file in self.inserts],
+            "updates": [dict(file) for file in self.updates],
+            "deletes": list(self.deletes),
+            "unchanged": self.unchanged
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([dict(file) for file in data.get("inserts", [])], [dict(file) for file in data.get("updates", [])],
+                   list(data.get("deletes", [])), data.get("unchanged", 0))
+
+
+def load_catalog(connection, method="CRKN"):
+    """
+    Read the file catalog in one query.
+    :param connection: database connection object
+    :param method: CRKN or local
+    :return: dictionary of file_name -> file_date
+    """
+    if method != "CRKN" and method != "local":
+        raise Exception("Incorrect method type (CRKN or local) to indicate type/location of file")
+    return dict(connection.execute(f"SELECT file_name, file_date FROM {method}_file_names;").fetchall())
+
+
+def plan_sync(listing, catalog):
+    """
+    Compare the listed files to the file catalog.
+    :param listing: list of (file_name, file_date, link) for every file on the CRKN website - if a file name is listed
+                    more than once, the last one is used
+    :param catalog: dictionary of file_name -> file_date (see load_catalog)
+    :return: SyncPlan - inserts/updates in listing order, deletes sorted by name
+    """
+    listed = {}
+    for file_name, file_date, link in listing:
+        listed[file_name] = {"file_name": file_name, "file_date": file_date, "link": link}
+
+    new_files = listed.keys() - catalog.keys()
+    kept_files = listed.keys() & catalog.keys()
+    changed_files = {file_name for file_name in kept_files if catalog[file_name] != listed[file_name]["file_date"]}
+
+    return SyncPlan(
+        inserts=[file for file_name, file in listed.items() if file_name in new_files],
+        updates=[file for file_name, file in listed.items() if file_name in changed_files],
+        deletes=sorted(catalog.keys() - listed.keys()),
+        unchanged=len(kept_files) - len(changed_files)
+    )
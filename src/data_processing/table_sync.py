@@ -0,0 +1,170 @@
+"""
+Row-level incremental sync of a file dataframe into an existing table.
+
+Instead of dropping and rewriting the whole table when a new version of a file arrives, the incoming rows are matched
+to the stored rows by a stable key (normalized Platform_eISBN + Title), and only the rows that were inserted, changed
+or removed are written, all inside one transaction.
+"""
+import hashlib
+import sqlite3
+import numpy as np
+import pandas as pd
+from src.data_processing import schema
+from src.data_processing.string_dictionary import StringDictionary
+from src.utility.logger import m_logger
+
+# Columns added to every row of a file (see Scraping.file_to_dataframe) - File_Name changes with every new version
+FILE_COLUMNS = ("Platform", "File_Name")
+
+
+def normalize_value(value):
+    """
+    Normalize a cell value so values read back from the database compare equal to freshly parsed ones.
+    :param value: cell value
+    :return: None for missing values, otherwise a string ("123" for the float 123.0)
+    """
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return None
+        if value.is_integer():
+            return str(int(value))
+    if value is pd.NaT:
+        return None
+    return str(value)
+
+
+def prepare_dataframe(df):
+    """
+    Get a copy of the dataframe with the values that will be stored - converted to the typed schema (see schema) and
+    missing values as None.
+    :param df: file dataframe
+    :return: prepared dataframe
+    """
+    return schema.convert_dataframe(df)
+
+
+def make_row_keys(df):
+    """
+    Build the stable key of every row - normalized eISBN plus normalized title. Repeated keys within the file are
+    numbered so every key is unique.
+    :param df: dataframe with Platform_eISBN and Title columns
+    :return: list of key strings, in row order
+    """
+    isbn = df["Platform_eISBN"].astype("string").fillna("").str.replace(r"[^0-9Xx]", "", regex=True).str.upper()
+    title = df["Title"].astype("string").fillna("").str.strip().str.casefold()
+    base = isbn + "\x1f" + title
+    occurrence = base.groupby(base).cumcount().astype(str)
+    return (base + "\x1f" + occurrence).to_list()
+
+
+class RowHasher:
+    """
+    Canonical hash of the rows of a file, built from the dataframe chunk by chunk (see row_hash). Keeps 8 bytes per
+    row until hexdigest is called.
+    """
+
+    def __init__(self):
+        self.columns = None
+        self.row_hashes = []
+
+    def update(self, df):
+        """
+        Add the rows of a dataframe chunk.
+        :param df: file dataframe (or chunk of one)
+        :return: self
+        """
+        df = prepare_dataframe(df.drop(columns=["File_Name"], errors="ignore"))
+        if self.columns is None:
+            self.columns = df.columns.to_list()
+        self.row_hashes.append(pd.util.hash_pandas_object(df.astype("string"), index=False).to_numpy())
+        return self
+
+    def hexdigest(self):
+        digest = hashlib.sha256(repr(self.columns).encode())
+        if self.row_hashes:
+            digest.update(np.sort(np.concatenate(self.row_hashes)).tobytes())
+        return digest.hexdigest()
+
+
+def row_hash(df):
+    """
+    Get a canonical hash of the rows of a file dataframe - independent of the row order and of the File_Name column, so
+    the same data published again under another file name (or in another file type) gets the same hash.
+    :param df: file dataframe
+    :return: hex digest
+    """
+    return RowHasher().update(df).hexdigest()
+
+
+def get_table_columns(connection, table_name):
+    """
+    Get the column names of a table.
+    :param connection: database connection object
+    :param table_name: table name
+    :return: list of column names, empty if the table does not exist
+    """
+    return [row[1] for row in connection.execute(f"PRAGMA table_info([{table_name}]);").fetchall()]
+
+
+def sync_table(df, table_name, connection):
+    """
+    Apply only the row differences between a file dataframe and its stored table, in one transaction.
+    Columns with one value for the whole file (FILE_COLUMNS - File_Name changes with every version) are not compared
+    row by row, they are written with one UPDATE.
+    :param df: file dataframe
+    :param table_name: existing table with the same columns as the dataframe
+    :param connection: database connection object
+    :return: dictionary of counts - inserted, updated, deleted, unchanged
+    """
+    columns = df.columns.to_list()
+    if get_table_columns(connection, table_name) != columns or not schema.is_typed(connection, table_name):
+        raise ValueError(f"Columns of {table_name} do not match the incoming file")
+
+    df = prepare_dataframe(df)
+    incoming_keys = make_row_keys(df)
+    # Compared with the stored rows as they are stored - encoded (see string_dictionary)
+    encoded = StringDictionary(connection).encode(df)
+    rows = [tuple(normalize_value(value) for value in row) for row in encoded.itertuples(index=False, name=None)]
+    file_values = {column: rows[0][columns.index(column)] for column in FILE_COLUMNS
+                   if column in columns and rows and encoded[column].nunique(dropna=False) == 1}
+    compared = [column for column in columns if column not in file_values]
+    positions = [columns.index(column) for column in compared]
+    incoming = dict(zip(incoming_keys, rows))
+
+    compared_list = ", ".join(f"[{column}]" for column in compared)
+    stored_df = pd.read_sql_query(f"SELECT rowid AS _rowid, {compared_list} FROM [{table_name}]", connection,
+                                  dtype=object)
+    stored = {}
+    for key, row in zip(make_row_keys(stored_df), stored_df.itertuples(index=False, name=None)):
+        stored[key] = (row[0], tuple(normalize_value(value) for value in row[1:]))
+
+    inserts = [row for key, row in incoming.items() if key not in stored]
+    deletes = [(rowid,) for key, (rowid, _) in stored.items() if key not in incoming]
+    updates = []
+    for key, row in incoming.items():
+        if key in stored:
+            values = tuple(row[position] for position in positions)
+            if stored[key][1] != values:
+                updates.append(values + (stored[key][0],))
+    counts = {"inserted": len(inserts), "updated": len(updates), "deleted": len(deletes),
+              "unchanged": len(incoming) - len(inserts) - len(updates)}
+
+    column_list = ", ".join(f"[{column}]" for column in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    assignments = ", ".join(f"[{column}] = ?" for column in compared)
+    try:
+        cursor = connection.cursor()
+        cursor.executemany(f"DELETE FROM [{table_name}] WHERE rowid = ?", deletes)
+        cursor.executemany(f"UPDATE [{table_name}] SET {assignments} WHERE rowid = ?", updates)
+        for column, value in file_values.items():
+            cursor.execute(f"UPDATE [{table_name}] SET [{column}] = ? WHERE [{column}] IS NOT ?", (value, value))
+        cursor.executemany(f"INSERT INTO [{table_name}] ({column_list}) VALUES ({placeholders})", inserts)
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    m_logger.info(f"Synced {table_name} - {counts['inserted']} inserted, {counts['updated']} updated, "
+                  f"{counts['deleted']} deleted, {counts['unchanged']} unchanged")
+    return counts
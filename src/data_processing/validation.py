@@ -0,0 +1,234 @@
+"""
+Validation of CRKN/local file dataframes.
+
+Every check runs vectorized over a whole dataframe (or a chunk of one - see chunked_ingest), and every problem found
+is added to a ValidationReport instead of stopping at the first one, so a file can be fixed in one go:
+    errors (the file is not uploaded) - header row, missing titles, missing Y/N values
+    warnings (reported, the file is still uploaded) - institution values other than Y/N, ISBN check digits,
+    unrecognized dates
+Row numbers are spreadsheet row numbers - the first data row is row 4, after the platform, title and header rows.
+"""
+import numpy as np
+import pandas as pd
+from src.utility.logger import m_logger
+
+HEADER_ROW = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name",
+              "title_metadata_last_modified"]
+# Columns added to every file dataframe by the file readers
+ADDED_COLUMNS = ["Platform", "File_Name"]
+FIRST_DATA_ROW = 4
+# Row numbers listed per problem in the report
+MAX_ROWS_LISTED = 10
+
+ERROR = "error"
+WARNING = "warning"
+
+
+class ValidationReport:
+    """
+    Problems found in a file, grouped by (severity, column, message) - each with the number of rows affected and the
+    first MAX_ROWS_LISTED row numbers.
+    """
+
+    def __init__(self):
+        self.problems = {}
+
+    def add(self, severity, column, message, rows=None):
+        """
+        Add a problem.
+        :param severity: ERROR or WARNING
+        :param column: column name, or None for a problem with the whole file
+        :param message: description of the problem
+        :param rows: array of the row numbers affected, or None for a problem with the whole file
+        """
+        if rows is not None and len(rows) == 0:
+            return
+        problem = self.problems.setdefault((severity, column, message), {"count": 0, "rows": []})
+        if rows is None:
+            problem["count"] += 1
+            return
+        problem["count"] += len(rows)
+        missing = MAX_ROWS_LISTED - len(problem["rows"])
+        if missing > 0:
+            problem["rows"].extend(int(row) for row in rows[:missing])
+
+    def count(self, severity):
+        """
+        :param severity: ERROR or WARNING
+        :return: number of rows (or whole-file problems) with problems of that severity
+        """
+        return sum(problem["count"] for (problem_severity, _, _), problem in self.problems.items()
+                   if problem_severity == severity)
+
+    def is_valid(self):
+        """
+        :return: True if there are no errors (warnings are allowed)
+        """
+        return self.count(ERROR) == 0
+
+    def lines(self, severity):
+        lines = []
+        for (problem_severity, column, message), problem in self.problems.items():
+            if problem_severity != severity:
+                continue
+            if not problem["rows"]:
+                lines.append(message)
+                continue
+            rows = ", ".join(str(row) for row in problem["rows"])
+            if problem["count"] > len(problem["rows"]):
+                rows += f"... ({problem['count']} rows)"
+            lines.append(f"{column}: {message} Row{'s' if problem['count'] > 1 else ''} {rows}")
+        return lines
+
+    def summary(self):
+        """
+        :return: the report as text - errors first, then warnings
+        """
+        errors = self.lines(ERROR)
+        warnings = self.lines(WARNING)
+        # A single problem with the whole file reads as before, e.g. "The header row is incorrect."
+        if len(errors) == 1 and not warnings and not self.problems[next(iter(self.problems))]["rows"]:
+            return errors[0]
+        text = []
+        if errors:
+            text.append(f"{len(errors)} error{'s' if len(errors) > 1 else ''} found:")
+            text += errors
+        if warnings:
+            text.append(f"{len(warnings)} warning{'s' if len(warnings) > 1 else ''}:")
+            text += warnings
+        return "\n".join(text)
+
+
+class Validator:
+    """
+    Validate a file dataframe chunk by chunk - update(chunk) for every chunk in file order, then report.
+    """
+
+    def __init__(self):
+        self.report = ValidationReport()
+        self.rows = 0
+        self.header_valid = None
+
+    def update(self, df):
+        """
+        Validate the next chunk of a file.
+        :param df: dataframe chunk, with the Platform and File_Name columns added
+        :return: True if no errors have been found so far
+        """
+        if self.header_valid is None:
+            self.header_valid = self.check_header(df.columns.to_list())
+        if not self.header_valid:
+            return False
+
+        row_numbers = np.arange(FIRST_DATA_ROW + self.rows, FIRST_DATA_ROW + self.rows + len(df))
+        self.rows += len(df)
+        self.check_titles(df, row_numbers)
+        self.check_institutions(df, row_numbers)
+        self.check_isbns(df, row_numbers)
+        self.check_dates(df, row_numbers)
+        return self.report.is_valid()
+
+    def result(self):
+        """
+        :return: True if the file is valid, the report summary (error string) if not
+        """
+        warnings = self.report.count(WARNING)
+        if not self.report.is_valid():
+            summary = self.report.summary()
+            m_logger.error(f"File is not in the correct format: {summary}")
+            return summary
+        if warnings:
+            m_logger.warning(f"File has {warnings} warnings: {self.report.summary()}")
+        return True
+
+    def check_header(self, headers):
+        # Header row is incorrect (too short or headers don't match)
+        if len(headers) <= 8 or not headers[:8] == HEADER_ROW:
+            self.report.add(ERROR, None, "The header row is incorrect.")
+            return False
+        return True
+
+    def check_titles(self, df, row_numbers):
+        titles = df["Title"]
+        missing = titles.isna().to_numpy().copy()
+        present = ~missing
+        missing[present] = titles[present].astype(str).str.strip().eq("").to_numpy()
+        self.report.add(ERROR, "Title", "Missing title data.", row_numbers[missing])
+
+    def check_institutions(self, df, row_numbers):
+        for column in df.columns[8:]:
+            if column in ADDED_COLUMNS:
+                continue
+            values = df[column]
+            # Fast path - most values are exactly Y or N
+            exact = values.isin(["Y", "N"]).to_numpy()
+            if exact.all():
+                continue
+            missing = values.isna().to_numpy()
+            self.report.add(ERROR, column, "Missing Y/N data.", row_numbers[missing])
+            other = ~exact & ~missing
+            if other.any():
+                normalized = values[other].astype(str).str.strip().str.upper()
+                invalid = ~normalized.isin(["Y", "N"]).to_numpy()
+                self.report.add(WARNING, column, "Value is not Y or N.", row_numbers[other][invalid])
+
+    def check_isbns(self, df, row_numbers):
+        isbns = df["Platform_eISBN"]
+        present = isbns.notna().to_numpy()
+        if not present.any():
+            return
+        normalized = isbns[present].astype(str).str.replace(r"[^0-9Xx]", "", regex=True).str.upper()
+        lengths = normalized.str.len().to_numpy()
+        normalized = normalized.to_numpy(dtype=object)
+        valid = np.zeros(len(normalized), dtype=bool)
+
+        # ISBN-13 - weights 1, 3, 1, 3... sum to a multiple of 10
+        thirteen = lengths == 13
+        if thirteen.any():
+            digits = digit_matrix(normalized[thirteen], 13)
+            weights = np.tile([1, 3], 7)[:13]
+            ok = (digits >= 0).all(axis=1) & (digits[:, -1] <= 9)
+            valid[thirteen] = ok & ((digits * weights).sum(axis=1) % 10 == 0)
+
+        # ISBN-10 - weights 10 down to 1 sum to a multiple of 11, X is 10 in the last place
+        ten = lengths == 10
+        if ten.any():
+            digits = digit_matrix(normalized[ten], 10)
+            ok = (digits >= 0).all(axis=1)
+            valid[ten] = ok & ((digits * np.arange(10, 0, -1)).sum(axis=1) % 11 == 0)
+
+        self.report.add(WARNING, "Platform_eISBN", "Invalid ISBN.", row_numbers[present][~valid])
+
+    def check_dates(self, df, row_numbers):
+        dates = df["title_metadata_last_modified"]
+        present = dates.notna().to_numpy()
+        if not present.any():
+            return
+        parsed = pd.to_datetime(dates[present], format="ISO8601", errors="coerce")
+        self.report.add(WARNING, "title_metadata_last_modified", "Unrecognized date.",
+                        row_numbers[present][parsed.isna().to_numpy()])
+
+
+def digit_matrix(values, width):
+    """
+    Convert equal-length ISBN strings to a matrix of digit values.
+    :param values: array of strings of width characters (digits and X)
+    :param width: length of every string
+    :return: integer array (len(values), width) - 0-9 for digits, 10 for X in the last place, -1 for anything else
+    """
+    codes = np.frombuffer("".join(values).encode("ascii", "replace"), dtype=np.uint8).reshape(-1, width)
+    digits = codes.astype(np.int64) - ord("0")
+    digits[(digits < 0) | (digits > 9)] = -1
+    digits[:, -1][codes[:, -1] == ord("X")] = 10
+    return digits
+
+
+def validate(df):
+    """
+    Validate a whole file dataframe.
+    :param df: file dataframe, with the Platform and File_Name columns added
+    :return: ValidationReport
+    """
+    validator = Validator()
+    validator.update(df)
+    return validator.report
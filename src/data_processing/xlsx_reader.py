@@ -0,0 +1,328 @@
+"""
+Streaming reader for the PA-Rights sheet of CRKN/local xlsx files.
+
+pd.read_excel loads the whole workbook through openpyxl in normal mode and infers a dtype for every cell. This reader
+instead streams the sheet XML straight out of the xlsx (zip) archive through parser callbacks (no element tree),
+converts every cell to a string and hands the rows out in batches - so it is several times faster. Large files are
+written to the database batch by batch (see chunked_ingest.ingest_xlsx), so memory is bounded by the batch size rather
+than the size of the workbook.
+"""
+import datetime
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+# Number of data rows in each batch
+BATCH_SIZE = 5000
+
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+ROW_TAG = f"{MAIN_NS}row"
+CELL_TAG = f"{MAIN_NS}c"
+VALUE_TAG = f"{MAIN_NS}v"
+TEXT_TAG = f"{MAIN_NS}t"
+
+# Built-in number formats that display dates/times
+BUILTIN_DATE_FORMATS = set(range(14, 23)) | set(range(27, 37)) | set(range(45, 48)) | set(range(50, 59))
+
+
+def cell_to_string(value):
+    """
+    Convert a cell value to the string stored in the database.
+    :param value: cell value
+    :return: string, or None for an empty cell
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return str(value)
+
+
+def number_to_string(text):
+    """
+    Convert the text of a numeric cell to a string, without a trailing .0 for whole numbers.
+    :param text: number as stored in the sheet XML (e.g. "2020", "1.5", "9.780306406157E12")
+    :return: string
+    """
+    try:
+        return str(int(text))
+    except ValueError:
+        return cell_to_string(float(text))
+
+
+def column_index(reference):
+    """
+    Get the 0-based column index of a cell reference.
+    :param reference: cell reference such as "AB12"
+    :return: column index (27 for "AB12")
+    """
+    index = 0
+    for character in reference:
+        if character.isdigit():
+            break
+        index = index * 26 + ord(character.upper()) - 64
+    return index - 1
+
+
+def is_date_format(format_code):
+    """
+    Check if a custom number format displays a date or time.
+    :param format_code: number format code, e.g. "yyyy-mm-dd h:mm:ss"
+    :return: True for date/time formats
+    """
+    # Ignore quoted text, escaped characters and [colour]/[condition] sections
+    code = re.sub(r'"[^"]*"|\\.|\[[^\]]*\]', "", format_code)
+    return re.search(r"[dmyhs]", code, re.IGNORECASE) is not None
+
+
+class SheetHandler:
+    """
+    Parser target for the sheet XML - builds each row's values from the parser callbacks, without building a tree.
+    Completed rows are collected in rows as (row number or None, values).
+    """
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.rows = []
+        self.values = None
+        self.row_number = None
+        self.cell_type = None
+        self.style = None
+        self.reference = None
+        self.text = []
+        self.collecting = False
+
+    def start(self, tag, attributes):
+        if tag == CELL_TAG:
+            self.cell_type = attributes.get("t", "n")
+            self.style = attributes.get("s")
+            self.reference = attributes.get("r")
+            self.text = []
+        elif tag == VALUE_TAG or tag == TEXT_TAG:
+            self.collecting = True
+        elif tag == ROW_TAG:
+            self.values = []
+            row_number = attributes.get("r")
+            self.row_number = int(row_number) if row_number else None
+
+    def data(self, text):
+        if self.collecting:
+            self.text.append(text)
+
+    def end(self, tag):
+        if tag == VALUE_TAG or tag == TEXT_TAG:
+            self.collecting = False
+        elif tag == CELL_TAG:
+            values = self.values
+            if self.reference:
+                index = column_index(self.reference)
+                if index > len(values):
+                    values.extend([None] * (index - len(values)))
+            values.append(self.sheet.cell_value(self.cell_type, self.style, "".join(self.text)))
+        elif tag == ROW_TAG:
+            self.rows.append((self.row_number, self.values))
+
+    def close(self):
+        pass
+
+
+class PARightsSheet:
+    """
+    Open PA-Rights sheet of an xlsx file.
+    platform - value of cell A1
+    header - column names from the header row (third row)
+    size, bytes_read - size of the sheet XML and how much of it has been read, for progress
+    Use as a context manager so the file is closed, and iterate over batches() for the data rows.
+    Raises KeyError if the sheet does not exist, zipfile.BadZipFile if the file is not an xlsx file.
+    """
+
+    def __init__(self, file, sheet_name="PA-Rights"):
+        self.archive = zipfile.ZipFile(file)
+        try:
+            sheet_path, parts = self.find_parts(sheet_name)
+            self.shared_strings = self.read_shared_strings(parts.get("sharedStrings"))
+            self.date_styles = self.read_date_styles(parts.get("styles"))
+        except BaseException:
+            self.archive.close()
+            raise
+        self.size = self.archive.getinfo(sheet_path).file_size
+        self.bytes_read = 0
+        self.rows = self.iter_rows(sheet_path)
+
+        # Preamble - platform in A1, a row that is skipped, then the header row
+        first_row = next(self.rows, [])
+        self.platform = first_row[0] if first_row else None
+        next(self.rows, None)
+        header = next(self.rows, [])
+        # Drop trailing empty header cells (formatting can extend the sheet past the data)
+        while header and header[-1] is None:
+            header.pop()
+        self.header = header
+
+    def find_parts(self, sheet_name):
+        """
+        Find the archive paths of the sheet and of the workbook parts it needs.
+        :param sheet_name: name of the sheet
+        :return: (sheet path, dictionary of part type -> path, e.g. "styles")
+        """
+        workbook = ET.fromstring(self.archive.read("xl/workbook.xml"))
+        properties = workbook.find(f"{MAIN_NS}workbookPr")
+        self.date1904 = properties is not None and properties.get("date1904") in ("1", "true")
+
+        targets = {}
+        parts = {}
+        relationships = ET.fromstring(self.archive.read("xl/_rels/workbook.xml.rels"))
+        for relationship in relationships.iter(f"{PACKAGE_REL_NS}Relationship"):
+            target = relationship.get("Target")
+            # Targets are either absolute within the archive or relative to xl/
+            path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+            targets[relationship.get("Id")] = path
+            parts[relationship.get("Type").split("/")[-1]] = path
+
+        for sheet in workbook.iter(f"{MAIN_NS}sheet"):
+            if sheet.get("name") == sheet_name:
+                return targets[sheet.get(f"{REL_NS}id")], parts
+        raise KeyError(sheet_name)
+
+    def read_shared_strings(self, path):
+        """
+        Read the shared string table.
+        :param path: archive path of sharedStrings.xml, or None if the workbook has none
+        :return: list of strings
+        """
+        strings = []
+        if path is None:
+            return strings
+        with self.archive.open(path) as file:
+            for event, element in ET.iterparse(file):
+                if element.tag == f"{MAIN_NS}si":
+                    # Plain text is in <t>, rich text is split over several <r><t> runs (phonetic <rPh> is skipped)
+                    text = element.findtext(f"{MAIN_NS}t")
+                    if text is None:
+                        text = "".join(run.findtext(f"{MAIN_NS}t") or "" for run in element.findall(f"{MAIN_NS}r"))
+                    strings.append(text)
+                    element.clear()
+        return strings
+
+    def read_date_styles(self, path):
+        """
+        Find the cell styles that display numbers as dates.
+        :param path: archive path of styles.xml, or None if the workbook has none
+        :return: set of style indices
+        """
+        if path is None:
+            return set()
+        styles = ET.fromstring(self.archive.read(path))
+        date_formats = set(BUILTIN_DATE_FORMATS)
+        for number_format in styles.iter(f"{MAIN_NS}numFmt"):
+            if is_date_format(number_format.get("formatCode", "")):
+                date_formats.add(int(number_format.get("numFmtId")))
+        cell_formats = styles.find(f"{MAIN_NS}cellXfs")
+        if cell_formats is None:
+            return set()
+        return {index for index, xf in enumerate(cell_formats.findall(f"{MAIN_NS}xf"))
+                if int(xf.get("numFmtId", 0)) in date_formats}
+
+    def serial_to_string(self, text):
+        """
+        Convert an Excel date serial number to a date string.
+        :param text: serial number as stored in the sheet XML
+        :return: "YYYY-MM-DD HH:MM:SS"
+        """
+        epoch = datetime.datetime(1904, 1, 1) if self.date1904 else datetime.datetime(1899, 12, 30)
+        value = epoch + datetime.timedelta(days=float(text))
+        # Round to the nearest second - serials are floating point
+        value = (value + datetime.timedelta(microseconds=500000)).replace(microsecond=0)
+        return cell_to_string(value)
+
+    def cell_value(self, cell_type, style, text):
+        """
+        Get the string value of a cell.
+        :param cell_type: t attribute of the <c> element ("n" if missing)
+        :param style: s attribute of the <c> element (None if missing)
+        :param text: text of the <v> element, or of the <t> elements of an inline string
+        :return: string, or None for an empty cell
+        """
+        if cell_type == "inlineStr":
+            return text
+        if not text:
+            return None
+        if cell_type == "s":
+            return self.shared_strings[int(text)]
+        if cell_type == "n":
+            if style is not None and int(style) in self.date_styles:
+                return self.serial_to_string(text)
+            return number_to_string(text)
+        if cell_type == "b":
+            return "True" if text == "1" else "False"
+        # str (formula result), e (error), d (ISO date)
+        return text
+
+    def iter_rows(self, sheet_path, read_size=64 * 1024):
+        """
+        Stream the rows of the sheet. Rows missing from the XML (empty rows) are yielded as empty lists.
+        The XML is parsed with parser callbacks (SheetHandler) rather than into an element tree.
+        :param sheet_path: archive path of the sheet XML
+        :param read_size: number of bytes fed to the parser at a time
+        :return: generator of lists of cell strings (or None)
+        """
+        handler = SheetHandler(self)
+        parser = ET.XMLParser(target=handler)
+        expected_row = 1
+        with self.archive.open(sheet_path) as file:
+            while True:
+                data = file.read(read_size)
+                self.bytes_read += len(data)
+                if data:
+                    parser.feed(data)
+                else:
+                    parser.close()
+                for row_number, values in handler.rows:
+                    if row_number is None:
+                        row_number = expected_row
+                    while expected_row < row_number:
+                        yield []
+                        expected_row += 1
+                    yield values
+                    expected_row = row_number + 1
+                handler.rows = []
+                if not data:
+                    break
+
+    def batches(self, batch_size=BATCH_SIZE):
+        """
+        Yield the data rows in batches, every value converted to a string (or None).
+        Fully empty rows are skipped.
+        :param batch_size: number of rows per batch
+        :return: generator of lists of rows (lists the length of the header)
+        """
+        width = len(self.header)
+        batch = []
+        for row in self.rows:
+            values = row[:width]
+            if all(value is None for value in values):
+                continue
+            values.extend([None] * (width - len(values)))
+            batch.append(values)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        self.rows.close()
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
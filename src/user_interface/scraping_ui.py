@@ -1,7 +1,7 @@
-from PyQt6.QtCore import QTimer, Qt
-from PyQt6.QtWidgets import QDialog, QVBoxLayout, QProgressBar, QMessageBox
-from src.data_processing.Scraping import ScrapingThread
+from PyQt6.QtWidgets import QMessageBox, QLabel
+from src.data_processing.Scraping import ScrapingThread, sync_lock
 from src.utility.settings_manager import Settings
+from src.utility.worker import TaskDialog
 
 settings_manager = Settings()
 language = settings_manager.get_setting("language")
@@ -9,63 +9,87 @@ language = settings_manager.get_setting("language")
 def scrapeCRKN():
     global language 
     language = settings_manager.get_setting("language")
+    # Only one CRKN sync at a time - the sync scheduler may be running one in the background
+    if sync_lock.locked():
+        dialog = QMessageBox()
+        dialog.setWindowTitle("Database Update" if language == "English" else "Mise à jour de la base de données")
+        dialog.setText("A CRKN update is already running in the background. Its progress is shown on the start screen." if language == "English" else
+                       "Une mise à jour du RCDR est déjà en cours en arrière-plan. Sa progression est affichée sur l'écran d'accueil.")
+        dialog.setIcon(QMessageBox.Icon.Information)
+        dialog.addButton(QMessageBox.StandardButton.Ok)
+        dialog.exec()
+        return
     loading_popup = LoadingPopup()
     loading_popup.exec()
 
-class LoadingPopup(QDialog):
+class LoadingPopup(TaskDialog):
     def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Updating CRKN Database..." if language == "English" else "Mise à jour de la base de données de RCDR...")
-        self.setWindowFlags(Qt.WindowType.Dialog | Qt.WindowType.CustomizeWindowHint | Qt.WindowType.WindowTitleHint)
-                
-        layout = QVBoxLayout(self)
-        
-        self.progress_bar = QProgressBar(self)
-        self.progress_bar.setRange(0, 100)
-        layout.addWidget(self.progress_bar)
+        super().__init__(ScrapingThread(), "Updating CRKN Database..." if language == "English" else "Mise à jour de la base de données de RCDR...")
+        layout = self.layout()
 
-        self.loading_thread = ScrapingThread()
-        self.loading_thread.progress_update.connect(self.update_progress)
-        
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.loading_thread.start)
-        self.loading_thread.file_changes_signal.connect(self.handle_file_changes)
+        # Byte-level progress of the file currently downloading
+        self.download_label = QLabel(self)
+        layout.addWidget(self.download_label)
 
-        self.loading_thread.error_signal.connect(self.handle_error)
+        # Throughput of each sync stage (download, parse, load)
+        self.stage_label = QLabel(self)
+        layout.addWidget(self.stage_label)
 
-        self.timer.start(1000)
+        self.loading_thread.download_progress.connect(self.update_download_progress)
+        self.loading_thread.stage_stats.connect(self.update_stage_stats)
+        self.loading_thread.file_changes_signal.connect(self.handle_file_changes)
+        self.loading_thread.error_signal.connect(self.handle_error)
 
-        self.finished = False
+        self.failed = False
 
-    def update_progress(self, value):
-        self.progress_bar.setValue(value)
-        if value == 100 and not self.finished:
-            self.finished = True
-            self.loading_thread = None
+    def task_finished(self):
+        if not self.failed:
             self.show_popup_once()
-            self.close()
+        super().task_finished()
     
-    def handle_file_changes(self, file_changes):
-        self.timer.stop()
-        reply = QMessageBox.question(self, "Database Update" if language == "English" else "Mise à jour de la base de données", 
-                                     f"There {'is' if file_changes == 1 else 'are'} {file_changes} {'file' if file_changes == 1 else 'files'} to update in the database. Would you like to do the update now?" if language == "English" else 
-                                     f"Il y a {file_changes} {'fichier' if file_changes == 1 else 'fichers'} à mettre à jour dans la base de données. Souhaitez-vous effectuer la mise à jour maintenant ?",
-                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+    def update_download_progress(self, file_name, done, total):
+        done_mb = done / (1024 * 1024)
+        if total:
+            self.download_label.setText(f"{file_name}: {done_mb:.1f} / {total / (1024 * 1024):.1f} MB")
+        else:
+            self.download_label.setText(f"{file_name}: {done_mb:.1f} MB")
+
+    def update_stage_stats(self, stats):
+        download = stats["download"]
+        parse = stats["parse"]
+        load = stats["load"]
+        self.stage_label.setText(
+            f"{'Download' if language == 'English' else 'Téléchargement'}: {download['units_per_second'] / (1024 * 1024):.1f} MB/s | "
+            f"{'Parse' if language == 'English' else 'Analyse'}: {parse['items']} ({parse['items_per_second']:.2f}/s) | "
+            f"{'Load' if language == 'English' else 'Chargement'}: {load['units_per_second']:.0f} {'rows/s' if language == 'English' else 'lignes/s'}")
+
+    def handle_file_changes(self, plan):
+        file_changes = plan.change_count()
+        dialog = QMessageBox(self)
+        dialog.setWindowTitle("Database Update" if language == "English" else "Mise à jour de la base de données")
+        dialog.setText(f"There {'is' if file_changes == 1 else 'are'} {file_changes} {'file' if file_changes == 1 else 'files'} to update in the database. Would you like to do the update now?" if language == "English" else
+                       f"Il y a {file_changes} {'fichier' if file_changes == 1 else 'fichers'} à mettre à jour dans la base de données. Souhaitez-vous effectuer la mise à jour maintenant ?")
+        # List every planned change under "Show Details"
+        details = ([f"{'New' if language == 'English' else 'Nouveau'}: {file['file_name']} ({file['file_date']})" for file in plan.inserts] +
+                   [f"{'Updated' if language == 'English' else 'Mis à jour'}: {file['file_name']} ({file['file_date']})" for file in plan.updates] +
+                   [f"{'Removed' if language == 'English' else 'Supprimé'}: {file_name}" for file_name in plan.deletes])
+        dialog.setDetailedText("\n".join(details))
+        dialog.setIcon(QMessageBox.Icon.Question)
+        dialog.setStandardButtons(QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        reply = dialog.exec()
         if reply == QMessageBox.StandardButton.Yes:
             self.loading_thread.receive_response("Y")
         else:
             self.loading_thread.receive_response("N")
             
     def handle_error(self, error_msg):
-        self.timer.stop()
+        self.failed = True
         dialog = QMessageBox(self)
         dialog.setWindowTitle("Error" if language == "English" else "Erreur")
         dialog.setText(error_msg)
         dialog.setIcon(QMessageBox.Icon.Critical)
         dialog.addButton(QMessageBox.StandardButton.Ok)
         dialog.exec()
-        self.finished = True
-        self.close()
 
     def show_popup_once(self):
         dialog = QMessageBox(self)
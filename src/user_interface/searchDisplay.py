@@ -13,23 +13,23 @@ settings_manager = Settings()
 class searchDisplay(QDialog):
     _instance = None
     @classmethod
-    def get_instance(cls, arg1, arg2):
+    def get_instance(cls, arg1, arg2, arg3=None):
         if not cls._instance:
-            cls._instance = cls(arg1, arg2)
+            cls._instance = cls(arg1, arg2, arg3)
         return cls._instance
     
     @classmethod
-    def replace_instance(cls, arg1, arg2):
+    def replace_instance(cls, arg1, arg2, arg3=None):
         if cls._instance:
             # Remove the previous instance's reference from its parent widget
             cls._instance.setParent(None)
             # Explicitly delete the previous instance
             del cls._instance
             print("Deleting instance")
-        cls._instance = cls(arg1, arg2)
+        cls._instance = cls(arg1, arg2, arg3)
         return cls._instance
 
-    def __init__(self, widget, results):
+    def __init__(self, widget, results, search_query=None):
         super(searchDisplay, self).__init__()
         language_value = settings_manager.get_setting("language").lower()
         ui_file = os.path.join(os.path.dirname(__file__), f"{language_value}_searchDisplay.ui")
@@ -40,6 +40,8 @@ class searchDisplay(QDialog):
         self.exportButton.clicked.connect(self.export_data_handler)
         self.widget = widget
         self.results = results
+        # (query, terms, searchTypes) of the search, for exports
+        self.search_query = search_query
         self.original_widget_values = None
         self.column_labels = ["Access", "File_Name", "Platform", "Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name", "title_metadata_last_modified"]
 
@@ -74,7 +76,7 @@ class searchDisplay(QDialog):
                 self.tableWidget.setItem(row_number, column_number, QTableWidgetItem(str(data)))
 
     def export_data_handler(self):
-        export_data(self.results, self.column_labels)
+        export_data(self.results, self.column_labels, self.search_query)
 
     def update_all_sizes(self):
         original_width = 1200
@@ -1,8 +1,11 @@
 from PyQt6.QtCore import pyqtSignal, QUrl, Qt
 from PyQt6.QtGui import QDesktopServices
 from PyQt6.uic import loadUi
-from PyQt6.QtWidgets import QDialog, QPushButton, QWidget, QTextEdit, QComboBox, QMessageBox
+from PyQt6.QtWidgets import QDialog, QPushButton, QWidget, QTextEdit, QComboBox, QMessageBox, QFileDialog
+from src.data_processing.institution_registry import InstitutionRegistry
 from src.user_interface.scraping_ui import scrapeCRKN
+from src.utility.export import export_holdings_report
+from src.utility.folder_watcher import FolderWatcher
 from src.utility.upload import upload_and_process_file
 from src.utility.settings_manager import Settings
 import os
@@ -47,6 +50,21 @@ class settingsPage(QDialog):
         self.uploadButton = self.findChild(QPushButton, 'uploadButton')
         self.uploadButton.clicked.connect(self.upload_button_clicked)
 
+        # Watch Folder Button - below the upload button, styled like it
+        self.watchFolderButton = QPushButton("Watch Folder" if self.language_value == "english" else "Surveiller", self)
+        self.watchFolderButton.setGeometry(1049, 170, 111, 41)
+        self.watchFolderButton.setStyleSheet(self.uploadButton.styleSheet())
+        self.watchFolderButton.setFont(self.uploadButton.font())
+        self.watchFolderButton.clicked.connect(self.watch_folder_clicked)
+        self.update_watch_folder_button()
+
+        # Holdings Report Button - every title the selected institution has access to
+        self.holdingsReportButton = QPushButton("Holdings Report" if self.language_value == "english" else "Rapport des fonds", self)
+        self.holdingsReportButton.setGeometry(1049, 220, 111, 41)
+        self.holdingsReportButton.setStyleSheet(self.uploadButton.styleSheet())
+        self.holdingsReportButton.setFont(self.uploadButton.font())
+        self.holdingsReportButton.clicked.connect(export_holdings_report)
+
         # Update Button
         self.updateButton = self.findChild(QPushButton, "updateCRKN")
         self.updateButton.clicked.connect(scrapeCRKN)
@@ -106,7 +124,7 @@ class settingsPage(QDialog):
         self.institutionSelection.clear()
 
         # Get the list of institutions from the settings manager
-        institutions = settings_manager.get_institutions()
+        institutions = InstitutionRegistry.get_instance().names()
         # print("institutions:", institutions)  # TEST to make sure
 
         # Populate the combo box with institution names
@@ -164,8 +182,7 @@ class settingsPage(QDialog):
         """
         add_institution_text = self.institutionSelection.currentText()
         
-        all_institutions = settings_manager.get_institutions()
-        if add_institution_text in all_institutions:
+        if add_institution_text in InstitutionRegistry.get_instance():
             QMessageBox.warning(self, "Duplicate institution", "The entered institution already exists.", QMessageBox.StandardButton.Ok)
             return
 
@@ -231,6 +248,31 @@ class settingsPage(QDialog):
     def upload_button_clicked(self):
         upload_and_process_file()
 
+    def update_watch_folder_button(self):
+        folder = settings_manager.get_setting("watch_folder")
+        english = self.language_value == "english"
+        self.watchFolderButton.setToolTip((f"Watching {folder}" if english else f"Surveillance de {folder}") if folder else
+                                          "Upload files dropped into a folder automatically" if english else
+                                          "Charger automatiquement les fichiers déposés dans un dossier")
+
+    def watch_folder_clicked(self):
+        english = self.language_value == "english"
+        current = settings_manager.get_setting("watch_folder") or ""
+        folder = QFileDialog.getExistingDirectory(self, "Select Folder to Watch" if english else "Sélectionner le dossier à surveiller", current)
+        if not folder:
+            # Cancelled - offer to stop watching the current folder
+            if not current:
+                return
+            reply = QMessageBox.question(self, "Watch Folder" if english else "Dossier surveillé",
+                                         f"Stop watching {current}?" if english else f"Arrêter la surveillance de {current} ?",
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if reply != QMessageBox.StandardButton.Yes:
+                return
+            folder = ""
+        settings_manager.update_setting("watch_folder", folder)
+        FolderWatcher.get_instance().set_folder(folder)
+        self.update_watch_folder_button()
+
 
     def set_current_settings_values(self):
         # Set the current language selection
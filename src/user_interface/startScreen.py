@@ -6,8 +6,10 @@ from PyQt6.QtWidgets import QDialog, QButtonGroup, QPushButton, QLineEdit, QMess
     QLabel
 from PyQt6.QtGui import QIcon, QPixmap
 from src.user_interface.settingsPage import settingsPage
+from src.user_interface.sync_scheduler import SyncScheduler
+from src.utility.folder_watcher import FolderWatcher, ImportLogDialog
 from src.data_processing.database import connect_to_database, \
-    close_database, search_database
+    close_database, search_database, get_search_query
 from src.utility.settings_manager import Settings
 import os
 
@@ -43,6 +45,27 @@ class startScreen(QDialog):
         self.internetConnectionLabel = self.findChild(QLabel, 'internetConnection')
         self.updateConnectionStatus(False)
 
+        # Status of the background CRKN sync - click to update now
+        scheduler = SyncScheduler.get_instance()
+        self.syncStatusButton = QPushButton(self)
+        self.syncStatusButton.setFlat(True)
+        self.syncStatusButton.setStyleSheet("text-align: left;")
+        self.syncStatusButton.setGeometry(95, 760, 400, 21)
+        self.updateSyncStatus(scheduler.status)
+        scheduler.status_changed.connect(self.updateSyncStatus)
+        self.syncStatusButton.clicked.connect(scheduler.sync_now)
+
+        # Status of the watched import folder - click to open its log
+        watcher = FolderWatcher.get_instance()
+        self.importLog = None
+        self.watchStatusButton = QPushButton(self)
+        self.watchStatusButton.setFlat(True)
+        self.watchStatusButton.setStyleSheet("text-align: left;")
+        self.watchStatusButton.setGeometry(500, 760, 600, 21)
+        self.updateWatchStatus(watcher.status)
+        watcher.status_changed.connect(self.updateWatchStatus)
+        self.watchStatusButton.clicked.connect(self.showImportLog)
+
         # timer clock that will work with the google time (Qtimer should be used)
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.checkInternetConnection)
@@ -121,6 +144,21 @@ class startScreen(QDialog):
         else:
             self.internetConnectionLabel.setPixmap(QPixmap('resources/red_signal.png'))
 
+    def updateSyncStatus(self, status):
+        self.syncStatusButton.setText(status)
+        self.syncStatusButton.setVisible(bool(status))
+
+    def updateWatchStatus(self, status):
+        self.watchStatusButton.setText(status)
+        self.watchStatusButton.setVisible(bool(status))
+
+    def showImportLog(self):
+        # Non-modal - the log stays open and keeps updating while the app is used
+        if self.importLog is None:
+            self.importLog = ImportLogDialog(self)
+        self.importLog.show()
+        self.importLog.raise_()
+
     def displayInstitutionName(self):
         institution_name = settings_manager.get_setting('institution')
         if institution_name:
@@ -283,9 +321,9 @@ class startScreen(QDialog):
         self.widget.addWidget(settings)
         self.widget.setCurrentIndex(self.widget.currentIndex() + 1)
 
-    def searchToDisplay(self,results):
+    def searchToDisplay(self,results, search_query=None):
         from src.user_interface.searchDisplay import searchDisplay
-        search = searchDisplay.replace_instance(self.widget, results)
+        search = searchDisplay.replace_instance(self.widget, results, search_query)
         self.widget.addWidget(search)
         self.widget.setCurrentIndex(self.widget.currentIndex() + 1)
         # search.display_results_in_table(results) 
@@ -307,7 +345,7 @@ class startScreen(QDialog):
         searchTypeIndex = self.booleanSearchType.currentIndex()
         searchType = "Title" if searchTypeIndex == 0 else "Platform_eISBN" if searchTypeIndex == 1 else "OCN"
         searchTypes = [searchType]
-        query = f"SELECT [{institution}], File_Name, Platform, Title, Publisher, Platform_YOP, Platform_eISBN, OCN, agreement_code, collection_name, title_metadata_last_modified FROM table_name WHERE "
+        query = get_search_query(institution)
 
         if self.sender() == self.textEdit:
             # Trigger the click event of the search button only if the sender is the textEdit
@@ -334,7 +372,8 @@ class startScreen(QDialog):
             QMessageBox.information(self, "No Results Found" if self.language_value == "English" else "Aucun résultat trouvé", "There are no results for the search." if self.language_value == "English" else "Il n'y a aucun résultat pour la recherche.")
             return
 
-        self.searchToDisplay(results)
+        # The search is kept so exports can run it again and stream its rows (see export)
+        self.searchToDisplay(results, (query, terms, searchTypes))
         
 
     
@@ -0,0 +1,131 @@
+from PyQt6.QtCore import QObject, QThread, QTimer, QEvent, pyqtSignal
+from PyQt6.QtWidgets import QApplication
+from src.data_processing.Scraping import ScrapingThread, sync_lock
+from src.utility.settings_manager import Settings
+from src.utility.logger import m_logger
+import time
+
+"""
+Keeps the CRKN data fresh in the background, instead of asking the user to update at start up.
+Every check_interval seconds the scheduler checks if a sync is due (sync_interval_hours since last_CRKN_sync) and the
+app is idle (no input for idle_seconds, no dialog open), and if so runs the sync on a low priority ScrapingThread.
+The sync loads into shadow tables and swaps them in at the end, so searches keep working on the old data until then.
+Only one sync runs at a time (Scraping.sync_lock) - the Update button of the settings page refuses while this one runs.
+Use SyncScheduler.get_instance() - the status text is shown on the start screen.
+"""
+settings_manager = Settings()
+
+# Input events that mean the user is working
+INPUT_EVENTS = {QEvent.Type.KeyPress, QEvent.Type.MouseButtonPress, QEvent.Type.Wheel}
+
+# Hours between syncs if the sync_interval_hours setting is missing (0 turns background syncs off)
+DEFAULT_INTERVAL_HOURS = 24
+
+# Seconds to wait before trying again after a failed sync
+RETRY_DELAY = 15 * 60
+
+
+class SyncScheduler(QObject):
+    status_changed = pyqtSignal(str)
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, check_interval=60, idle_seconds=30):
+        super().__init__()
+        self.check_interval = check_interval
+        self.idle_seconds = idle_seconds
+        self.last_input = time.monotonic()
+        self.retry_at = 0.0
+        self.sync_thread = None
+        self.error = None
+        self.status = ""
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+
+    def start(self):
+        """
+        Start checking for due syncs.
+        """
+        app = QApplication.instance()
+        if app is not None:
+            app.installEventFilter(self)
+        self.timer.start(self.check_interval * 1000)
+        # First check shortly after start up, rather than a full interval later
+        QTimer.singleShot(5000, self.check)
+
+    def eventFilter(self, watched, event):
+        if event.type() in INPUT_EVENTS:
+            self.last_input = time.monotonic()
+        return False
+
+    def is_due(self):
+        """
+        Check if the CRKN data is older than the sync interval.
+        :return: True if a sync should run
+        """
+        if settings_manager.get_setting("allow_CRKN") != "True":
+            return False
+        interval = settings_manager.get_setting("sync_interval_hours")
+        interval = DEFAULT_INTERVAL_HOURS if interval is None else float(interval)
+        if interval <= 0 or time.monotonic() < self.retry_at:
+            return False
+        last_sync = float(settings_manager.get_setting("last_CRKN_sync") or 0)
+        return time.time() - last_sync >= interval * 3600
+
+    def is_idle(self):
+        """
+        Check if the user is not working in the app - no recent input and no dialog open.
+        :return: True if idle
+        """
+        if QApplication.activeModalWidget() is not None or QApplication.activePopupWidget() is not None:
+            return False
+        return time.monotonic() - self.last_input >= self.idle_seconds
+
+    def check(self):
+        if self.sync_thread is None and self.is_due() and self.is_idle():
+            self.sync_now()
+
+    def sync_now(self):
+        """
+        Start a background sync, unless one is already running - this one, or one started from the settings page.
+        """
+        if self.sync_thread is not None or sync_lock.locked():
+            return
+        m_logger.info("Starting background CRKN sync")
+        self.error = None
+        # Changes are applied without asking - the user did not start this sync
+        self.sync_thread = ScrapingThread(auto_confirm=True)
+        self.sync_thread.progress_update.connect(self.update_progress)
+        self.sync_thread.error_signal.connect(self.handle_error)
+        self.sync_thread.finished.connect(self.handle_finished)
+        self.sync_thread.start(QThread.Priority.LowestPriority)
+
+    def update_progress(self, value):
+        english = settings_manager.get_setting("language") == "English"
+        self.set_status(f"{'Updating CRKN data' if english else 'Mise à jour des données du RCDR'}... {value}%")
+
+    def handle_error(self, error_msg):
+        self.error = error_msg
+
+    def handle_finished(self):
+        english = settings_manager.get_setting("language") == "English"
+        self.sync_thread = None
+        if self.error is None:
+            settings_manager.update_setting("last_CRKN_sync", time.time())
+            self.set_status(f"{'CRKN data updated' if english else 'Données du RCDR mises à jour'} "
+                            f"{time.strftime('%Y-%m-%d %H:%M')}")
+        else:
+            m_logger.error(f"Background CRKN sync failed: {self.error}")
+            self.retry_at = time.monotonic() + RETRY_DELAY
+            self.set_status("CRKN update failed - click to retry" if english else
+                            "Échec de la mise à jour du RCDR - cliquez pour réessayer")
+
+    def set_status(self, status):
+        self.status = status
+        self.status_changed.emit(status)
@@ -1,47 +1,334 @@
 from PyQt6.QtWidgets import QFileDialog, QApplication, QMessageBox
-import pandas as pd
-import sys
+from PyQt6.QtCore import pyqtSignal
+from src.data_processing import database
+from src.data_processing.holdings_report import HoldingsReport, HEADERS as HOLDINGS_HEADERS
 from src.utility.logger import m_logger
 from src.utility.settings_manager import Settings
+from src.utility.worker import TaskDialog, WorkerThread
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+import csv
+import datetime
+import gzip
+import os
+import sys
+import time
 
-
+"""
+Export of search results, and of the holdings report of the selected institution (see holdings_report).
+Rows are streamed to the file in batches as they are read - from a cursor running the search again (see
+database.iter_search), or from the results already on screen - instead of being copied into a dataframe first, so
+memory stays flat whatever the number of rows. Files ending in .gz are gzip compressed, and .xlsx files are written
+with openpyxl in write-only mode (see XlsxWriter).
+"""
 settings_manager = Settings()
 
+# Rows written at a time
+EXPORT_BATCH_ROWS = 10_000
+
+# Data rows per xlsx sheet - Excel's limit of 1,048,576 rows, less the header row
+XLSX_MAX_ROWS = 1_048_575
+
+# Number format and width of the xlsx columns - the same for every export, whatever the values of the first rows
+XLSX_COLUMN_FORMATS = {
+    "Platform_YOP": ("0", 12),
+    "Platform_eISBN": ("@", 16),
+    "OCN": ("0", 12),
+    "title_metadata_last_modified": ("yyyy-mm-dd", 12)
+}
+XLSX_TEXT_WIDTHS = {"Title": 60, "Publisher": 30, "collection_name": 40, "File_Name": 40}
 
-def export_data(data, headers):
+
+def export_data(data, headers, search_query=None):
     """
     Export the data in the form of a tsv file
     :param data: data to export - in the form of a list
     :param headers: headers of the columns - in the form of a list
+    :param search_query: (query, terms, searchTypes) of the search the data came from - the search is run again and
+    its rows streamed to the file, instead of the data
     """
     language = settings_manager.get_setting("language")
     app = QApplication.instance()  # Try to get the existing application instance
     if app is None:  # If no instance exists, create a new one
         app = QApplication(sys.argv)
 
-    df = pd.DataFrame(data, columns=headers)
-
     # Get the file path to save the TSV file
     save_path = get_save_path()
 
     if save_path:
-        # Append ".tsv" if the file doesn't have an extension
-        if not save_path.lower().endswith('.tsv'):
-            save_path += '.tsv'
+        exportUI = ExportUI(ExportThread(save_path, headers, results=data, search_query=search_query),
+                            "Exporting..." if language == "English" else "Exportation...")
+        exportUI.exec()
+
+
+def export_holdings_report():
+    """
+    Export the holdings report of the selected institution - every title it has perpetual access to.
+    """
+    language = settings_manager.get_setting("language")
+    app = QApplication.instance()  # Try to get the existing application instance
+    if app is None:  # If no instance exists, create a new one
+        app = QApplication(sys.argv)
+
+    institution = settings_manager.get_setting("institution")
+    if not institution:
+        QMessageBox.information(None, "No institution selected" if language == "English" else "Aucun établissement sélectionné",
+                                "Please select an institution first." if language == "English" else "Veuillez d'abord sélectionner un établissement.")
+        return
 
-        # Save the DataFrame to TSV
-        df.to_csv(save_path, sep="\t", index=False)
-        m_logger.info(f"Data exported to: {save_path}")
-        QMessageBox.information(None, "File Export" if language == "English" else "Exportation de fichiers", f"File has been exported to:\n{save_path}" if language == "English" else f"Le fichier a été exporté vers:\n{save_path}", QMessageBox.StandardButton.Ok)
+    save_path = get_save_path()
+    if save_path:
+        exportUI = ExportUI(HoldingsReportThread(save_path, institution),
+                            "Building Holdings Report..." if language == "English" else "Création du rapport des fonds...")
+        # The titles are only counted as they are written - show a busy bar instead of a percentage
+        exportUI.progress_bar.setRange(0, 0)
+        exportUI.exec()
 
 
 def get_save_path():
     """
     Get the save path of the file to export. This is a path selected by the user in their file structure.
-    :return: The save path.
+    :return: The save path, with the extension of the selected file type added if it has none.
     """
     language = settings_manager.get_setting("language")
     options = QFileDialog.Option.ReadOnly
-    save_path, _ = QFileDialog.getSaveFileName(None, "Save Data" if language == "English" else "Enregistrer le fichier", "", "TSV Files (*.tsv);;All Files (*)" if language == "English" else "Fichiers TSV (*.tsv);;Tous les fichiers (*)", options=options)
+    save_path, selected_filter = QFileDialog.getSaveFileName(None, "Save Data" if language == "English" else "Enregistrer le fichier", "",
+                                                             "TSV Files (*.tsv);;Compressed TSV Files (*.tsv.gz);;Excel Workbook (*.xlsx);;All Files (*)" if language == "English" else
+                                                             "Fichiers TSV (*.tsv);;Fichiers TSV compressés (*.tsv.gz);;Classeur Excel (*.xlsx);;Tous les fichiers (*)", options=options)
 
+    if save_path and not save_path.lower().endswith((".tsv", ".tsv.gz", ".xlsx")):
+        save_path += ".tsv.gz" if "*.tsv.gz" in selected_filter else ".xlsx" if "*.xlsx" in selected_filter else ".tsv"
     return save_path
+
+
+class TsvWriter:
+    """
+    Rows written to a tsv file as they come - gzip compressed if the path ends in .gz.
+    """
+
+    def __init__(self, path, headers):
+        if path.lower().endswith(".gz"):
+            self.file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        else:
+            self.file = open(path, "w", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file, delimiter="\t", lineterminator="\n")
+        self.writer.writerow(headers)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class XlsxWriter:
+    """
+    Rows streamed into an xlsx workbook with openpyxl in write-only mode - every row is written out when it is added,
+    so memory stays the same whatever the number of rows. Columns have fixed formats (XLSX_COLUMN_FORMATS), and the
+    rows continue on a new sheet every XLSX_MAX_ROWS rows.
+    """
+
+    def __init__(self, path, headers, max_rows=None):
+        self.path = path
+        self.headers = headers
+        self.max_rows = XLSX_MAX_ROWS if max_rows is None else max_rows
+        self.workbook = Workbook(write_only=True)
+        # Column index -> number format, for the columns written as formatted cells
+        self.formats = {index: XLSX_COLUMN_FORMATS[header][0] for index, header in enumerate(headers)
+                        if header in XLSX_COLUMN_FORMATS}
+        self.sheet = None
+        self.sheet_rows = 0
+        self.sheets = 0
+        self.add_sheet()
+
+    def add_sheet(self):
+        self.sheets += 1
+        self.sheet = self.workbook.create_sheet("Export" if self.sheets == 1 else f"Export {self.sheets}")
+        self.sheet_rows = 0
+        # Widths must be set before the first row is written
+        for index, header in enumerate(self.headers, start=1):
+            width = XLSX_COLUMN_FORMATS.get(header, (None, XLSX_TEXT_WIDTHS.get(header, 15)))[1]
+            self.sheet.column_dimensions[get_column_letter(index)].width = width
+        self.sheet.freeze_panes = "A2"
+        header_cells = []
+        for header in self.headers:
+            cell = WriteOnlyCell(self.sheet, value=header)
+            cell.font = Font(bold=True)
+            header_cells.append(cell)
+        self.sheet.append(header_cells)
+
+    def cell(self, index, value):
+        if value is None:
+            return None
+        number_format = self.formats[index]
+        if isinstance(value, str):
+            value = ILLEGAL_CHARACTERS_RE.sub("", value)
+        if number_format == "yyyy-mm-dd" and isinstance(value, str):
+            try:
+                value = datetime.date.fromisoformat(value)
+            except ValueError:
+                # Kept as written
+                return value
+        cell = WriteOnlyCell(self.sheet, value=value)
+        cell.number_format = number_format
+        return cell
+
+    def write_rows(self, rows):
+        formats = self.formats
+        for row in rows:
+            if self.sheet_rows >= self.max_rows:
+                self.add_sheet()
+            # Control characters cannot be stored in xlsx - they are dropped
+            self.sheet.append([self.cell(index, value) if index in formats else
+                               ILLEGAL_CHARACTERS_RE.sub("", value) if isinstance(value, str) else value
+                               for index, value in enumerate(row)])
+            self.sheet_rows += 1
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+def open_writer(path, headers):
+    """
+    Open the writer for the type of an export file.
+    :param path: export file path
+    :param headers: column headers
+    :return: writer with write_rows(rows) and close()
+    """
+    if path.lower().endswith(".xlsx"):
+        return XlsxWriter(path, headers)
+    return TsvWriter(path, headers)
+
+
+def export_rows(batches, path, headers, progress_callback=None):
+    """
+    Write batches of rows to an export file, one batch at a time. If writing fails, the partial file is removed.
+    :param batches: iterable of (progress percentage, list of rows)
+    :param path: export file path
+    :param headers: column headers
+    :param progress_callback: function(progress percentage, rows written) called after every batch
+    :return: number of rows written
+    """
+    start = time.monotonic()
+    rows_written = 0
+    writer = open_writer(path, headers)
+    try:
+        for progress, rows in batches:
+            writer.write_rows(rows)
+            rows_written += len(rows)
+            if progress_callback is not None:
+                progress_callback(progress, rows_written)
+        writer.close()
+    except BaseException:
+        writer.close()
+        os.remove(path)
+        raise
+    m_logger.info(f"Exported {rows_written} rows to {path} in {time.monotonic() - start:.1f}s")
+    return rows_written
+
+
+def search_batches(connection, search_query):
+    """
+    Run a search again, in batches read from the cursor.
+    :param connection: database connection object
+    :param search_query: (query, terms, searchTypes)
+    :return: generator of (progress percentage, list of rows)
+    """
+    query, terms, searchTypes = search_query
+    for tables_done, table_count, rows in database.iter_search(connection, query, terms, searchTypes,
+                                                               EXPORT_BATCH_ROWS):
+        yield int(tables_done / table_count * 100), rows
+
+
+def result_batches(results):
+    """
+    Split results already read into batches.
+    :param results: list of rows
+    :return: generator of (progress percentage, list of rows)
+    """
+    for start in range(0, len(results), EXPORT_BATCH_ROWS):
+        rows = results[start:start + EXPORT_BATCH_ROWS]
+        yield int((start + len(rows)) / len(results) * 100), rows
+
+
+class ExportThread(WorkerThread):
+    """
+    Write an export file in the background - the rows of a search run again (search_query), or the given results.
+    """
+    error_signal = pyqtSignal(str)
+
+    def __init__(self, path, headers, results=None, search_query=None):
+        super().__init__()
+        self.path = path
+        self.headers = headers
+        self.results = results
+        self.search_query = search_query
+        self.rows_written = None
+
+    def run_task(self):
+        self.progress_update.emit(0)
+        if self.search_query is None:
+            self.rows_written = export_rows(result_batches(self.results or []), self.path, self.headers,
+                                            self.progress_callback)
+            return
+        connection = database.connect_to_database()
+        try:
+            self.rows_written = export_rows(search_batches(connection, self.search_query), self.path, self.headers,
+                                            self.progress_callback)
+        finally:
+            database.close_database(connection)
+
+    def task_failed(self, error):
+        self.error_signal.emit(str(error))
+
+    def progress_callback(self, progress, rows_written):
+        self.progress_update.emit(progress)
+
+    def summary(self, english=True):
+        return f"File has been exported to:\n{self.path}" if english else f"Le fichier a été exporté vers:\n{self.path}"
+
+
+class HoldingsReportThread(ExportThread):
+    """
+    Write the holdings report of an institution in the background.
+    """
+
+    def __init__(self, path, institution):
+        super().__init__(path, HOLDINGS_HEADERS)
+        self.institution = institution
+        self.report = None
+
+    def run_task(self):
+        connection = database.connect_to_database()
+        try:
+            self.report = HoldingsReport(connection, self.institution)
+            self.rows_written = export_rows(self.report.batches(), self.path, self.headers)
+        finally:
+            database.close_database(connection)
+
+    def summary(self, english=True):
+        return f"{self.report.summary(english)}\n{super().summary(english)}"
+
+
+class ExportUI(TaskDialog):
+    def __init__(self, thread, title):
+        super().__init__(thread, title)
+        self.error = None
+        self.loading_thread.error_signal.connect(self.handle_error)
+
+    def handle_error(self, error_msg):
+        self.error = error_msg
+
+    def task_finished(self):
+        language = settings_manager.get_setting("language")
+        if self.error is not None:
+            QMessageBox.critical(None, "File Export" if language == "English" else "Exportation de fichiers",
+                                 f"The file could not be exported: {self.error}" if language == "English" else
+                                 f"Le fichier n'a pas pu être exporté : {self.error}", QMessageBox.StandardButton.Ok)
+        else:
+            QMessageBox.information(None, "File Export" if language == "English" else "Exportation de fichiers",
+                                    self.loading_thread.summary(language == "English"), QMessageBox.StandardButton.Ok)
+        super().task_finished()
@@ -0,0 +1,218 @@
+from PyQt6.QtCore import QObject, QThread, QTimer, QFileSystemWatcher, pyqtSignal
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPlainTextEdit
+from src.data_processing import database
+from src.utility.upload import UploadThread
+from src.utility.settings_manager import Settings
+from src.utility.logger import m_logger
+import os
+import time
+
+"""
+Watched import folder - vendor files dropped into the folder set in the watch_folder setting are uploaded into the
+local database in the background, the same way as files selected with upload_and_process_file (see UploadThread),
+but without any question or dialog.
+
+The folder is watched with a QFileSystemWatcher, and polled every POLL_INTERVAL seconds as well, since change
+notifications are not delivered for every shared/network folder. A file is only uploaded once its size and
+modification time have stayed the same for watch_settle_seconds, so a file that is still being copied is never read
+half written, and it is uploaded again only when it changes. No scan runs while a manual upload or the CRKN sync
+holds database.write_lock. The results go to a log (ImportLogDialog) instead of a dialog per file.
+Use FolderWatcher.get_instance() - the status text is shown on the start screen.
+"""
+settings_manager = Settings()
+
+SUPPORTED_EXTENSIONS = (".csv", ".tsv", ".xlsx")
+
+# Seconds a file must stay unchanged before it is uploaded, if the watch_settle_seconds setting is missing
+DEFAULT_SETTLE_SECONDS = 5
+
+# Seconds between polls of the folder
+POLL_INTERVAL = 30
+
+# Log entries kept
+MAX_LOG_ENTRIES = 500
+
+
+class FolderWatcher(QObject):
+    status_changed = pyqtSignal(str)
+    log_added = pyqtSignal(str)
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self.folder = ""
+        # File path -> (size, modification time) when the folder was last scanned, and when the file was last uploaded
+        self.seen = {}
+        self.uploaded = {}
+        self.upload_thread = None
+        self.log = []
+        self.status = ""
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.schedule_scan)
+        self.watcher.fileChanged.connect(self.schedule_scan)
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.timeout.connect(self.scan)
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.scan)
+
+    def start(self):
+        """
+        Start watching the folder in the watch_folder setting, if there is one.
+        """
+        self.poll_timer.start(self.poll_interval * 1000)
+        self.set_folder(settings_manager.get_setting("watch_folder") or "")
+
+    def set_folder(self, folder):
+        """
+        Watch another folder (the watch_folder setting is not changed).
+        :param folder: folder path, or "" to stop watching
+        """
+        english = settings_manager.get_setting("language") == "English"
+        paths = self.watcher.directories() + self.watcher.files()
+        if paths:
+            self.watcher.removePaths(paths)
+        self.folder = folder
+        self.seen = {}
+        self.uploaded = {}
+        if not folder:
+            self.set_status("")
+            return
+        if not os.path.isdir(folder):
+            m_logger.error(f"Watched folder {folder} does not exist")
+            self.set_status(f"Watched folder not found: {folder}" if english else
+                            f"Dossier surveillé introuvable : {folder}")
+            return
+        m_logger.info(f"Watching {folder} for local files")
+        self.watcher.addPath(folder)
+        self.set_status(f"Watching {folder}" if english else f"Surveillance de {folder}")
+        self.schedule_scan()
+
+    def settle_seconds(self):
+        settle = settings_manager.get_setting("watch_settle_seconds")
+        return DEFAULT_SETTLE_SECONDS if settle is None else float(settle)
+
+    def schedule_scan(self, *args):
+        # Every change restarts the wait, so a scan runs once the folder has been quiet for a while
+        self.settle_timer.start(int(self.settle_seconds() * 1000))
+
+    def snapshot(self):
+        """
+        Get the size and modification time of every supported file in the folder.
+        :return: dictionary of file path -> (size, modification time)
+        """
+        files = {}
+        try:
+            entries = list(os.scandir(self.folder))
+        except OSError as e:
+            m_logger.error(f"Could not read watched folder {self.folder}: {e}")
+            return files
+        for entry in entries:
+            # Skip hidden files and the lock files Excel writes next to open workbooks (~$name.xlsx)
+            if entry.name.startswith((".", "~$")) or not entry.name.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+        return files
+
+    def scan(self):
+        """
+        Upload the files that are new or changed since they were last uploaded, and have not changed since the
+        previous scan. Files still changing are checked again once they settle.
+        """
+        if not self.folder or self.upload_thread is not None:
+            # A running upload scans again when it finishes
+            return
+        if database.write_lock.locked():
+            # A manual upload or the CRKN sync is writing - the next poll scans again
+            return
+        current = self.snapshot()
+        ready = [path for path, state in current.items()
+                 if self.seen.get(path) == state and self.uploaded.get(path) != state]
+        settling = [path for path, state in current.items() if self.seen.get(path) != state]
+        self.seen = current
+
+        new_files = [path for path in current if path not in self.watcher.files()]
+        if new_files:
+            self.watcher.addPaths(new_files)
+        if settling:
+            self.schedule_scan()
+        if ready:
+            self.upload(ready)
+
+    def upload(self, file_paths):
+        """
+        Upload files on a low priority UploadThread.
+        :param file_paths: paths of the files to upload
+        """
+        m_logger.info(f"Uploading {len(file_paths)} files from the watched folder")
+        for path in file_paths:
+            self.uploaded[path] = self.seen[path]
+        self.upload_thread = UploadThread(file_paths, auto_confirm=True)
+        self.upload_thread.progress_update.connect(self.update_progress)
+        self.upload_thread.log_message.connect(self.add_log)
+        self.upload_thread.finished.connect(self.handle_finished)
+        self.upload_thread.start(QThread.Priority.LowestPriority)
+
+    def update_progress(self, value):
+        english = settings_manager.get_setting("language") == "English"
+        self.set_status(f"{'Importing files from' if english else 'Importation des fichiers de'} {self.folder}... "
+                        f"{value}%")
+
+    def handle_finished(self):
+        english = settings_manager.get_setting("language") == "English"
+        self.upload_thread = None
+        self.set_status(f"{'Watching' if english else 'Surveillance de'} {self.folder} - "
+                        f"{'last import' if english else 'dernière importation'} {time.strftime('%Y-%m-%d %H:%M')}")
+        # Pick up the files that changed during the upload
+        self.scan()
+
+    def add_log(self, message):
+        entry = f"{time.strftime('%Y-%m-%d %H:%M:%S')}\n{message}"
+        self.log = (self.log + [entry])[-MAX_LOG_ENTRIES:]
+        self.log_added.emit(entry)
+
+    def set_status(self, status):
+        self.status = status
+        self.status_changed.emit(status)
+
+
+class ImportLogDialog(QDialog):
+    """
+    Non-modal log of the watched folder imports - stays open, and up to date, while the app is used.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        english = settings_manager.get_setting("language") == "English"
+        self.setWindowTitle("Watched Folder Log" if english else "Journal du dossier surveillé")
+        self.setModal(False)
+        self.resize(600, 400)
+
+        layout = QVBoxLayout(self)
+        self.text = QPlainTextEdit(self)
+        self.text.setReadOnly(True)
+        layout.addWidget(self.text)
+
+        watcher = FolderWatcher.get_instance()
+        for entry in watcher.log:
+            self.add_entry(entry)
+        if not watcher.log:
+            self.text.setPlaceholderText("No files have been imported yet." if english else
+                                         "Aucun fichier n'a encore été importé.")
+        watcher.log_added.connect(self.add_entry)
+
+    def add_entry(self, entry):
+        self.text.appendPlainText(entry + "\n")
@@ -1,5 +1,8 @@
+import contextlib
 import json
 import os
+import tempfile
+import threading
 
 
 '''
@@ -18,6 +21,13 @@ settings_manager.update_setting('CRKN_url', new_url)
 To check the current applied setting use get_setting method and pass the key
 settings_manager.get_setting('institution')
 
+Changes and writes hold a lock, so settings can be changed from worker threads.
+To make several changes with a single write of settings.json, make them in a batch:
+with settings_manager.batch():
+    for institution in new_institutions:
+        settings_manager.add_local_institution(institution)
+settings.json is written to a temporary file that replaces it, so a crash during a write never leaves it half written.
+
 '''
 
 
@@ -48,6 +58,10 @@ class Settings(metaclass=SingletonMeta):
                 settings_file = f"{os.path.abspath(os.path.dirname(__file__))}/settings.json"
             self.settings_file = settings_file
             self.settings = self.load_settings()
+            # Saves are held while a batch is open (see batch)
+            self.lock = threading.RLock()
+            self.batch_depth = 0
+            self.unsaved = False
             self.initialized = True
 
     def load_settings(self):
@@ -67,6 +81,18 @@ class Settings(metaclass=SingletonMeta):
                 "CRKN_institutions": [],
                 "local_institutions": [],
                 "database_name": default_db_path,
+                "download_cache_dir": os.path.join(os.path.dirname(self.settings_file), 'download_cache'),
+                "download_temp_dir": os.path.join(os.path.dirname(self.settings_file), 'download_cache', 'tmp'),
+                "retry_attempts": 3,
+                "retry_backoff": 1.0,
+                "request_timeout": 60,
+                "sync_mode": "incremental",
+                "parse_processes": 0,
+                "streaming_threshold_mb": 100,
+                "sync_interval_hours": 24,
+                "last_CRKN_sync": 0,
+                "watch_folder": "",
+                "watch_settle_seconds": 5,
                 "github_link": "https://github.com/eppenney/eBook-Perpetual-Access-Rights-Tracker"
             }
             # Set the CRKN root url from the CRKN url
@@ -75,9 +101,57 @@ class Settings(metaclass=SingletonMeta):
         return settings
 
     def save_settings(self):
-        """Save the current settings back to the JSON file."""
-        with open(self.settings_file, 'w') as file:
-            json.dump(self.settings, file, indent=4)
+        """Save the current settings back to the JSON file - when the batch ends, if a batch is open."""
+        with self.lock:
+            if self.batch_depth > 0:
+                self.unsaved = True
+                return
+            self.write_settings()
+
+    def write_settings(self):
+        """
+        Write the settings to a temporary file in the same folder, then replace settings.json with it - the file is
+        either the old or the new settings, never a partial write. settings.json keeps its permissions.
+        """
+        with self.lock:
+            folder = os.path.dirname(os.path.abspath(self.settings_file))
+            try:
+                mode = os.stat(self.settings_file).st_mode & 0o777
+            except FileNotFoundError:
+                # New file - the permissions open() would give it
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            descriptor, temp_path = tempfile.mkstemp(prefix=".settings-", suffix=".tmp", dir=folder)
+            try:
+                with os.fdopen(descriptor, 'w') as file:
+                    json.dump(self.settings, file, indent=4)
+                    file.flush()
+                    os.fsync(file.fileno())
+                # mkstemp creates the file readable by its owner only
+                os.chmod(temp_path, mode)
+                os.replace(temp_path, self.settings_file)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(temp_path)
+                raise
+            self.unsaved = False
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Hold the saves of the changes made in the with block, and write the settings once at the end. Batches can be
+        nested - the settings are written when the outermost one ends.
+        """
+        with self.lock:
+            self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.batch_depth -= 1
+                if self.batch_depth == 0 and self.unsaved:
+                    self.write_settings()
 
     def update_setting(self, key, value):
         """
@@ -85,8 +159,9 @@ class Settings(metaclass=SingletonMeta):
         :param key: setting key to update
         :param value: value for new setting
         """
-        self.settings[key] = value
-        self.save_settings()
+        with self.lock:
+            self.settings[key] = value
+            self.save_settings()
 
     def get_setting(self, key):
         """
@@ -115,9 +190,10 @@ class Settings(metaclass=SingletonMeta):
         Set the CRKN URL.
         :param url: new url
         """
-        self.update_setting('CRKN_url', url)
-        self.settings["CRKN_root_url"] = "/".join(url.split("/")[:3])
-        self.save_settings()
+        with self.lock, self.batch():
+            self.update_setting('CRKN_url', url)
+            self.settings["CRKN_root_url"] = "/".join(url.split("/")[:3])
+            self.save_settings()
 
     def set_github_link(self, link):
         """
@@ -138,30 +214,35 @@ class Settings(metaclass=SingletonMeta):
         Add institution to local list.
         :param institution: new institution
         """
-        self.settings["local_institutions"].append(institution)
-        self.save_settings()
+        with self.lock:
+            self.settings["local_institutions"].append(institution)
+            self.save_settings()
 
     def remove_local_institution(self, institution):
         """
         Remove institution from local list.
         :param institution: institution to remove
         """
-        self.settings["local_institutions"].remove(institution)
-        self.save_settings()
+        with self.lock:
+            self.settings["local_institutions"].remove(institution)
+            self.save_settings()
 
     def add_CRKN_institutions(self, institutions):
         """
         Add CRKN institutions to CRKN_institutions if they are not already in it.
         :param institutions: list of CRKN institutions from CRKN file
         """
-        for inst in institutions:
-            if inst not in self.settings.get("CRKN_institutions"):
-                self.settings.get("CRKN_institutions").append(inst)
-        self.save_settings()
+        with self.lock:
+            known = set(self.settings.get("CRKN_institutions"))
+            for inst in institutions:
+                if inst not in known:
+                    known.add(inst)
+                    self.settings.get("CRKN_institutions").append(inst)
+            self.save_settings()
 
     def get_institutions(self):
         """
-        Get combined list of CRKN and local institutions
+        Get combined list of CRKN and local institutions (see InstitutionRegistry for lookups)
         :return: list - containing CRKN_institutions and local_institutions
         """
         return self.settings.get("local_institutions") + self.settings.get("CRKN_institutions")
@@ -1,10 +1,15 @@
-from PyQt6.QtWidgets import QFileDialog, QApplication, QMessageBox, QDialog, QVBoxLayout, QProgressBar
-from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal
-from src.data_processing import database, Scraping
+from PyQt6.QtWidgets import QFileDialog, QApplication, QMessageBox
+from PyQt6.QtCore import pyqtSignal
+from src.data_processing import chunked_ingest, database, Scraping, table_sync
+from src.data_processing.download_cache import hash_file
+from src.data_processing.institution_registry import InstitutionRegistry
+from src.data_processing.sync_pipeline import SyncPipeline, get_parse_processes
+import os
 import sys
 import datetime
 from src.utility.logger import m_logger
 from src.utility.settings_manager import Settings
+from src.utility.worker import TaskDialog, WorkerThread
 
 
 settings_manager = Settings()
@@ -33,32 +38,13 @@ def upload_and_process_file():
         uploadUI.exec()
 
 
-class UploadUI(QDialog):
+class UploadUI(TaskDialog):
     def __init__(self, file_paths):
-        super().__init__()
-        self.setWindowTitle("Processing File..." if language == "English" else "Fichier en cours de traitement...")
-        self.setWindowFlags(Qt.WindowType.Dialog | Qt.WindowType.CustomizeWindowHint | Qt.WindowType.WindowTitleHint)
-                
-        layout = QVBoxLayout(self)
-        
-        self.progress_bar = QProgressBar(self)
-        self.progress_bar.setRange(0, 100)
-        layout.addWidget(self.progress_bar)
-
-        self.loading_thread = UploadThread(file_paths)
-        
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.loading_thread.start)
-
-        self.loading_thread.progress_update.connect(self.update_progress)
+        super().__init__(UploadThread(file_paths), "Processing File..." if language == "English" else "Fichier en cours de traitement...")
         self.loading_thread.error_signal.connect(self.handle_error)
         self.loading_thread.get_answer_yes_no.connect(self.get_answer_yes_no)
         self.loading_thread.get_okay.connect(self.get_okay)
 
-        self.timer.start(1000)
-
-        self.finished = False
-
     def handle_error(self, title, error_msg):
         m_logger.error(error_msg)
         QMessageBox.critical(None, title, error_msg, QMessageBox.StandardButton.Ok)
@@ -66,11 +52,7 @@ class UploadUI(QDialog):
 
     def update_progress(self, value):
         m_logger.info(f"File upload progress at {value}%")
-        self.progress_bar.setValue(value)
-        if value == 100 and not self.finished:
-            self.finished = True
-            self.loading_thread = None
-            self.close()
+        super().update_progress(value)
 
     def get_answer_yes_no(self, title, body):
         m_logger.info(body)
@@ -84,145 +66,302 @@ class UploadUI(QDialog):
         self.loading_thread.receive_response(True)
 
 
-class UploadThread(QThread):
-    def __init__(self, file_paths):
+class UploadThread(WorkerThread):
+    """
+    Upload the selected files into the local database.
+    Every question (replace a file, add new institutions) is asked up front, from the file names and header rows only.
+    The files are then run through a SyncPipeline: hashed, parsed and validated in worker processes, and loaded by this
+    thread on a single connection, so no worker ever waits on a dialog. The results are shown in one summary at the end.
+    With auto_confirm (files from the watched folder - see folder_watcher), nothing is asked: changed files replace the
+    stored ones, files identical to the stored ones are skipped without a message, files with new institutions are
+    not uploaded, and the results are sent with log_message instead of a dialog.
+    """
+
+    def __init__(self, file_paths, auto_confirm=False):
         super().__init__()
         self.file_paths = file_paths
         self.file_length = len(file_paths)
-        self.currentValue = 0
-        self.one_file_progress_value = (1 / self.file_length) * 100
+        self.auto_confirm = auto_confirm
 
-    progress_update = pyqtSignal(int)
     error_signal = pyqtSignal(str, str) 
     get_answer_yes_no = pyqtSignal(str, str) 
     get_okay = pyqtSignal(str, str)
+    log_message = pyqtSignal(str)
 
-    def run(self):
+    def run_task(self):
         self.process_files()
 
+    def task_failed(self, error):
+        self.report(self.error_signal, "Error" if language == "English" else "Erreur",
+                    f"An error occurred during file processing: {str(error)}" if language == "English" else
+                    f"Une erreur s'est produite lors du traitement du fichier: {str(error)}")
+
+    def report(self, signal, title, body):
+        """
+        Show a result - in a dialog, or in the log of the watched folder with auto_confirm.
+        :param signal: error_signal or get_okay
+        :param title: dialog title
+        :param body: message
+        """
+        if self.auto_confirm:
+            self.log_message.emit(body)
+        else:
+            self.ask(signal, title, body)
+
     def process_files(self):
-        for i in range(self.file_length):
-            self.currentValue = i * self.one_file_progress_value
-            self.progress_update.emit(int(self.currentValue))
-            self.process_file(self.file_paths[i])
+        self.progress_update.emit(0)
+        connection = database.connect_to_database()
+        # Databases created before the file catalog had hash columns
+        database.create_file_name_tables(connection)
+        try:
+            jobs, messages = self.ask_questions(connection)
+            errors = []
+            if jobs:
+                # Wait for the other background writers (CRKN sync, watched folder) to finish
+                with database.write_lock:
+                    errors = self.load_files(jobs, connection, messages)
+        finally:
+            database.close_database(connection)
+
+        # One summary of every file, instead of a dialog per file
+        if errors:
+            self.report(self.error_signal, "Error" if language == "English" else "Erreur",
+                        "\n\n".join(errors + messages))
+        elif messages:
+            self.report(self.get_okay, "File Upload" if language == "English" else "Chargement de fichiers",
+                        "\n\n".join(messages))
         self.progress_update.emit(100)
 
-    def process_file(self, file_path):
+    def ask_questions(self, connection):
         """
-        Process file and store in local database - similar to Scraping.download_files, but for local files
-        :param file_path: string containing the path to the file 
+        Ask every question about the selected files before any of them is parsed - whether to replace files that are
+        already in the local database, and whether to add institutions that are not on either list.
+        :param connection: database connection object
+        :return: (list of job dictionaries for the files to upload, list of messages for the files that were skipped)
         """
-        app = QApplication.instance()  # Try to get the existing application instance
-        if app is None:  # If no instance exists, create a new one
-            app = QApplication(sys.argv)
+        date = datetime.datetime.now().strftime("%Y_%m_%d")
+        cancelled = 'This file will not be uploaded' if language == 'English' else 'Ce fichier ne sera pas chargé'
+        jobs = []
+        messages = []
+        names = set()
+        stored_hashes = database.get_file_hashes(connection, "local") if self.auto_confirm else {}
+        for file_path in self.file_paths:
+            file_name_with_ext = os.path.basename(file_path)
+            file_name = file_name_with_ext.split(".")
+            if file_name[0] in names:
+                messages.append(f"{file_name_with_ext}\n" + (
+                    "Another selected file has the same name. " if language == "English" else
+                    "Un autre fichier sélectionné porte le même nom. ") + cancelled)
+                continue
+            names.add(file_name[0])
+
+            # Check if local file is already in database, and if so, if they want to replace it
+            command = Scraping.compare_file([file_name[0], date], "local", connection)
+            content_hash = None
+            if command == "UPDATE" and self.auto_confirm:
+                # Watched folder - replace the stored file, unless it is the same file seen again
+                content_hash = hash_file(file_path)
+                if content_hash == stored_hashes.get(file_name[0], (None, None))[0]:
+                    m_logger.info(f"{file_name_with_ext} is already in the local database, skipping it")
+                    continue
+            elif command == "UPDATE":
+                if self.ask(self.get_answer_yes_no, "Replace File" if language == "English" else "Remplacer le fichier",
+                            f"{file_name_with_ext}\nA file with the same name is already in the local database. Would you like to replace it with the new file?" 
+                            if language == "English" else f"{file_name_with_ext}\nUn fichier du même nom se trouve déjà dans la base de données locale. Souhaitez-vous le remplacer par le nouveau fichier ?") == False:
+                    messages.append(f"{file_name_with_ext}\n{cancelled}")
+                    continue
+
+            header = Scraping.read_file_header(".".join(file_name), file_path) or []
+            jobs.append({"file_name_with_ext": file_name_with_ext, "file_name": ".".join(file_name),
+                         "table": file_name[0], "path": file_path, "date": date, "command": command,
+                         "content_hash": content_hash, "new_institutions": filter_new_institutions(header[8:])})
+
+        # If there are new institutions, check if the user wants to add them.
+        # If no, the files with new institutions are not uploaded
+        new_institutions = list(dict.fromkeys(institution for job in jobs for institution in job["new_institutions"]))
+        if len(new_institutions) > 0 and self.auto_confirm:
+            # Institutions are only added to the local list when the user says so
+            messages += [f"{job['file_name_with_ext']}\n" + (
+                f"This file has institutions that are not on the CRKN or local list ({', '.join(job['new_institutions'])}). Upload it from the settings page to add them. "
+                if language == "English" else
+                f"Ce fichier contient des institutions qui ne sont pas sur la liste du RCDR ou la liste locale ({', '.join(job['new_institutions'])}). Chargez-le depuis la page des paramètres pour les ajouter. ")
+                + cancelled for job in jobs if job["new_institutions"]]
+            jobs = [job for job in jobs if not job["new_institutions"]]
+        elif len(new_institutions) > 0: # Get a display string of 5 institutions
+            new_institutions_display = '\n'.join(new_institutions[:5]) 
+            if len(new_institutions) > 5:
+                new_institutions_display += '...'
+            answer = self.ask(self.get_answer_yes_no, "New Institutions", f"{len(new_institutions)} institution name{'s' if len(new_institutions) > 1 else ''} found that " +
+                              f"{'are' if len(new_institutions) > 1 else 'is'} not a CRKN institution and {'are' if len(new_institutions) > 1 else 'is'} not on the list of local institutions.\n" +
+                              f"{new_institutions_display}\n" +
+                              "Would you like to add them to the local list? \n'No' - The files with new institutions will not be uploaded. \n'Yes' - The new institution names will be added as options" + 
+                              " and will be available in the settings menu.")
+            if answer == False:
+                messages += [f"{job['file_name_with_ext']}\n{cancelled}" for job in jobs if job["new_institutions"]]
+                jobs = [job for job in jobs if not job["new_institutions"]]
+            else:
+                # Add new institutions - settings.json is written once
+                InstitutionRegistry.get_instance().add_local_institutions(new_institutions)
+        return jobs, messages
+
+    def load_files(self, jobs, connection, messages):
+        """
+        Parse and validate the files in worker processes, and load them into the local database on this thread.
+        Files whose bytes or rows are the same as the stored version only have their date and hashes updated. New files
+        whose bytes or rows are the same as another local file (the same spreadsheet under a new name) are not loaded.
+        :param jobs: job dictionaries from ask_questions
+        :param connection: database connection object - the only writer
+        :param messages: list the message of every uploaded file is added to
+        :return: list of error messages of the files that could not be uploaded
+        """
+        stored_hashes = database.get_file_hashes(connection, "local")
+        loaded = []
+        # ("content" or "rows", hash) -> local file with those bytes or rows, kept up to date as files are loaded
+        known_files = {}
+
+        def remember(table, content_hash, row_hash):
+            for key in [key for key, known_table in known_files.items() if known_table == table]:
+                del known_files[key]
+            for key in (("content", content_hash), ("rows", row_hash)):
+                if key[1] is not None:
+                    known_files[key] = table
+
+        def find_duplicate(job, row_hash):
+            # Replacing a file with the contents of another one is what the user asked for
+            if job["command"] != "INSERT INTO":
+                return None
+            for key in (("content", job["content_hash"]), ("rows", row_hash)):
+                table = known_files.get(key) if key[1] is not None else None
+                if table is not None and table != job["table"]:
+                    return table
+            return None
+
+        for table, (content_hash, row_hash) in stored_hashes.items():
+            remember(table, content_hash, row_hash)
+
+        def prepare(job):
+            job = dict(job, content_hash=job["content_hash"] or hash_file(job["path"]),
+                       stored=stored_hashes.get(job["table"], (None, None)) if job["command"] == "UPDATE" else (None, None))
+            # Same bytes as a stored file - not parsed
+            job["duplicate_of"] = find_duplicate(job, None)
+            return job, os.path.getsize(job["path"])
+
+        def load(job):
+            file_df = job["df"]
+            if file_df is None and job["valid_format"] is None:
+                raise Exception("Select only valid xlsx, csv or tsv files." if language == "English" else
+                                "Sélectionnez uniquement les fichiers xlsx, csv ou tsv valides.")
+            if job["valid_format"] is not True:
+                raise Exception(f"{job['valid_format']}\nUpload aborted." if language == "English" else
+                                f"{job['valid_format']}\nChargement interrompu.")
+
+            counts = None
+            row_hash = job["row_hash"]
+            # Checked again here - an earlier file of this upload may have the same bytes or rows
+            duplicate = find_duplicate(job, row_hash)
+            if duplicate is not None:
+                m_logger.info(f"{job['file_name_with_ext']} is identical to local file {duplicate}, not uploading it")
+                messages.append(f"{job['file_name_with_ext']}\nThis file is identical to {duplicate}, which is already in the local database, so it was not uploaded."
+                                if language == "English" else
+                                f"{job['file_name_with_ext']}\nCe fichier est identique à {duplicate}, qui se trouve déjà dans la base de données locale, il n'a donc pas été chargé.")
+                loaded.append(job["table"])
+                self.progress_update.emit(min(99, int(len(loaded) / len(jobs) * 100)))
+                return 0
+            if job.get("streamed") is not None:
+                # Large file - validated and written chunk by chunk, replacing the table
+                result = chunked_ingest.ingest_file(job["file_name"], job["path"], job["streamed"],
+                                                    "local_" + job["table"], connection,
+                                                    progress_callback=self.chunk_progress_callback(len(loaded), len(jobs)),
+                                                    skip_row_hash=job["stored"][1])
+                if isinstance(result, str):
+                    raise Exception(f"{result}\nUpload aborted." if language == "English" else
+                                    f"{result}\nChargement interrompu.")
+                row_hash = result.row_hash
+                if result.written:
+                    counts = result.counts()
+            elif file_df is not None and row_hash != job["stored"][1]:
+                counts = Scraping.upload_to_database(file_df, "local_" + job["table"], connection)
+                if counts is None:
+                    raise Exception("The data could not be written to the database.")
+
+            if counts is None:
+                # Same bytes or same rows as the stored version - nothing to load
+                m_logger.info(f"{job['file_name_with_ext']} is unchanged from the stored version, only updating its metadata")
+                Scraping.update_tables([job["table"], job["date"]], "local", connection, "UPDATE")
+                messages.append(f"{job['file_name_with_ext']}\nThis file is identical to the one already in the local database, so no rows were changed."
+                                if language == "English" else
+                                f"{job['file_name_with_ext']}\nCe fichier est identique à celui qui se trouve déjà dans la base de données locale, aucune ligne n'a donc été modifiée.")
+                rows = 0
+            else:
+                Scraping.update_tables([job["table"], job["date"]], "local", connection, job["command"])
+                messages.append(f"{job['file_name_with_ext']}\nYour file has been uploaded. {counts['inserted']} rows have been added, {counts['updated']} updated and {counts['deleted']} removed."
+                                if language == "English" else
+                                f"{job['file_name_with_ext']}\nVotre fichier a été chargé. {counts['inserted']} lignes ont été ajoutées, {counts['updated']} modifiées et {counts['deleted']} supprimées.")
+                rows = counts["inserted"] + counts["updated"] + counts["unchanged"]
+            database.set_file_hashes(connection, "local", job["table"], job["content_hash"], row_hash)
+            remember(job["table"], job["content_hash"], row_hash)
+            loaded.append(job["table"])
+            self.progress_update.emit(min(99, int(len(loaded) / len(jobs) * 100)))
+            return rows
+
+        pipeline = SyncPipeline(prepare, parse_local_file, load, parse_processes=get_parse_processes(len(jobs)))
+        errors = []
+        for item, stage, error in pipeline.run(jobs):
+            file_name_with_ext = item["file_name_with_ext"] if item is not None else ""
+            errors.append(f"{file_name_with_ext}\nAn error occurred during file processing: {str(error)}" if language == "English" else
+                          f"{file_name_with_ext}\nUne erreur s'est produite lors du traitement du fichier: {str(error)}")
+        return errors
+
+    def chunk_progress_callback(self, done_files, total_files):
+        """
+        Make a progress callback for chunked_ingest.ingest_file, moving the progress bar through the share of the
+        file being loaded.
+        :param done_files: number of files already loaded
+        :param total_files: number of files being uploaded
+        :return: function(rows, bytes_read, bytes_total)
+        """
+        def callback(rows, done, total):
+            fraction = done / total if total else 1
+            self.progress_update.emit(min(99, int((done_files + fraction) / total_files * 100)))
+        return callback
 
-        connection = database.connect_to_database()
 
-        # Get file_name and date for table information
-        file_name_with_ext = file_path.split("/")[-1]
-        file_name = file_name_with_ext.split(".")
-        date = datetime.datetime.now()
-        date = date.strftime("%Y_%m_%d")
-
-        # Check if local file is already in database
-        result = Scraping.compare_file([file_name[0], date], "local", connection)
-
-        self.currentValue += self.one_file_progress_value / 7
-        self.progress_update.emit(int(self.currentValue))
-
-        # If result is update, check if they want to update it
-        if result == "UPDATE":
-            self.get_answer_yes_no.emit("Replace File" if language == "English" else "Remplacer le fichier",
-                                        f"{file_name_with_ext}\nA file with the same name is already in the local database. Would you like to replace it with the new file?" 
-                                        if language == "English" else f"{file_name_with_ext}\nUn fichier du même nom se trouve déjà dans la base de données locale. Souhaitez-vous le remplacer par le nouveau fichier ?")
-            reply = self.wait_for_response()
-            if reply == False:
-                print(language, language == "English")
-                self.error_signal.emit("File Upload Cancelled" if language == "English" else "Chargement de fichier annulé",
-                                        f"{file_name_with_ext}\n{'This file will not be uploaded' if language == 'English' else 'Ce fichier ne sera pas chargé'}")
-                self.wait_for_response()
-                database.close_database(connection)
-                return
-        
-        self.currentValue += self.one_file_progress_value / 7
-        self.progress_update.emit(int(self.currentValue))
+def parse_local_file(job):
+    """
+    Parse an uploaded file into a dataframe and check its format - the parse stage of UploadThread.load_files.
+    Module-level so it can run in a worker process.
+    Files with the same content hash as the stored version or another local file (duplicate_of) are not parsed at all
+    (df is None), and neither are large files (streamed is added - the file type, see chunked_ingest).
+    :param job: job dictionary with content_hash and stored (the (content_hash, row_hash) of the stored version)
+    :return: (job with df, valid_format (True, error string, or None for an unsupported file type) and row_hash
+    added, 1)
+    """
+    job = dict(job)
+    stored_content_hash, stored_row_hash = job["stored"]
+    if job["content_hash"] == stored_content_hash:
+        job.update(df=None, valid_format=True, row_hash=stored_row_hash)
+        return job, 1
+    if job.get("duplicate_of") is not None:
+        job.update(df=None, valid_format=True, row_hash=None)
+        return job, 1
+
+    # Large files are not parsed here - they are validated and written in chunks by the load stage
+    file_type = Scraping.detect_file_type(job["path"], job["file_name"])
+    if chunked_ingest.use_streaming(job["path"], file_type):
+        job.update(df=None, valid_format=True, row_hash=None, streamed=file_type)
+        return job, 1
+
+    # Get our dataframe, check if it's good
+    file_df = file_to_df(job["file_name"], job["path"])
+    if file_df is None:
+        job.update(df=None, valid_format=None, row_hash=None)
+        return job, 1
 
-        try:
-            # Get our dataframe, check if it's good
-            file_df = file_to_df(".".join(file_name), file_path)
-            if file_df is None:
-                self.error_signal.emit("Invalid File Type" if language == "English" else "Type de fichier invalide", 
-                                        f"{file_name_with_ext}\nSelect only valid xlsx, csv or tsv files." if language == "English" else f"{file_name_with_ext}\nSélectionnez uniquement les fichiers xlsx, csv ou tsv valides.")
-                self.wait_for_response()
-                database.close_database(connection)
-                return
-
-            # Check if in correct format
-            valid_file = Scraping.check_file_format(file_df)
-            if valid_file is not True:
-                self.error_signal.emit("Invalid File Format" if language == "English" else "Format de fichier invalide", 
-                                       f"{file_name_with_ext}\n{valid_file}\nUpload aborted." if language == "English" else 
-                                    f"{file_name_with_ext}\n{valid_file}\nChargement interrompu.")
-                self.wait_for_response()
-                database.close_database(connection)
-                return
-            
-            self.currentValue += self.one_file_progress_value / 7
-            self.progress_update.emit(int(self.currentValue))
-            
-            # If there are new institutions, check if the user wants to add them.
-            # If no, cancel upload of file
-            new_institutions = get_new_institutions(file_df)
-            if len(new_institutions) > 0: # Get a display string of 5 institutions
-                new_institutions_display = '\n'.join(new_institutions[:5]) 
-                if len(new_institutions) > 5:
-                    new_institutions_display += '...'
-                self.get_answer_yes_no.emit("New Institutions", f"{len(new_institutions)} institution name{'s' if len(new_institutions) > 1 else ''} found that " +
-                                            f"{'are' if len(new_institutions) > 1 else 'is'} not a CRKN institution and {'are' if len(new_institutions) > 1 else 'is'} not on the list of local institutions.\n" +
-                                            f"{new_institutions_display}\n" +
-                                            "Would you like to add them to the local list? \n'No' - The file will not be uploaded. \n'Yes' - The new institution names will be added as options" + 
-                                            " and will be available in the settings menu.")
-                reply = self.wait_for_response()
-                if reply == False:
-                    self.error_signal.emit("File Upload Cancelled" if language == "English" else "Chargement de fichier annulé",
-                                        f"{file_name_with_ext}\n{'This file will not be uploaded' if language == 'English' else 'Ce fichier ne sera pas chargé'}")
-                    self.wait_for_response()
-                    database.close_database(connection)
-                    return
-            
-            self.currentValue += self.one_file_progress_value / 7
-            self.progress_update.emit(int(self.currentValue))
-            
-            # Add new institutions
-            for institution in new_institutions:
-                settings_manager.add_local_institution(institution)
-            self.currentValue += self.one_file_progress_value / 7
-            self.progress_update.emit(int(self.currentValue))
-
-            Scraping.upload_to_database(file_df, "local_" + file_name[0], connection)
-            self.currentValue += self.one_file_progress_value / 7
-            self.progress_update.emit(int(self.currentValue))
-
-            Scraping.update_tables([file_name[0], date], "local", connection, result)
-            self.currentValue += self.one_file_progress_value / 7
-            self.progress_update.emit(int(self.currentValue) - 1)
-            self.get_okay.emit("File Upload" if language == "English" else "Chargement de fichiers", f"{file_name_with_ext}\nYour file has been uploaded. {len(file_df)} rows have been added." if language == "English" else f"{file_name_with_ext}\nVotre fichier a été chargé. {len(file_df)} lignes ont été ajoutées.")
-            self.wait_for_response()
-
-        except Exception as e:
-            self.error_signal.emit("Error" if language == "English" else "Erreur", f"{file_name_with_ext}\nAn error occurred during file processing: {str(e)}" if language == "English" else f"{file_name_with_ext}\nUne erreur s'est produite lors du traitement du fichier: {str(e)}")
-
-        database.close_database(connection)
-
-    def wait_for_response(self):
-        # This function halts the execution of the thread until response is received
-        self.response = None
-        while self.response is None:
-            self.msleep(100)  # Sleep to avoid busy waiting
-        return self.response
-    
-    def receive_response(self, response):
-        self.response = response
+    # Check if in correct format
+    valid_format = Scraping.check_file_format(file_df)
+    job.update(df=file_df if valid_format is True else None, valid_format=valid_format,
+               row_hash=table_sync.row_hash(file_df) if valid_format is True else None)
+    return job, 1
 
 
 def get_new_institutions(file_df):
@@ -235,16 +374,16 @@ def get_new_institutions(file_df):
     # If no dataframe, there's no new institutions
     if file_df is None:
         return []
-    headers = file_df.columns.to_list()
-    new_inst = []
+    return filter_new_institutions(file_df.columns.to_list()[8:-2])
+
 
-    # For institution in institution section of dataframe
-    for inst in headers[8:-2]:
-        if inst not in settings_manager.get_setting("CRKN_institutions"):
-            if inst not in settings_manager.get_setting("local_institutions"):
-                # If not in either list, add to new list
-                new_inst.append(inst)
-    return new_inst
+def filter_new_institutions(institutions):
+    """
+    Get the institutions that are not in either the CRKN or local list (see InstitutionRegistry)
+    :param institutions: list of institution names (the institution columns of a file)
+    :return: list of new string institutions
+    """
+    return InstitutionRegistry.get_instance().new_institutions(institutions)
 
 
 def file_to_df(file_name, file_path):
@@ -252,20 +391,11 @@ def file_to_df(file_name, file_path):
     Convert a file to a dataframe
     :param file_name: A string of format name.ext
     :param file_path: A string containing the file path.
-    :return: Dataframe or None
+    :return: Dataframe, error string, or None if the file is not an xlsx, csv or tsv file
     """
     m_logger.info(f"Processing file: {file_path}")
-    file_extension = file_name.split(".")[-1]
-    # Convert file into dataframe
-    if file_extension == "csv":
-        file_df = Scraping.file_to_dataframe_csv(file_name, file_path)
-    elif file_extension == "xlsx":
-        file_df = Scraping.file_to_dataframe_excel(file_name, file_path)
-    elif file_extension == "tsv":
-        file_df = Scraping.file_to_dataframe_tsv(file_name, file_path)
-    else:
-        return None
-    return file_df
+    # Convert file into dataframe - type is detected from the file contents
+    return Scraping.file_to_dataframe(file_name, file_path)
 
 
 def remove_local_file(file_name):
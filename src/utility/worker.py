@@ -0,0 +1,101 @@
+"""
+Shared lifecycle of the background tasks (CRKN sync, local file upload) and of the questions they ask the user.
+
+A task is a WorkerThread subclass implementing run_task. When it needs an answer from the user, it calls
+ask(signal, ...): the signal is delivered to the GUI thread (queued, since the sender lives on the worker thread), and
+the worker blocks on a threading.Event until the GUI calls receive_response - no polling, and it resumes as soon as
+the answer is given.
+
+TaskDialog is the modal progress dialog of a task. It starts the task as soon as its event loop is running and closes
+when the task's thread finishes, whether it succeeded, failed, or was cancelled by an answer.
+"""
+import threading
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QProgressBar
+from src.utility.logger import m_logger
+
+
+class WorkerThread(QThread):
+    """
+    Background task run on its own thread - subclasses implement run_task, and report unexpected errors in
+    task_failed. Progress (0-100) is reported with progress_update.
+    """
+    progress_update = pyqtSignal(int)
+
+    def __init__(self):
+        super().__init__()
+        self.response = None
+        self.response_ready = threading.Event()
+
+    def run(self):
+        try:
+            self.run_task()
+        except Exception as e:
+            m_logger.exception(f"{type(self).__name__} failed: {e}")
+            self.task_failed(e)
+
+    def run_task(self):
+        """The work of the task, run on the worker thread."""
+        raise NotImplementedError
+
+    def task_failed(self, error):
+        """
+        Report an exception raised by run_task (already logged).
+        :param error: exception
+        """
+
+    def ask(self, signal, *args):
+        """
+        Ask the GUI something and wait for the answer.
+        :param signal: signal of this thread the GUI answers with receive_response
+        :param args: signal arguments
+        :return: value passed to receive_response
+        """
+        self.response = None
+        self.response_ready.clear()
+        signal.emit(*args)
+        self.response_ready.wait()
+        return self.response
+
+    def receive_response(self, response):
+        """
+        Answer the question the worker is waiting on - called from the GUI thread.
+        :param response: answer
+        """
+        self.response = response
+        self.response_ready.set()
+
+
+class TaskDialog(QDialog):
+    """
+    Modal progress dialog of a WorkerThread. The task is started once the dialog's event loop runs (exec), and the
+    dialog closes when the task's thread finishes - override task_finished to show a result first (then call it).
+    """
+
+    def __init__(self, thread, title):
+        super().__init__()
+        self.setWindowTitle(title)
+        self.setWindowFlags(Qt.WindowType.Dialog | Qt.WindowType.CustomizeWindowHint | Qt.WindowType.WindowTitleHint)
+
+        layout = QVBoxLayout(self)
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setRange(0, 100)
+        layout.addWidget(self.progress_bar)
+
+        self.task_done = False
+        self.loading_thread = thread
+        thread.progress_update.connect(self.update_progress)
+        thread.finished.connect(self.task_finished)
+        QTimer.singleShot(0, thread.start)
+
+    def update_progress(self, value):
+        self.progress_bar.setValue(value)
+
+    def task_finished(self):
+        self.task_done = True
+        self.close()
+
+    def reject(self):
+        # Escape does not close the dialog while its task is still running
+        if self.task_done:
+            super().reject()
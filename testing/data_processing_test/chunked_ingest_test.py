@@ -0,0 +1,118 @@
+import sqlite3
+
+import pytest
+from src.data_processing import chunked_ingest, string_dictionary, table_sync
+from src.data_processing.Scraping import file_to_dataframe, upload_to_database
+from file_reader_test import write_delimited
+from xlsx_reader_test import HEADER, make_workbook
+
+
+def make_rows(count, seed=0):
+    return [[f"Book {i} ({seed})", "Pub", "2020", "9780306406157", f"0{i}", "AG", "Coll", "2024-01-02",
+             "Y" if i % 2 else "N", "N"] for i in range(count)]
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    yield connection
+    connection.close()
+
+
+def rows(connection, table_name):
+    return connection.execute(f"SELECT * FROM [{table_name}] ORDER BY rowid").fetchall()
+
+
+@pytest.mark.parametrize("separator, extension", [(",", "csv"), ("\t", "tsv")])
+def test_chunks_give_the_same_table_as_a_full_read(tmp_path, connection, separator, extension):
+    path = tmp_path / f"file.{extension}"
+    write_delimited(path, make_rows(50), separator)
+    progress = []
+
+    result = chunked_ingest.ingest_delimited(f"file.{extension}", str(path), separator, "streamed", connection,
+                                             chunk_rows=7, progress_callback=lambda *args: progress.append(args))
+
+    df = file_to_dataframe(f"file.{extension}", str(path))
+    upload_to_database(df, "read", connection)
+    assert rows(connection, "streamed") == rows(connection, "read")
+    assert result.columns == df.columns.to_list()
+    assert result.rows == 50
+    assert result.row_hash == table_sync.row_hash(df)
+    # One report per chunk, by rows and bytes
+    assert [rows_done for rows_done, _, _ in progress] == [7, 14, 21, 28, 35, 42, 49, 50]
+    assert progress[-1][1] == progress[-1][2] == path.stat().st_size
+
+
+def test_xlsx_chunks_give_the_same_table_as_a_full_read(tmp_path, connection):
+    path = tmp_path / "file.xlsx"
+    make_workbook(path, make_rows(50))
+    progress = []
+
+    result = chunked_ingest.ingest_file("file.xlsx", str(path), "xlsx", "streamed", connection, chunk_rows=7,
+                                        progress_callback=lambda *args: progress.append(args))
+
+    df = file_to_dataframe("file.xlsx", str(path))
+    upload_to_database(df, "read", connection)
+    assert rows(connection, "streamed") == rows(connection, "read")
+    assert result.rows == 50 and result.row_hash == table_sync.row_hash(df)
+    assert [rows_done for rows_done, _, _ in progress] == [7, 14, 21, 28, 35, 42, 49, 50]
+    assert progress[-1][1] == progress[-1][2]
+    assert chunked_ingest.ingest_file("file.xlsx", str(tmp_path / "file.xlsx"), "xlsx", "other", connection,
+                                      skip_row_hash=result.row_hash).written is False
+
+
+def test_invalid_chunk_leaves_the_table_unchanged(tmp_path, connection):
+    good = tmp_path / "good.csv"
+    write_delimited(good, make_rows(10))
+    chunked_ingest.ingest_delimited("good.csv", str(good), ",", "table", connection)
+    bad_rows = make_rows(30, seed=1)
+    bad_rows[25][0] = ""
+    bad = tmp_path / "bad.csv"
+    write_delimited(bad, bad_rows)
+
+    result = chunked_ingest.ingest_delimited("bad.csv", str(bad), ",", "table", connection, chunk_rows=10)
+
+    # Reported with its row number, after the file was read to the end
+    assert result == "1 error found:\nTitle: Missing title data. Row 29"
+    assert len(rows(connection, "table")) == 10
+    assert {row[0] for row in rows(connection, "table")} == {f"Book {i} (0)" for i in range(10)}
+
+
+def test_invalid_header_is_reported_before_reading_rows(tmp_path, connection):
+    path = tmp_path / "file.csv"
+    path.write_text("Proquest\nPA-Rights\nTitle,Publisher\nBook,Pub\n")
+
+    assert chunked_ingest.ingest_delimited("file.csv", str(path), ",", "table", connection) == \
+        "The header row is incorrect."
+    assert table_sync.get_table_columns(connection, "table") == []
+
+
+def test_same_rows_are_not_written(tmp_path, connection):
+    path = tmp_path / "file.csv"
+    write_delimited(path, make_rows(10))
+    first = chunked_ingest.ingest_delimited("file.csv", str(path), ",", "table", connection)
+    rowids = connection.execute("SELECT rowid FROM [table]").fetchall()
+
+    second = chunked_ingest.ingest_delimited("other.csv", str(path), ",", "table", connection, chunk_rows=3,
+                                             skip_row_hash=first.row_hash)
+
+    assert not second.written
+    assert second.counts() == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 10}
+    assert connection.execute("SELECT rowid FROM [table]").fetchall() == rowids
+    assert connection.execute(f"SELECT DISTINCT {string_dictionary.decode_expression('File_Name')} "
+                              f"FROM [table]").fetchall() == [("file.csv",)]
+
+
+def test_only_large_files_are_streamed(tmp_path, monkeypatch):
+    path = tmp_path / "file.csv"
+    path.write_bytes(b"x" * 2048)
+    monkeypatch.setitem(chunked_ingest.settings_manager.settings, "streaming_threshold_mb", 0.001)
+
+    assert chunked_ingest.use_streaming(str(path), "csv")
+    # Not an xlsx file
+    assert not chunked_ingest.use_streaming(str(path), "xlsx")
+    workbook = tmp_path / "file.xlsx"
+    make_workbook(workbook, make_rows(50))
+    assert chunked_ingest.use_streaming(str(workbook), "xlsx")
+    monkeypatch.setitem(chunked_ingest.settings_manager.settings, "streaming_threshold_mb", 1)
+    assert not chunked_ingest.use_streaming(str(path), "tsv")
@@ -0,0 +1,282 @@
+"""
+Local stand-in for the CRKN website, for testing and benchmarking scraping offline.
+
+MockCRKNServer serves a listing page (listing_url) linking to synthetic PA-Rights files (xlsx, csv or tsv) generated
+with add_file. Behaviour can be injected per server or per request:
+    latency - seconds to wait before answering every request
+    bandwidth - bytes per second the bodies are sent at (None for unlimited)
+    etags - send ETag/Last-Modified headers and answer matching conditional requests with 304
+    fail_next(path, *statuses) - answer the next requests for a path with these error statuses
+    drop_next(path, count) - close the connection half way through the next count bodies of a path
+Every request is logged in requests as (path, status, body bytes sent).
+
+    with MockCRKNServer() as server:
+        server.add_file("Proquest", "2024_01_20_02", rows=1000)
+        settings["CRKN_url"], settings["CRKN_root_url"] = server.listing_url, server.root_url
+"""
+import csv
+import datetime
+import hashlib
+import io
+import threading
+import time
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import openpyxl
+
+HEADER = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name",
+          "title_metadata_last_modified"]
+INSTITUTIONS = ["UPEI", "Dal"]
+
+
+def make_rows(rows, seed=0, institutions=INSTITUTIONS):
+    """
+    Generate synthetic PA-Rights data rows.
+    :param rows: number of rows
+    :param seed: changes the generated titles and Y/N values, so two seeds give different versions of a file
+    :param institutions: institution column names
+    :return: list of rows (header order, then one Y/N per institution)
+    """
+    data = []
+    for i in range(rows):
+        access = ["Y" if (i + seed + j) % 3 else "N" for j in range(len(institutions))]
+        data.append([f"Book {i} ({seed})", f"Publisher {i % 20}", 2000 + i % 25, str(9780306406157 + i * 10),
+                     str(100000 + i), "AG1", f"Collection {i % 5}", datetime.datetime(2024, 1, 1 + i % 28)] + access)
+    return data
+
+
+def make_file(platform, data, file_type="xlsx", institutions=INSTITUTIONS):
+    """
+    Build the contents of a PA-Rights file - platform in A1, a title row, the header row, then the data.
+    :param platform: platform name for cell A1
+    :param data: rows from make_rows
+    :param file_type: xlsx, csv or tsv
+    :param institutions: institution column names
+    :return: bytes
+    """
+    preamble = [[platform], ["Perpetual access rights"], HEADER + list(institutions)]
+    if file_type == "xlsx":
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("PA-Rights")
+        for row in preamble + data:
+            sheet.append(row)
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return buffer.getvalue()
+    text = io.StringIO()
+    writer = csv.writer(text, delimiter="\t" if file_type == "tsv" else ",")
+    for row in preamble + data:
+        writer.writerow([value.strftime("%Y-%m-%d") if isinstance(value, datetime.datetime) else value
+                         for value in row])
+    return text.getvalue().encode("utf-8")
+
+
+class MockCRKNHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server.mock
+        path = self.path.split("?")[0]
+        if server.latency:
+            time.sleep(server.latency)
+
+        status = server.take_failure(path)
+        if status is not None:
+            self.send_body(status, b"error", "text/plain")
+            return
+        if path == "/listing":
+            self.send_body(200, server.listing_page().encode("utf-8"), "text/html; charset=utf-8")
+            return
+        if path not in server.files:
+            self.send_body(404, b"not found", "text/plain")
+            return
+
+        body, etag, last_modified = server.files[path]
+        if server.etags and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            server.log(path, 304, 0)
+            return
+        headers = {"ETag": etag, "Last-Modified": last_modified} if server.etags else {}
+        self.send_body(200, body, "application/octet-stream", headers, drop=server.take_drop(path))
+
+    def send_body(self, status, body, content_type, headers=None, drop=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if drop:
+            self.send_header("Connection", "close")
+        self.end_headers()
+
+        # Dropped connections stop half way through the body
+        limit = len(body) // 2 if drop else len(body)
+        sent = 0
+        bandwidth = self.server.mock.bandwidth
+        chunk_size = max(1, min(16 * 1024, bandwidth // 10)) if bandwidth else 64 * 1024
+        while sent < limit:
+            chunk = body[sent:min(sent + chunk_size, limit)]
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            if bandwidth:
+                time.sleep(len(chunk) / bandwidth)
+        self.wfile.flush()
+        if drop:
+            self.close_connection = True
+        self.server.mock.log(self.path.split("?")[0], status, sent)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockCRKNServer:
+    def __init__(self, latency=0.0, bandwidth=None, etags=True):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.etags = etags
+        # path -> (body, etag, last modified)
+        self.files = {}
+        self.failures = {}
+        self.drops = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), MockCRKNHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.thread = None
+
+    @property
+    def root_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    @property
+    def listing_url(self):
+        return self.root_url + "/listing"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def add_file(self, platform, date, rows=100, seed=0, file_type="xlsx", institutions=INSTITUTIONS):
+        """
+        Publish a synthetic PA-Rights file (replacing any file with the same name).
+        :param platform: platform name - the table name once synced (no underscores)
+        :param date: date/version part of the file name, e.g. "2024_01_20_02"
+        :param rows: number of data rows
+        :param seed: see make_rows
+        :param file_type: xlsx, csv or tsv
+        :param institutions: institution column names
+        :return: path of the file on the server
+        """
+        body = make_file(platform, make_rows(rows, seed, institutions), file_type, institutions)
+        return self.add_raw_file(f"CRKN_EbookPARightsTracking_{platform}_{date}.{file_type}", body)
+
+    def add_raw_file(self, file_name, body):
+        """
+        Publish a file with the given contents.
+        :param file_name: file name as listed on the CRKN website
+        :param body: bytes
+        :return: path of the file on the server
+        """
+        path = f"/files/{file_name}"
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        with self.lock:
+            self.files[path] = (body, etag, formatdate(time.time(), usegmt=True))
+        return path
+
+    def remove_file(self, platform):
+        """
+        Stop listing every file of a platform.
+        :param platform: platform name
+        """
+        with self.lock:
+            self.files = {path: file for path, file in self.files.items()
+                          if path.split("/")[-1].split("_")[2] != platform}
+
+    def listing_page(self):
+        with self.lock:
+            links = "".join(f'<li><a href="{path}">{path.split("/")[-1]}</a></li>' for path in sorted(self.files))
+        return f"<html><body><h1>Perpetual Access Rights</h1><ul>{links}</ul></body></html>"
+
+    def fail_next(self, path, *statuses):
+        """
+        Answer the next requests for a path with error statuses, one per request.
+        :param path: request path ("/listing" or a path from add_file), or "*" for any path
+        :param statuses: HTTP status codes
+        """
+        with self.lock:
+            self.failures.setdefault(path, []).extend(statuses)
+
+    def drop_next(self, path, count=1):
+        """
+        Close the connection half way through the next count bodies sent for a path.
+        :param path: request path, or "*" for any path
+        :param count: number of responses to cut short
+        """
+        with self.lock:
+            self.drops[path] = self.drops.get(path, 0) + count
+
+    def take_failure(self, path):
+        with self.lock:
+            for key in (path, "*"):
+                if self.failures.get(key):
+                    return self.failures[key].pop(0)
+        return None
+
+    def take_drop(self, path):
+        with self.lock:
+            for key in (path, "*"):
+                if self.drops.get(key):
+                    self.drops[key] -= 1
+                    return True
+        return False
+
+    def log(self, path, status, sent):
+        with self.lock:
+            self.requests.append((path, status, sent))
+
+    def requests_for(self, path):
+        """
+        :param path: request path
+        :return: list of (status, bytes sent) of the requests for the path
+        """
+        with self.lock:
+            return [(status, sent) for request_path, status, sent in self.requests if request_path == path]
+
+
+if __name__ == "__main__":
+    # Serve synthetic files for benchmarking the app - point the CRKN URL setting at the printed listing URL
+    import argparse
+    parser = argparse.ArgumentParser(description="Local stand-in for the CRKN website")
+    parser.add_argument("--files", type=int, default=10, help="number of files to list")
+    parser.add_argument("--rows", type=int, default=5000, help="data rows per file")
+    parser.add_argument("--file-type", default="xlsx", choices=["xlsx", "csv", "tsv"])
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before every response")
+    parser.add_argument("--bandwidth", type=int, default=None, help="bytes per second per response")
+    parser.add_argument("--no-etags", action="store_true", help="do not support conditional requests")
+    arguments = parser.parse_args()
+
+    mock = MockCRKNServer(arguments.latency, arguments.bandwidth, not arguments.no_etags)
+    for number in range(arguments.files):
+        mock.add_file(f"Platform{number}", "2024_01_01_01", arguments.rows, file_type=arguments.file_type)
+    mock.start()
+    print(f"Listing: {mock.listing_url}  (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        mock.stop()
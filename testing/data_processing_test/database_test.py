@@ -55,7 +55,7 @@ def test_connect_to_database_mock(mock_sqlite3):
     connection = database.connect_to_database()
 
     # Check that sqlite3.connect was called with the correct database name
-    mock_sqlite3.connect.assert_called_with(settings_manager.get_setting('database_name'))
+    mock_sqlite3.connect.assert_called_with(settings_manager.get_setting('database_name'), timeout=database.BUSY_TIMEOUT)
 
     # Check that the return value is the mock connection
     assert connection == mock_connection
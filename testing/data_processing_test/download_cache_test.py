@@ -0,0 +1,163 @@
+import hashlib
+import os
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+from src.data_processing.download_cache import DownloadCache, DownloadIntegrityError
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves one file with an ETag, answering 304 to a matching If-None-Match."""
+    body = b"Title\tPublisher\nA Book\tA Publisher\n"
+    etag = '"v1"'
+    requests_seen = []
+
+    def do_GET(self):
+        StandInHandler.requests_seen.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == StandInHandler.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", StandInHandler.etag)
+        self.send_header("Last-Modified", "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.send_header("Content-Length", str(len(StandInHandler.body)))
+        self.end_headers()
+        self.wfile.write(StandInHandler.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandInHandler.body = b"Title\tPublisher\nA Book\tA Publisher\n"
+    StandInHandler.etag = '"v1"'
+    StandInHandler.requests_seen = []
+    httpd = HTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fetch_stores_file_by_content_hash(server, tmp_path):
+    cache = DownloadCache(str(tmp_path))
+    result = cache.fetch(server + "/file.tsv")
+
+    expected_hash = hashlib.sha256(StandInHandler.body).hexdigest()
+    assert result.content_hash == expected_hash
+    assert os.path.basename(result.path) == expected_hash + ".tsv"
+    assert not result.not_modified
+    with open(result.path, "rb") as file:
+        assert file.read() == StandInHandler.body
+
+
+def test_fetch_revalidates_and_skips_transfer_on_304(server, tmp_path):
+    cache = DownloadCache(str(tmp_path))
+    first = cache.fetch(server + "/file.tsv")
+    cache.mark_processed(server + "/file.tsv", "catalog-1")
+
+    # New cache object reads the persisted index
+    second = DownloadCache(str(tmp_path)).fetch(server + "/file.tsv")
+
+    assert StandInHandler.requests_seen[-1]["If-None-Match"] == '"v1"'
+    assert StandInHandler.requests_seen[-1]["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+    assert second.not_modified
+    assert second.path == first.path
+    assert second.is_processed("catalog-1")
+    assert not second.is_processed("catalog-2")
+
+
+def test_changed_file_is_downloaded_and_not_processed(server, tmp_path):
+    cache = DownloadCache(str(tmp_path))
+    cache.fetch(server + "/file.tsv")
+    cache.mark_processed(server + "/file.tsv")
+
+    StandInHandler.body = b"Title\tPublisher\nAnother Book\tA Publisher\n"
+    StandInHandler.etag = '"v2"'
+    result = cache.fetch(server + "/file.tsv")
+
+    assert not result.not_modified
+    assert not result.is_processed()
+    with open(result.path, "rb") as file:
+        assert file.read() == StandInHandler.body
+
+
+def test_superseded_file_is_removed_unless_another_url_uses_it(server, tmp_path):
+    cache = DownloadCache(str(tmp_path))
+    first = cache.fetch(server + "/file.tsv")
+    cache.fetch(server + "/copy.tsv")
+
+    StandInHandler.body = b"Title\tPublisher\nAnother Book\tA Publisher\n"
+    StandInHandler.etag = '"v2"'
+    cache.fetch(server + "/file.tsv")
+    assert os.path.exists(first.path)
+
+    cache.fetch(server + "/copy.tsv")
+    assert not os.path.exists(first.path)
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".tsv")]) == 1
+
+
+def test_urls_no_longer_listed_are_dropped(server, tmp_path):
+    cache = DownloadCache(str(tmp_path))
+    old = cache.fetch(server + "/file_2024_01.tsv")
+    StandInHandler.body = b"Title\tPublisher\nAnother Book\tA Publisher\n"
+    StandInHandler.etag = '"v2"'
+    new = cache.fetch(server + "/file_2024_02.tsv")
+
+    assert cache.retain([server + "/file_2024_02.tsv"]) == 1
+
+    assert not os.path.exists(old.path) and os.path.exists(new.path)
+    assert list(DownloadCache(str(tmp_path)).index) == [server + "/file_2024_02.tsv"]
+
+
+def test_files_no_entry_uses_are_pruned(tmp_path):
+    orphan = tmp_path / (hashlib.sha256(b"old").hexdigest() + ".tsv")
+    orphan.write_bytes(b"old")
+    (tmp_path / "notes.txt").write_text("not a cached file")
+
+    DownloadCache(str(tmp_path))
+
+    assert not orphan.exists()
+    assert (tmp_path / "notes.txt").exists()
+
+
+def test_missing_cached_file_forces_full_download(server, tmp_path):
+    cache = DownloadCache(str(tmp_path))
+    result = cache.fetch(server + "/file.tsv")
+    os.remove(result.path)
+
+    result = cache.fetch(server + "/file.tsv")
+
+    assert "If-None-Match" not in StandInHandler.requests_seen[-1]
+    assert not result.not_modified
+    assert os.path.exists(result.path)
+
+
+def test_fetch_streams_to_temp_dir_and_reports_progress(server, tmp_path, monkeypatch):
+    monkeypatch.setattr("src.data_processing.download_cache.CHUNK_SIZE", 8)
+    temp_dir = tmp_path / "partial"
+    cache = DownloadCache(str(tmp_path / "cache"), str(temp_dir))
+    progress = []
+
+    result = cache.fetch(server + "/file.tsv", progress_callback=lambda done, total: progress.append((done, total)))
+
+    total = len(StandInHandler.body)
+    assert len(progress) == (total + 7) // 8
+    assert progress[-1] == (total, total)
+    # Temporary file was moved into the cache
+    assert os.listdir(temp_dir) == []
+    assert os.path.dirname(result.path) == str(tmp_path / "cache")
+
+
+def test_fetch_rejects_hash_mismatch(server, tmp_path):
+    cache = DownloadCache(str(tmp_path))
+
+    with pytest.raises(DownloadIntegrityError):
+        cache.fetch(server + "/file.tsv", expected_hash="0" * 64)
+
+    assert cache.get_entry(server + "/file.tsv") is None
+    assert os.listdir(cache.temp_dir) == []
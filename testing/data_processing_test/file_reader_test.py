@@ -0,0 +1,78 @@
+import csv
+import zipfile
+
+import pytest
+from src.data_processing.Scraping import file_to_dataframe, detect_file_type, check_file_format
+from xlsx_reader_test import make_workbook, book_row, HEADER
+
+
+def write_delimited(path, rows, separator=",", platform="Proquest"):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file, delimiter=separator)
+        writer.writerow([platform] + [""] * (len(HEADER) - 1))
+        writer.writerow(["Perpetual access rights"] + [""] * (len(HEADER) - 1))
+        writer.writerow(HEADER)
+        for row in rows:
+            writer.writerow(row)
+
+
+ROWS = [["Book 1", "Pub", "2020", "0306406152", "0123", "AG", "Coll", "2024-01-02", "Y", "N"],
+        ["Book, 2", "Pub", "2021", "9780306406157", "456", "AG", "Coll", "2024-01-03", "N", "Y"]]
+
+
+@pytest.mark.parametrize("separator, extension", [(",", "csv"), ("\t", "tsv")])
+def test_delimited_file_header_from_preamble(tmp_path, separator, extension):
+    path = tmp_path / f"file.{extension}"
+    write_delimited(path, ROWS, separator)
+
+    df = file_to_dataframe(f"file.{extension}", str(path))
+
+    assert df.columns.to_list() == HEADER + ["Platform", "File_Name"]
+    # Values kept as strings - leading zeros survive
+    assert df.values.tolist()[0] == ROWS[0] + ["Proquest", f"file.{extension}"]
+    assert df["Title"].to_list() == ["Book 1", "Book, 2"]
+    assert check_file_format(df) is True
+
+
+def test_type_detected_from_contents(tmp_path):
+    tsv_named_csv = tmp_path / "file.csv"
+    write_delimited(tsv_named_csv, ROWS, "\t")
+    xlsx_named_csv = tmp_path / "other.csv"
+    make_workbook(xlsx_named_csv, [book_row(0)])
+
+    assert detect_file_type(str(tsv_named_csv), "file.csv") == "tsv"
+    assert detect_file_type(str(xlsx_named_csv), "other.csv") == "xlsx"
+    assert len(file_to_dataframe("file.csv", str(tsv_named_csv))) == 2
+    assert len(file_to_dataframe("other.csv", str(xlsx_named_csv))) == 1
+
+
+def test_only_xlsx_csv_and_tsv_files_are_read(tmp_path):
+    text = tmp_path / "notes.txt"
+    write_delimited(text, ROWS, ",")
+    document = tmp_path / "report.xlsx"
+    with zipfile.ZipFile(document, "w") as archive:
+        archive.writestr("word/document.xml", "<document/>")
+
+    assert detect_file_type(str(text), "notes.txt") is None
+    assert detect_file_type(str(document), "report.xlsx") is None
+    assert file_to_dataframe("notes.txt", str(text)) is None
+
+
+def test_missing_values_and_platform(tmp_path):
+    path = tmp_path / "file.csv"
+    write_delimited(path, [["", "Pub", "2020", "", "", "AG", "Coll", "2024-01-02", "Y", "N"]])
+    no_platform = tmp_path / "none.csv"
+    write_delimited(no_platform, ROWS, platform="")
+
+    df = file_to_dataframe("file.csv", str(path))
+
+    assert df["Title"].isna().all()
+    assert check_file_format(df) == "1 error found:\nTitle: Missing title data. Row 4"
+    assert file_to_dataframe("none.csv", str(no_platform)) == "No Platform"
+
+
+def test_unsupported_file(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"\x00\x01\x02")
+
+    assert file_to_dataframe("file.bin", str(path)) is None
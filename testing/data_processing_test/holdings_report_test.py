@@ -0,0 +1,78 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+from src.data_processing import database, holdings_report
+from src.data_processing.Scraping import update_tables, upload_to_database
+from src.data_processing.holdings_report import HoldingsReport
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+
+COLUMNS = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name",
+           "title_metadata_last_modified", "UPEI", "Platform", "File_Name"]
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    monkeypatch.setitem(settings_manager.settings, "allow_CRKN", "True")
+    connection = sqlite3.connect(":memory:")
+    database.create_file_name_tables(connection)
+    yield connection
+    connection.close()
+
+
+def add_table(connection, table, rows, method="CRKN"):
+    df = pd.DataFrame([[title, "Pub", "2020", isbn, ocn, "AG", "Coll", date, access, table, f"{table}.csv"]
+                       for title, isbn, ocn, date, access in rows], columns=COLUMNS)
+    upload_to_database(df, table if method == "CRKN" else f"local_{table}", connection)
+    update_tables([table, "2024_01"], method, connection, "INSERT INTO")
+
+
+def test_report_dedupes_titles_across_files(connection):
+    add_table(connection, "Proquest", [("Book A", "978-0-306-40615-7", "1", "2023-01-01", "Y"),
+                                       ("Book B", None, "22", "2023-01-01", "Y"),
+                                       ("Book C", "9780306406164", "3", "2023-01-01", "N")])
+    add_table(connection, "Gale", [("Book A", "9780306406157", "1", "2024-05-01", "Y"),
+                                   ("Book B", None, "22", "2023-01-01", "Y"),
+                                   ("Book D", None, None, "2023-01-01", "Y")], method="local")
+    # A table loaded before the typed schema, with Y/N values and the ISBN as written
+    pd.DataFrame([["book d", "Pub", "2020", None, None, "AG", "Coll", "2022-01-01", "Y", "Ebsco", "Ebsco.csv"]],
+                 columns=COLUMNS).to_sql("Ebsco", connection, index=False)
+    update_tables(["Ebsco", "2024_01"], "CRKN", connection, "INSERT INTO")
+
+    report = HoldingsReport(connection, "UPEI", batch_rows=2)
+    rows = [row for _, batch in report.batches() for row in batch]
+
+    assert [(row[0], row[2], row[-1]) for row in rows] == [("Gale.csv", "Book A", 2), ("Proquest.csv", "Book B", 2),
+                                                           ("Gale.csv", "Book D", 2)]
+    assert len(rows[0]) == len(holdings_report.HEADERS)
+    assert report.titles == 3 and report.rows == 6
+    assert "3 titles from 3 files (3 duplicate rows removed)" in report.summary()
+
+
+def test_tables_without_the_institution_are_skipped(connection):
+    add_table(connection, "Proquest", [("Book A", "9780306406157", "1", "2023-01-01", "Y")])
+
+    report = HoldingsReport(connection, "Dal")
+
+    assert [batch for _, batch in report.batches()] == []
+    assert report.titles == 0
+
+
+def test_report_reads_more_tables_than_one_query_can_join(connection):
+    add_table(connection, "Proquest", [("Book A", "9780306406157", "1", "2023-01-01", "Y"),
+                                       ("Book B", "9780306406164", "2", "2023-01-01", "N")])
+    # 600 copies of the table - over SQLite's limit of 500 SELECTs in one UNION ALL
+    for i in range(600):
+        connection.execute(f"CREATE TABLE [Copy{i}] AS SELECT * FROM Proquest;")
+        update_tables([f"Copy{i}", "2024_01"], "CRKN", connection, "INSERT INTO")
+    connection.execute("UPDATE [Copy599] SET UPEI = 1 WHERE Title = 'Book B';")
+    connection.commit()
+
+    report = HoldingsReport(connection, "UPEI")
+    rows = [row for _, batch in report.batches() for row in batch]
+
+    assert [(row[2], row[-1]) for row in rows] == [("Book A", 601), ("Book B", 1)]
+    assert "2 titles from 601 files" in report.summary()
+    assert connection.execute("SELECT name FROM sqlite_temp_master").fetchall() == []
@@ -0,0 +1,93 @@
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+from src.data_processing.http_session import RetryPolicy, get_session, create_session
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers with each status in statuses in turn, then 200."""
+    protocol_version = "HTTP/1.1"
+    statuses = []
+    connections = set()
+    calls = 0
+
+    def do_GET(self):
+        FlakyHandler.calls += 1
+        FlakyHandler.connections.add(self.client_address)
+        status = FlakyHandler.statuses.pop(0) if FlakyHandler.statuses else 200
+        body = b"ok"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    FlakyHandler.statuses = []
+    FlakyHandler.connections = set()
+    FlakyHandler.calls = 0
+    httpd = HTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get_checked(session, url, **kwargs):
+    response = session.get(url, **kwargs)
+    response.raise_for_status()
+    return response
+
+
+def test_retries_transient_status_then_succeeds(server):
+    FlakyHandler.statuses = [503, 502]
+    policy = RetryPolicy(max_attempts=3, backoff_factor=0)
+
+    response = policy.call(get_checked, create_session(), server + "/listing")
+
+    assert response.status_code == 200
+    assert FlakyHandler.calls == 3
+
+
+def test_gives_up_after_max_attempts(server):
+    FlakyHandler.statuses = [503, 503, 503]
+    policy = RetryPolicy(max_attempts=2, backoff_factor=0)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        policy.call(get_checked, create_session(), server + "/listing")
+    assert FlakyHandler.calls == 2
+
+
+def test_does_not_retry_client_errors(server):
+    FlakyHandler.statuses = [404]
+    policy = RetryPolicy(max_attempts=3, backoff_factor=0)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        policy.call(get_checked, create_session(), server + "/listing")
+    assert FlakyHandler.calls == 1
+
+
+def test_backoff_is_exponential_with_jitter_and_capped():
+    policy = RetryPolicy(backoff_factor=1.0, max_backoff=5.0)
+
+    for attempt in range(1, 6):
+        delay = policy.get_delay(attempt)
+        assert 0 <= delay <= min(5.0, 2 ** (attempt - 1))
+
+
+def test_session_is_shared_and_keeps_connections_alive(server):
+    assert get_session() is get_session()
+
+    session = create_session()
+    for _ in range(3):
+        get_checked(session, server + "/file.xlsx")
+
+    # All three requests reused one pooled connection
+    assert len(FlakyHandler.connections) == 1
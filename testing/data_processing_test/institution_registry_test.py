@@ -0,0 +1,76 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+from src.data_processing import database
+from src.data_processing.Scraping import update_tables, upload_to_database
+from src.data_processing.institution_registry import InstitutionRegistry, normalize_name
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+
+HEADER = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name",
+          "title_metadata_last_modified"]
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings_manager, "settings_file", str(tmp_path / "settings.json"))
+    for key, value in {"allow_CRKN": "True", "institution": "UPEI", "CRKN_institutions": ["UPEI", "Dal"],
+                       "local_institutions": ["Acadia"]}.items():
+        monkeypatch.setitem(settings_manager.settings, key, value)
+    return InstitutionRegistry()
+
+
+@pytest.fixture
+def connection(registry):
+    connection = sqlite3.connect(":memory:")
+    database.create_file_name_tables(connection)
+    yield connection
+    connection.close()
+
+
+def add_table(connection, table, institutions):
+    row = [f"{table} book", "Pub", "2020", None, "1", "AG", "Coll", "2024-01-02"] + ["Y"] * len(institutions)
+    df = pd.DataFrame([row + [table, f"{table}.csv"]], columns=HEADER + institutions + ["Platform", "File_Name"])
+    upload_to_database(df, table, connection)
+    update_tables([table, "2024_01"], "CRKN", connection, "INSERT INTO")
+
+
+def test_names_are_matched_in_any_spelling(registry):
+    assert normalize_name("  Dalhousie   University ") == "dalhousie university"
+    assert "dal" in registry and " UPEI" in registry and "Mount Allison" not in registry
+    assert registry.registered_name("acadia") == "Acadia"
+    assert registry.names() == ["Acadia", "UPEI", "Dal"]
+    assert registry.new_institutions(["upei", "StFX", "stfx ", "Mount Allison"]) == ["StFX", "Mount Allison"]
+
+
+def test_added_institutions_are_registered_once(registry):
+    assert registry.add_local_institutions(["StFX", "dal", "stfx"]) == ["StFX"]
+    registry.add_CRKN_institutions(["Dal", "acadia", "UNB"])
+
+    assert settings_manager.get_setting("local_institutions") == ["Acadia", "StFX"]
+    assert settings_manager.get_setting("CRKN_institutions") == ["UPEI", "Dal", "acadia", "UNB"]
+    assert "unb" in registry and registry.names() == ["Acadia", "StFX", "UPEI", "Dal", "UNB"]
+
+
+def test_tables_of_an_institution_follow_the_database(registry, connection):
+    add_table(connection, "Proquest", ["UPEI", "Dal"])
+    assert registry.tables(connection, "upei") == {"Proquest": "UPEI"}
+
+    add_table(connection, "Gale", ["Upei"])
+    assert registry.tables(connection, "UPEI") == {"Proquest": "UPEI", "Gale": "Upei"}
+    assert registry.tables(connection, "Dal") == {"Proquest": "Dal"}
+    assert registry.tables(connection, "Acadia") == {}
+
+
+def test_search_reads_tables_that_spell_the_institution_differently(registry, connection, monkeypatch):
+    monkeypatch.setattr(InstitutionRegistry, "_instance", registry)
+    add_table(connection, "Proquest", ["UPEI"])
+    add_table(connection, "Gale", ["Upei"])
+    add_table(connection, "Ebsco", ["Dal"])
+
+    results = database.search_database(connection, database.get_search_query("UPEI"), ["*book*"], ["Title"])
+
+    assert sorted(row[3] for row in results) == ["Gale book", "Proquest book"]
+    assert all(row[0] == "Y" for row in results)
@@ -0,0 +1,79 @@
+import sqlite3
+import datetime
+
+import pandas as pd
+import pytest
+from src.data_processing import schema
+from src.data_processing.Scraping import upload_to_database
+
+COLUMNS = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name",
+           "title_metadata_last_modified", "UPEI", "Dal", "Platform", "File_Name"]
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    yield connection
+    connection.close()
+
+
+def make_df():
+    return pd.DataFrame([
+        ["Book A", "Pub", "2020", "978-0-306-40615-7", "123.0", "AG", "Coll", "2024-01-02 10:30:00", "Y", " n ",
+         "Proquest", "file.csv"],
+        ["Book B", "Pub", "2019-2020", "9780306406157; 0306406152", None, "AG", "Coll", "not a date", "Maybe", "N",
+         "Proquest", "file.csv"]
+    ], columns=COLUMNS)
+
+
+def test_columns_get_their_schema_types():
+    assert schema.column_types(COLUMNS) == ["TEXT", "INTEGER", "INTEGER", "TEXT", "INTEGER", "INTEGER", "INTEGER",
+                                            "DATE", "INTEGER", "INTEGER", "INTEGER", "INTEGER"]
+
+
+def test_values_are_converted_and_unconvertible_ones_kept():
+    converted = schema.convert_dataframe(make_df())
+
+    assert converted.iloc[0].to_list() == ["Book A", "Pub", 2020, "9780306406157", 123, "AG", "Coll", "2024-01-02",
+                                           1, 0, "Proquest", "file.csv"]
+    assert converted.iloc[1].to_list() == ["Book B", "Pub", "2019-2020", "9780306406157; 0306406152", None, "AG",
+                                           "Coll", None, "Maybe", 0, "Proquest", "file.csv"]
+
+
+def test_dates_in_mixed_formats_are_all_read():
+    values = pd.Series(["2024-01-15 00:00:00", "2024-01-16", datetime.datetime(2024, 1, 17, 9, 0), "Jan 18 2024",
+                        "not a date", None], name="title_metadata_last_modified")
+
+    assert schema.convert_dates(values).to_list() == ["2024-01-15", "2024-01-16", "2024-01-17", "2024-01-18", None,
+                                                      None]
+
+
+def test_tables_are_created_typed(connection):
+    upload_to_database(make_df(), "Proquest", connection)
+
+    assert schema.is_typed(connection, "Proquest")
+    row = connection.execute("SELECT typeof(Platform_YOP), typeof(OCN), typeof(UPEI), title_metadata_last_modified "
+                             "FROM Proquest WHERE Title = 'Book A'").fetchone()
+    assert row == ("integer", "integer", "integer", "2024-01-02")
+    # Searches bind the OCN as text - it still matches the integer column
+    assert connection.execute("SELECT Title FROM Proquest WHERE OCN = ?", ("123",)).fetchall() == [("Book A",)]
+
+
+def test_untyped_table_is_replaced(connection):
+    make_df().astype(str).to_sql("Proquest", connection, index=False)
+    assert not schema.is_typed(connection, "Proquest")
+
+    counts = upload_to_database(make_df(), "Proquest", connection)
+
+    assert counts["inserted"] == 2
+    assert schema.is_typed(connection, "Proquest")
+
+
+def test_converting_many_rows_is_vectorized():
+    df = pd.concat([make_df()] * 100_000, ignore_index=True)
+    start = datetime.datetime.now()
+
+    converted = schema.convert_dataframe(df)
+
+    assert (datetime.datetime.now() - start).total_seconds() < 5
+    assert converted["UPEI"].iloc[-2] == 1
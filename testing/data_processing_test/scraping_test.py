@@ -1,59 +1,64 @@
+import os
+import sqlite3
+
 import pytest
-from unittest.mock import patch, MagicMock
-import requests
-from src.data_processing.Scraping import scrapeCRKN
-from src.data_processing.Scraping import split_CRKN_file_name
-from src.data_processing.Scraping import compare_file
-
-
-class MockResponse:
-    def __init__(self, text, status_code):
-        self.text = text
-        self.status_code = status_code
-
-    def raise_for_status(self):
-        if self.status_code != 200:
-            raise requests.exceptions.HTTPError
-
-#Mock HTML content
-mock_html = "<html><body><a href='CRKN_EbookPARightsTracking_Proquest_2024_01_20_02.xlsx'>CRKN_EbookPARightsTracking_Proquest_2024_01_20_02.xlsx</a><a href='CRKN_EbookPARightsTracking_Proquest_2024_01_20_02.xlsx'>CRKN_EbookPARightsTracking_Proquest_2024_01_20_02.xlsx</a></body></html>"
-
-
-def test_scrapeCRKN_success():
-    # Mock data for the response
-    mock_response = MockResponse(mock_html, 200)
-    # Patching requests.get to return the mock response
-    with patch('src.data_processing.Scraping.requests.get', return_value=mock_response):
-        # Patching the database connection methods
-        with patch('src.data_processing.database.connect_to_database') as mock_connect, \
-                patch('src.data_processing.database.close_database') as mock_close:
-            # Create a mock connection object
-            mock_connection = MagicMock()
-            mock_connect.return_value = mock_connection
-
-            # Call the function
-            scrapeCRKN()
-
-            # Assertions to verify behavior
-            mock_connect.assert_called_once()  # Verify database connection was opened
-            mock_close.assert_called_once_with(mock_connection)  # Verify database connection was closed
-
-def test_scrapeCRKN_HTTP_failure():
-    # Mock data for the response
-    mock_response = MockResponse(None, 404)
-    # Patching requests.get to return the mock response
-    with patch('src.data_processing.Scraping.requests.get', return_value=mock_response):
-        # Patching the database connection methods
-        with patch('src.data_processing.database.connect_to_database') as mock_connect:
-            # Create a mock connection object
-            mock_connection = MagicMock()
-            mock_connect.return_value = mock_connection
-
-            # Call the function
-            scrapeCRKN()
-
-            # Assertions to verify behavior
-            mock_connect.assert_not_called()  # Verify database connection was opened
+from src.data_processing import database, string_dictionary
+from src.data_processing.download_cache import DownloadCache
+from src.data_processing.Scraping import ScrapingThread, split_CRKN_file_name, compare_file, sync_lock
+from src.utility.settings_manager import Settings
+from crkn_mock_server import MockCRKNServer
+
+settings_manager = Settings()
+
+
+@pytest.fixture
+def server():
+    with MockCRKNServer() as server:
+        yield server
+
+
+@pytest.fixture
+def crkn(server, tmp_path, monkeypatch):
+    """Settings pointed at the mock server and a new database in tmp_path."""
+    monkeypatch.setattr(settings_manager, "settings_file", str(tmp_path / "settings.json"))
+    for key, value in {
+        "language": "English",
+        "allow_CRKN": "True",
+        "CRKN_url": server.listing_url,
+        "CRKN_root_url": server.root_url,
+        "CRKN_institutions": [],
+        "database_name": str(tmp_path / "ebook_database.db"),
+        "download_cache_dir": str(tmp_path / "cache"),
+        "download_temp_dir": str(tmp_path / "cache" / "tmp"),
+        "retry_attempts": 3,
+        "retry_backoff": 0.01,
+        "sync_mode": "incremental",
+        "parse_processes": 1
+    }.items():
+        monkeypatch.setitem(settings_manager.settings, key, value)
+    connection = database.connect_to_database()
+    database.create_file_name_tables(connection)
+    database.close_database(connection)
+    return server
+
+
+def run_sync():
+    """Run a sync on the calling thread, answering yes to the update prompt."""
+    thread = ScrapingThread(auto_confirm=True)
+    errors = []
+    progress = []
+    thread.error_signal.connect(errors.append)
+    thread.progress_update.connect(progress.append)
+    thread.scrapeCRKN()
+    return errors, progress
+
+
+def query(sql):
+    connection = sqlite3.connect(settings_manager.get_setting("database_name"))
+    try:
+        return connection.execute(sql).fetchall()
+    finally:
+        connection.close()
 
 
 def test_split_CRKN_file_name():
@@ -72,44 +77,204 @@ def test_split_CRKN_file_name():
     assert result[1] == expected_date, "The date part of the file is not correctly extracted"
 
 
-def test_scrapeCRKN_html_processing():
-    # Mock HTML content
+def test_compare_file_new_file():
+    connection = sqlite3.connect(":memory:")
+    database.create_file_name_tables(connection)
+    connection.execute("INSERT INTO CRKN_file_names (file_name, file_date) VALUES ('test_file', '2022_01_01')")
 
-    # Mock response for requests.get
-    mock_response = MagicMock()
-    mock_response.raise_for_status.return_value = None
-    mock_response.text = mock_html
+    assert compare_file(["new_file", "2022_01_01"], "CRKN", connection) == "INSERT INTO"
+    assert compare_file(["test_file", "2022_02_01"], "CRKN", connection) == "UPDATE"
+    assert compare_file(["test_file", "2022_01_01"], "CRKN", connection) is False
+    connection.close()
 
-    # Mock database connection
-    mock_connection = MagicMock()
 
-    with patch('src.data_processing.Scraping.requests.get', return_value=mock_response):
-        with patch('src.data_processing.database.connect_to_database', return_value=mock_connection):
-            # Call the function
-            scrapeCRKN()
+def test_scrapeCRKN_success(crkn):
+    crkn.add_file("Proquest", "2024_01_20_02", rows=50)
+    crkn.add_file("Gale", "2024_01_20_02", rows=20, file_type="tsv")
 
-            # Check if database connection was used to execute queries
-            assert mock_connection.cursor.called, "Database cursor was not called"
+    errors, progress = run_sync()
 
-            # Check if the commit was called on the database connection
-            assert mock_connection.commit.called, "Database commit was not called"
+    assert errors == []
+    assert progress[-1] == 100
+    assert query("SELECT file_name, file_date FROM CRKN_file_names ORDER BY file_name") == [
+        ("Gale", "2024_01_20_02"), ("Proquest", "2024_01_20_02")]
+    assert query("SELECT COUNT(*) FROM Proquest") == [(50,)]
+    assert query("SELECT COUNT(*) FROM Gale") == [(20,)]
+    assert settings_manager.get_setting("CRKN_institutions") == ["UPEI", "Dal"]
 
-            # Check if database connection was closed
-            assert mock_connection.close.called, "Database connection was not closed"
 
+def test_scrapeCRKN_HTTP_failure(crkn):
+    crkn.add_file("Proquest", "2024_01_20_02")
+    crkn.fail_next("/listing", 404)
 
-def test_compare_file_new_file():
-    # Mocking the database connection and cursor
-    mock_connection = MagicMock()
-    mock_cursor = MagicMock()
-    mock_connection.cursor.return_value = mock_cursor
+    errors, _ = run_sync()
 
-    # Setting up the mock to return empty result for non existent file
-    mock_cursor.execute.return_value.fetchall.return_value = []
+    assert len(errors) == 1
+    assert query("SELECT file_name FROM CRKN_file_names") == []
+    assert crkn.requests_for("/listing") == [(404, 5)]
 
-    # Call the function
-    result = compare_file(["test_file", "2022_01_01"], "CRKN", mock_connection)
 
-    # Asserts
-    assert result == False, "Should return False for a new file"
-    mock_cursor.execute.assert_called_with("INSERT INTO CRKN_file_names (file_name, file_date) VALUES ('test_file', '2022_01_01')")
\ No newline at end of file
+def test_second_sync_is_refused_while_one_is_running(crkn):
+    crkn.add_file("Proquest", "2024_01_20_02")
+    thread = ScrapingThread(auto_confirm=True)
+    errors = []
+    thread.error_signal.connect(errors.append)
+
+    with sync_lock:
+        thread.run_task()
+
+    assert errors == ["A CRKN update is already running. Please wait for it to finish."]
+    assert crkn.requests_for("/listing") == []
+    thread.run_task()
+    assert query("SELECT file_name FROM CRKN_file_names") == [("Proquest",)]
+
+
+def test_database_is_not_locked_while_the_user_is_asked(crkn):
+    crkn.add_file("Proquest", "2024_01_20_02", rows=5)
+    thread = ScrapingThread()
+    locked = []
+
+    def answer(plan):
+        locked.append(database.write_lock.locked())
+        thread.receive_response("Y")
+    thread.file_changes_signal.connect(answer)
+
+    thread.scrapeCRKN()
+
+    assert locked == [False]
+    assert query("SELECT COUNT(*) FROM Proquest") == [(5,)]
+
+
+def test_background_sync_does_not_remove_most_of_the_catalog(crkn):
+    crkn.add_file("Proquest", "2024_01_20_02", rows=5)
+    crkn.add_file("Gale", "2024_01_20_02", rows=5)
+    crkn.add_file("Ebsco", "2024_01_20_02", rows=5)
+    run_sync()
+    for platform in ["Proquest", "Gale", "Ebsco"]:
+        crkn.remove_file(platform)
+
+    errors, _ = run_sync()
+
+    assert len(errors) == 1 and "missing 3 of the 3 files" in errors[0]
+    assert query("SELECT COUNT(*) FROM CRKN_file_names") == [(3,)]
+    assert query("SELECT COUNT(*) FROM Proquest") == [(5,)]
+
+
+def test_unchanged_listing_transfers_no_files(crkn):
+    path = crkn.add_file("Proquest", "2024_01_20_02")
+    run_sync()
+
+    errors, _ = run_sync()
+
+    assert errors == []
+    assert len(crkn.requests_for(path)) == 1
+
+
+def test_updated_and_removed_files_are_synced(crkn):
+    crkn.add_file("Proquest", "2024_01_20_02", rows=30)
+    crkn.add_file("Gale", "2024_01_20_02", rows=10)
+    run_sync()
+
+    crkn.remove_file("Proquest")
+    crkn.add_file("Proquest", "2024_02_01_01", rows=40, seed=1)
+    crkn.remove_file("Gale")
+    errors, _ = run_sync()
+
+    assert errors == []
+    assert query("SELECT file_name, file_date FROM CRKN_file_names") == [("Proquest", "2024_02_01_01")]
+    assert query("SELECT COUNT(*) FROM Proquest") == [(40,)]
+    assert query("SELECT name FROM sqlite_master WHERE name = 'Gale'") == []
+    # Only the listing and the new Proquest file are still cached
+    cache = DownloadCache()
+    assert len(cache.index) == 2 and crkn.listing_url in cache.index
+    assert len([name for name in os.listdir(cache.cache_dir) if name.endswith(".xlsx")]) == 1
+
+
+def test_transient_errors_are_retried(crkn):
+    path = crkn.add_file("Proquest", "2024_01_20_02")
+    crkn.fail_next(path, 503)
+    # Connection drops half way through the second attempt
+    crkn.drop_next(path)
+
+    errors, _ = run_sync()
+
+    assert errors == []
+    assert [status for status, _ in crkn.requests_for(path)] == [503, 200, 200]
+    assert query("SELECT COUNT(*) FROM Proquest") == [(100,)]
+
+
+def test_interrupted_sync_leaves_database_untouched_and_resumes(crkn):
+    first = crkn.add_file("Alpha", "2024_01_20_02", rows=10)
+    second = crkn.add_file("Beta", "2024_01_20_02", rows=10)
+    crkn.fail_next(second, 404)
+
+    errors, _ = run_sync()
+
+    assert len(errors) == 1
+    assert query("SELECT file_name FROM CRKN_file_names") == []
+    assert query("SELECT name FROM sqlite_master WHERE name IN ('Alpha', 'Beta')") == []
+
+    errors, _ = run_sync()
+
+    assert errors == []
+    # The file loaded by the first sync was not downloaded again
+    assert len(crkn.requests_for(first)) == 1
+    assert query("SELECT COUNT(*) FROM Alpha") == [(10,)]
+    assert query("SELECT COUNT(*) FROM Beta") == [(10,)]
+    assert query("SELECT name FROM sqlite_master WHERE name LIKE 'shadow%'") == []
+
+
+@pytest.mark.parametrize("file_type", ["xlsx", "csv"])
+def test_republished_identical_file_only_updates_metadata(crkn, file_type):
+    path = crkn.add_file("Proquest", "2024_01_20_02", rows=20)
+    body = crkn.files[path][0]
+    run_sync()
+    query_hashes = "SELECT file_date, content_hash, row_hash FROM CRKN_file_names"
+    (_, content_hash, row_hash), = query(query_hashes)
+    rowids = query("SELECT rowid FROM Proquest ORDER BY rowid")
+
+    # Same rows published again under a new date - the same bytes, or re-encoded as csv
+    crkn.remove_file("Proquest")
+    new_name = f"CRKN_EbookPARightsTracking_Proquest_2024_02_01_01.{file_type}"
+    if file_type == "xlsx":
+        crkn.add_raw_file(new_name, body)
+    else:
+        crkn.add_file("Proquest", "2024_02_01_01", rows=20, file_type=file_type)
+    errors, _ = run_sync()
+
+    assert errors == []
+    (file_date, new_content_hash, new_row_hash), = query(query_hashes)
+    assert file_date == "2024_02_01_01"
+    assert new_row_hash == row_hash
+    assert (new_content_hash == content_hash) == (file_type == "xlsx")
+    # The table was not reloaded, only its File_Name column changed
+    assert query("SELECT rowid FROM Proquest ORDER BY rowid") == rowids
+    assert query(f"SELECT DISTINCT {string_dictionary.decode_expression('File_Name')} FROM Proquest") == [(new_name,)]
+
+
+def test_large_file_is_streamed(crkn, monkeypatch):
+    monkeypatch.setitem(settings_manager.settings, "streaming_threshold_mb", 0)
+    crkn.add_file("Proquest", "2024_01_20_02", rows=30, file_type="csv")
+
+    errors, progress = run_sync()
+
+    assert errors == []
+    assert query("SELECT COUNT(*) FROM Proquest") == [(30,)]
+    assert settings_manager.get_setting("CRKN_institutions") == ["UPEI", "Dal"]
+
+    # Republished with the same rows - streamed, found unchanged, and rolled back
+    crkn.remove_file("Proquest")
+    crkn.add_file("Proquest", "2024_02_01_01", rows=30, file_type="tsv")
+    errors, _ = run_sync()
+
+    assert errors == []
+    assert query("SELECT file_date FROM CRKN_file_names") == [("2024_02_01_01",)]
+    assert query("SELECT name FROM sqlite_master WHERE name LIKE 'shadow%'") == []
+
+    # New rows in an xlsx file - streamed batch by batch as well
+    crkn.remove_file("Proquest")
+    crkn.add_file("Proquest", "2024_03_01_01", rows=40, seed=1)
+    errors, _ = run_sync()
+
+    assert errors == []
+    assert query("SELECT COUNT(*) FROM Proquest") == [(40,)]
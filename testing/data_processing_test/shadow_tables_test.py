@@ -0,0 +1,167 @@
+import sqlite3
+import datetime
+
+import pandas as pd
+import pytest
+from src.data_processing import database, shadow_tables, string_dictionary
+from src.data_processing.Scraping import upload_to_database
+from src.data_processing.shadow_tables import ShadowSync, drop_shadow_tables
+
+COLUMNS = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name",
+           "title_metadata_last_modified", "UPEI", "Platform", "File_Name"]
+
+
+def make_df(titles):
+    data = [[title, "Pub", 2020, str(i), 123, "AG1", "Coll", datetime.datetime(2024, 1, 2), "Y", "Proquest",
+             "file.xlsx"] for i, title in enumerate(titles)]
+    return pd.DataFrame(data, columns=COLUMNS)
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    database.create_file_name_tables(connection)
+    upload_to_database(make_df(["Book A", "Book B"]), "Proquest", connection)
+    upload_to_database(make_df(["Book C"]), "Gale", connection)
+    connection.executemany("INSERT INTO CRKN_file_names (file_name, file_date) VALUES (?, ?)", [("Proquest", "2024_01"), ("Gale", "2024_01")])
+    connection.commit()
+    yield connection
+    connection.close()
+
+
+def stage_file(shadow, connection, table_name, df, file_date, command):
+    shadow_table = shadow.create(table_name, df.columns.to_list())
+    upload_to_database(df, shadow_table, connection)
+    shadow.stage(table_name, file_date, command, df.columns.to_list(), len(df))
+
+
+def titles(connection, table_name):
+    return [row[0] for row in connection.execute(f"SELECT Title FROM [{table_name}] ORDER BY Title").fetchall()]
+
+
+def tables(connection):
+    return {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+
+
+def test_staged_changes_are_hidden_until_commit(connection):
+    shadow = ShadowSync(connection)
+    stage_file(shadow, connection, "Proquest", make_df(["Book A", "Book D"]), "2024_02", "UPDATE")
+    stage_file(shadow, connection, "Ebsco", make_df(["Book E"]), "2024_02", "INSERT INTO")
+    shadow.remove("Gale")
+
+    # Live tables are untouched while staged
+    assert titles(connection, "Proquest") == ["Book A", "Book B"]
+    assert "Ebsco" not in tables(connection)
+
+    shadow.commit()
+
+    assert titles(connection, "Proquest") == ["Book A", "Book D"]
+    assert titles(connection, "Ebsco") == ["Book E"]
+    assert "Gale" not in tables(connection)
+    assert not any(table.startswith("shadow__") for table in tables(connection))
+    catalog = connection.execute("SELECT file_name, file_date FROM CRKN_file_names ORDER BY file_name").fetchall()
+    assert catalog == [("Ebsco", "2024_02"), ("Proquest", "2024_02")]
+
+
+def test_staged_tables_are_indexed(connection):
+    shadow = ShadowSync(connection)
+    stage_file(shadow, connection, "Proquest", make_df(["Book A"]), "2024_02", "UPDATE")
+    shadow.commit()
+
+    indexes = connection.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='Proquest'").fetchall()
+    assert len(indexes) == 3
+
+    # A second sync builds its own indexes without name clashes
+    shadow = ShadowSync(connection)
+    stage_file(shadow, connection, "Proquest", make_df(["Book B"]), "2024_03", "UPDATE")
+    shadow.commit()
+    assert titles(connection, "Proquest") == ["Book B"]
+
+
+def test_discard_leaves_database_untouched(connection):
+    shadow = ShadowSync(connection)
+    stage_file(shadow, connection, "Proquest", make_df(["Book D"]), "2024_02", "UPDATE")
+    shadow.remove("Gale")
+
+    shadow.discard()
+
+    assert titles(connection, "Proquest") == ["Book A", "Book B"]
+    assert titles(connection, "Gale") == ["Book C"]
+    assert not any(table.startswith("shadow__") for table in tables(connection))
+
+
+def test_validation_rejects_incomplete_shadow_table(connection):
+    shadow = ShadowSync(connection)
+    df = make_df(["Book A", "Book D"])
+    upload_to_database(df, shadow.create("Proquest", COLUMNS), connection)
+
+    with pytest.raises(ValueError):
+        shadow.stage("Proquest", "2024_02", "UPDATE", df.columns.to_list(), len(df) + 1)
+
+
+def test_failed_swap_rolls_back(connection):
+    shadow = ShadowSync(connection)
+    stage_file(shadow, connection, "Ebsco", make_df(["Book E"]), "2024_02", "INSERT INTO")
+    stage_file(shadow, connection, "Proquest", make_df(["Book D"]), "2024_02", "UPDATE")
+    shadow.remove("Gale")
+    # Second rename fails part-way through the swap
+    connection.execute("DROP TABLE shadow__Proquest")
+    connection.commit()
+
+    with pytest.raises(sqlite3.Error):
+        shadow.commit()
+
+    assert titles(connection, "Proquest") == ["Book A", "Book B"]
+    assert titles(connection, "Gale") == ["Book C"]
+    assert "Ebsco" not in tables(connection)
+    assert connection.execute("SELECT COUNT(*) FROM CRKN_file_names").fetchone()[0] == 2
+    assert not any(table.startswith("shadow__") for table in tables(connection))
+
+
+def test_live_table_is_only_copied_for_a_row_by_row_sync(connection, monkeypatch):
+    shadow = ShadowSync(connection)
+    # Streamed file, and a file with other columns - loaded into a new table, nothing to copy
+    assert shadow.create("Proquest") not in tables(connection)
+    assert shadow.create("Proquest", COLUMNS[:-3] + ["Dal"] + COLUMNS[-2:]) not in tables(connection)
+    monkeypatch.setitem(shadow_tables.settings_manager.settings, "sync_mode", "replace")
+    assert shadow.create("Proquest", COLUMNS) not in tables(connection)
+
+    monkeypatch.setitem(shadow_tables.settings_manager.settings, "sync_mode", "incremental")
+    assert titles(connection, shadow.create("Proquest", COLUMNS)) == ["Book A", "Book B"]
+
+
+def test_leftover_shadow_tables_are_dropped(connection):
+    ShadowSync(connection).create("Proquest", COLUMNS)
+
+    drop_shadow_tables(connection)
+
+    assert tables(connection) == {"CRKN_file_names", "local_file_names", "string_dictionary", "Proquest", "Gale"}
+
+
+def test_loaded_shadow_table_can_be_kept_and_restored(connection):
+    shadow = ShadowSync(connection)
+    stage_file(shadow, connection, "Proquest", make_df(["Book A", "Book D"]), "2024_02", "UPDATE")
+    stage_file(shadow, connection, "Ebsco", make_df(["Book E"]), "2024_02", "INSERT INTO")
+    # Sync stopped - keep the Proquest table for the next one
+    shadow.discard(keep=["Proquest"])
+    drop_shadow_tables(connection, keep=["Proquest"])
+
+    shadow = ShadowSync(connection)
+    assert not shadow.restore("Ebsco", "2024_02", "INSERT INTO", 1)
+    assert not shadow.restore("Proquest", "2024_02", "UPDATE", 5)
+    assert shadow.restore("Proquest", "2024_02", "UPDATE", 2)
+    shadow.commit()
+
+    assert titles(connection, "Proquest") == ["Book A", "Book D"]
+
+
+def test_metadata_only_change_keeps_rows(connection):
+    shadow = ShadowSync(connection)
+    shadow.stage_metadata("Proquest", "2024_02", "new_file.xlsx", "abc", "def")
+    shadow.commit()
+
+    assert titles(connection, "Proquest") == ["Book A", "Book B"]
+    assert connection.execute(f"SELECT DISTINCT {string_dictionary.decode_expression('File_Name')} "
+                              f"FROM Proquest").fetchall() == [("new_file.xlsx",)]
+    assert connection.execute("SELECT file_date, content_hash, row_hash FROM CRKN_file_names "
+                              "WHERE file_name = 'Proquest'").fetchall() == [("2024_02", "abc", "def")]
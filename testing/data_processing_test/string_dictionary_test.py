@@ -0,0 +1,79 @@
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+from src.data_processing import database, string_dictionary
+from src.data_processing.Scraping import update_tables, upload_to_database
+from src.data_processing.string_dictionary import StringDictionary
+
+COLUMNS = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name",
+           "title_metadata_last_modified", "UPEI", "Platform", "File_Name"]
+
+
+def make_df(rows):
+    return pd.DataFrame([[f"Book {i}", "Oxford University Press", "2020", str(9780306406157 + i * 10), str(i),
+                          "CRKN_EBOOK_AGREEMENT_2024", "Oxford Scholarship Online Complete Collection", "2024-01-02",
+                          "Y", "Oxford Academic Platform", "CRKN_PARightsTracking_Oxford_2024_01_15.xlsx"]
+                         for i in range(rows)], columns=COLUMNS)
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    yield connection
+    connection.close()
+
+
+def test_strings_are_stored_once_and_decoded(connection):
+    upload_to_database(make_df(3), "Oxford", connection)
+    upload_to_database(make_df(2).assign(File_Name="other.csv"), "Other", connection)
+
+    assert connection.execute("SELECT COUNT(*) FROM string_dictionary").fetchone()[0] == 6
+    assert connection.execute("SELECT DISTINCT typeof(Publisher) FROM Oxford").fetchall() == [("integer",)]
+    publisher = string_dictionary.decode_expression("Publisher")
+    file_name = string_dictionary.decode_expression("File_Name")
+    assert connection.execute(f"SELECT DISTINCT {publisher}, {file_name} FROM Other").fetchall() == \
+        [("Oxford University Press", "other.csv")]
+
+
+def test_strings_of_tables_written_before_the_encoding_are_read_as_they_are(connection):
+    string_dictionary.create_table(connection)
+    make_df(2).to_sql("Oxford", connection, index=False)
+
+    assert connection.execute(f"SELECT DISTINCT {string_dictionary.decode_expression('Platform')} "
+                              f"FROM Oxford").fetchall() == [("Oxford Academic Platform",)]
+
+
+def test_rolled_back_strings_are_not_kept(connection):
+    StringDictionary(connection).encode(make_df(1))
+    connection.rollback()
+
+    assert connection.execute("SELECT COUNT(*) FROM string_dictionary").fetchone()[0] == 0
+
+
+def test_encoded_database_is_smaller(tmp_path):
+    sizes = []
+    for name, write in [("text", lambda df, c: df.to_sql("Oxford", c, index=False)),
+                        ("encoded", lambda df, c: upload_to_database(df, "Oxford", c))]:
+        connection = sqlite3.connect(tmp_path / f"{name}.db")
+        write(make_df(20_000), connection)
+        connection.commit()
+        connection.close()
+        sizes.append(os.path.getsize(tmp_path / f"{name}.db"))
+
+    assert sizes[1] < sizes[0] / 2
+
+
+def test_strings_of_removed_files_are_pruned(connection):
+    database.create_file_name_tables(connection)
+    upload_to_database(make_df(3), "Oxford", connection)
+    update_tables(["Oxford", "2024_01"], "CRKN", connection, "INSERT INTO")
+    upload_to_database(make_df(2).assign(Publisher="Gale", File_Name="other.csv"), "Other", connection)
+    update_tables(["Other", "2024_01"], "CRKN", connection, "INSERT INTO")
+
+    update_tables(["Other"], "CRKN", connection, "DELETE")
+
+    values = {row[0] for row in connection.execute("SELECT value FROM string_dictionary")}
+    assert "Gale" not in values and "other.csv" not in values
+    assert "Oxford University Press" in values and len(values) == 5
@@ -0,0 +1,57 @@
+import hashlib
+
+from src.data_processing.sync_journal import SyncJournal, DOWNLOADED, VALIDATED, LOADED
+
+
+def make_download(tmp_path, contents=b"Title\tPublisher\n"):
+    path = tmp_path / "download.tsv"
+    path.write_bytes(contents)
+    return str(path), hashlib.sha256(contents).hexdigest()
+
+
+def test_stages_are_persisted_and_merged(tmp_path):
+    journal_path = str(tmp_path / "journal.json")
+    journal = SyncJournal(journal_path, "db.sqlite")
+    journal.record("Proquest", "2024_02", DOWNLOADED, content_hash="abc", path="/cache/abc.xlsx")
+    journal.record("Proquest", "2024_02", VALIDATED)
+    journal.record("Proquest", "2024_02", LOADED, row_count=10)
+
+    entry = SyncJournal(journal_path, "db.sqlite").get("Proquest", "2024_02")
+
+    assert entry == {"file_date": "2024_02", "stage": LOADED, "content_hash": "abc", "path": "/cache/abc.xlsx",
+                     "row_count": 10}
+
+
+def test_entry_for_another_file_date_is_ignored(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal.json"), "db.sqlite")
+    journal.record("Proquest", "2024_02", LOADED, row_count=10)
+
+    assert journal.get("Proquest", "2024_03") is None
+
+    # A newer version starts over
+    journal.record("Proquest", "2024_03", DOWNLOADED, path="/cache/new.xlsx")
+    assert "row_count" not in journal.get("Proquest", "2024_03")
+
+
+def test_prune_and_database_change_forget_entries(tmp_path):
+    journal_path = str(tmp_path / "journal.json")
+    journal = SyncJournal(journal_path, "db.sqlite")
+    journal.record("Proquest", "2024_02", LOADED, row_count=10)
+    journal.record("Gale", "2024_02", LOADED, row_count=5)
+
+    journal.prune([("Proquest", "2024_02"), ("Gale", "2024_03")])
+
+    assert journal.loaded_tables() == ["Proquest"]
+    assert SyncJournal(journal_path, "other.sqlite").loaded_tables() == []
+
+
+def test_verified_download_checks_contents(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal.json"), "db.sqlite")
+    path, content_hash = make_download(tmp_path)
+    journal.record("Proquest", "2024_02", DOWNLOADED, content_hash=content_hash, path=path)
+
+    assert journal.verified_download(journal.get("Proquest", "2024_02")) == path
+
+    (tmp_path / "download.tsv").write_bytes(b"truncated")
+    assert journal.verified_download(journal.get("Proquest", "2024_02")) is None
+    assert journal.verified_download(None) is None
@@ -0,0 +1,119 @@
+import threading
+import time
+
+from src.data_processing import sync_pipeline
+from src.data_processing.sync_pipeline import SyncPipeline
+
+
+def double(payload):
+    # Module level so it can run in a worker process
+    if payload == 3:
+        raise ValueError("bad file")
+    return payload * 2, 1
+
+
+def test_pipeline_loads_every_item_on_calling_thread():
+    loaded = []
+    load_threads = set()
+
+    def load(payload):
+        load_threads.add(threading.get_ident())
+        loaded.append(payload)
+        return 10
+
+    pipeline = SyncPipeline(lambda item: (item, 100), lambda payload: (payload + 1, 1), load)
+    failures = pipeline.run([1, 2, 3])
+
+    assert failures == []
+    assert sorted(loaded) == [2, 3, 4]
+    assert load_threads == {threading.get_ident()}
+    stats = pipeline.get_stats()
+    assert stats["download"]["units"] == 300
+    assert stats["parse"]["items"] == 3
+    assert stats["load"]["units"] == 30
+
+
+def test_stages_overlap():
+    def download(item):
+        time.sleep(0.1)
+        return item, 0
+
+    def parse(payload):
+        time.sleep(0.1)
+        return payload, 1
+
+    def load(payload):
+        time.sleep(0.1)
+        return 0
+
+    start = time.perf_counter()
+    SyncPipeline(download, parse, load).run(list(range(5)))
+    elapsed = time.perf_counter() - start
+
+    # Sequential would take 1.5s, pipelined about (5 + 2) * 0.1s
+    assert elapsed < 1.1
+
+
+def test_bounded_queues_apply_backpressure():
+    downloaded = []
+    release = threading.Event()
+
+    def download(item):
+        downloaded.append(item)
+        return item, 0
+
+    def load(payload):
+        release.wait()
+        return 0
+
+    pipeline = SyncPipeline(download, lambda payload: (payload, 1), load, queue_size=1)
+    thread = threading.Thread(target=pipeline.run, args=(list(range(20)),))
+    thread.start()
+    time.sleep(0.3)
+
+    # One item being loaded, one in each queue and one held by each of the download and parse stages
+    assert len(downloaded) <= 5
+    release.set()
+    thread.join()
+    assert len(downloaded) == 20
+
+
+def test_failed_items_are_skipped_and_reported():
+    loaded = []
+
+    def download(item):
+        if item == 1:
+            raise ConnectionError("lost")
+        return item, 0
+
+    def load(payload):
+        loaded.append(payload)
+        return 0
+
+    failures = SyncPipeline(download, double, load).run([1, 2, 3, 4])
+
+    assert sorted(loaded) == [4, 8]
+    assert sorted((stage, item) for item, stage, _ in failures) == [("download", 1), ("parse", 3)]
+
+
+def test_parse_in_worker_processes():
+    loaded = []
+
+    def load(payload):
+        loaded.append(payload)
+        return 0
+
+    failures = SyncPipeline(lambda item: (item, 0), double, load, parse_processes=2).run([1, 2, 3, 4, 5])
+
+    assert sorted(loaded) == [2, 4, 8, 10]
+    assert [(item, stage) for item, stage, _ in failures] == [(3, "parse")]
+
+
+def test_parse_processes_setting_has_one_meaning(monkeypatch):
+    monkeypatch.setattr(sync_pipeline.os, "cpu_count", lambda: 8)
+    monkeypatch.setitem(sync_pipeline.settings_manager.settings, "parse_processes", 0)
+    assert [sync_pipeline.get_parse_processes(files) for files in (1, 3, 30)] == [0, 3, 8]
+    monkeypatch.setitem(sync_pipeline.settings_manager.settings, "parse_processes", 1)
+    assert sync_pipeline.get_parse_processes(30) == 0
+    monkeypatch.setitem(sync_pipeline.settings_manager.settings, "parse_processes", 4)
+    assert sync_pipeline.get_parse_processes(30) == 4
@@ -0,0 +1,41 @@
+import json
+import sqlite3
+
+from src.data_processing.sync_plan import SyncPlan, load_catalog, plan_sync
+
+
+def test_plan_sorts_files_into_inserts_updates_and_deletes():
+    listing = [("Proquest", "2024_02", "/files/CRKN_PA_Proquest_2024_02.xlsx"),
+               ("Gale", "2024_01", "/files/CRKN_PA_Gale_2024_01.xlsx"),
+               ("Ebsco", "2024_01", "/files/CRKN_PA_Ebsco_2024_01.csv")]
+    catalog = {"Proquest": "2024_01", "Gale": "2024_01", "Wiley": "2023_12", "Brill": "2023_12"}
+
+    plan = plan_sync(listing, catalog)
+
+    assert [file["file_name"] for file in plan.inserts] == ["Ebsco"]
+    assert plan.updates == [{"file_name": "Proquest", "file_date": "2024_02",
+                             "link": "/files/CRKN_PA_Proquest_2024_02.xlsx"}]
+    assert plan.deletes == ["Brill", "Wiley"]
+    assert plan.unchanged == 1
+    assert plan.change_count() == 4
+    assert [command for _, command in plan.downloads()] == ["INSERT INTO", "UPDATE"]
+    # 2 of the 4 catalog files removed - still applied without asking, more would not be
+    assert plan.catalog_size() == 4 and plan.can_apply_unconfirmed()
+    assert not plan_sync(listing[:1], catalog).can_apply_unconfirmed()
+
+
+def test_plan_round_trips_through_json():
+    plan = plan_sync([("Proquest", "2024_02", "/a.xlsx")], {"Gale": "2024_01"})
+
+    copy = SyncPlan.from_dict(json.loads(json.dumps(plan.to_dict())))
+
+    assert copy.to_dict() == plan.to_dict()
+
+
+def test_load_catalog_reads_file_names_table():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE CRKN_file_names(file_name VARCHAR(255), file_date VARCHAR(255));")
+    connection.executemany("INSERT INTO CRKN_file_names VALUES (?, ?)", [("Proquest", "2024_01"), ("O'Reilly", "1")])
+
+    assert load_catalog(connection) == {"Proquest": "2024_01", "O'Reilly": "1"}
+    connection.close()
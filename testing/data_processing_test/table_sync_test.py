@@ -0,0 +1,88 @@
+import sqlite3
+import datetime
+
+import pandas as pd
+import pytest
+from src.data_processing import table_sync
+from src.data_processing.Scraping import upload_to_database
+from src.data_processing.string_dictionary import StringDictionary
+
+COLUMNS = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name",
+           "title_metadata_last_modified", "UPEI", "Dal", "Platform", "File_Name"]
+
+
+def make_df(rows):
+    data = [[title, "Pub", 2020, isbn, 123.0, "AG1", "Coll", datetime.datetime(2024, 1, 2, 10, 30), upei, "N",
+             "Proquest", "file.xlsx"] for title, isbn, upei in rows]
+    return pd.DataFrame(data, columns=COLUMNS)
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    yield connection
+    connection.close()
+
+
+def test_row_keys_normalize_isbn_and_title():
+    df = pd.DataFrame({"Title": [" A Book", "a book ", "A Book"],
+                       "Platform_eISBN": ["978-0-306-40615-7", "9780306406157", "9780306406157"]})
+
+    keys = table_sync.make_row_keys(df)
+
+    # Same normalized key, numbered so they stay unique
+    assert keys[0].rsplit("\x1f", 1)[0] == keys[1].rsplit("\x1f", 1)[0]
+    assert len(set(keys)) == 3
+
+
+def test_sync_applies_only_changed_rows(connection):
+    upload_to_database(make_df([("Book A", "111", "Y"), ("Book B", "222", "Y"), ("Book C", "333", "N")]),
+                       "Proquest", connection)
+
+    counts = upload_to_database(make_df([("Book A", "111", "Y"), ("Book B", "222", "N"), ("Book D", "444", "Y")]),
+                                "Proquest", connection)
+
+    assert counts == {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": 1}
+    rows = connection.execute("SELECT Title, UPEI, title_metadata_last_modified FROM Proquest ORDER BY Title").fetchall()
+    assert rows == [("Book A", 1, "2024-01-02"), ("Book B", 0, "2024-01-02"), ("Book D", 1, "2024-01-02")]
+
+
+def test_unchanged_file_writes_nothing(connection):
+    df = make_df([("Book A", "111", "Y"), ("Book B", "222", "N")])
+    upload_to_database(df, "Proquest", connection)
+
+    counts = upload_to_database(df, "Proquest", connection)
+
+    assert counts == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 2}
+
+
+def test_renamed_file_updates_only_the_changed_rows(connection):
+    upload_to_database(make_df([(f"Book {i}", str(i), "Y") for i in range(50)]), "Proquest", connection)
+    df = make_df([(f"Book {i}", str(i), "N" if i == 7 else "Y") for i in range(50)]).assign(File_Name="file_v2.xlsx")
+
+    counts = upload_to_database(df, "Proquest", connection)
+
+    assert counts == {"inserted": 0, "updated": 1, "deleted": 0, "unchanged": 49}
+    assert connection.execute("SELECT COUNT(*) FROM Proquest WHERE UPEI = 0").fetchone() == (1,)
+    assert connection.execute("SELECT DISTINCT File_Name FROM Proquest").fetchall() == [
+        (StringDictionary(connection).id("file_v2.xlsx"),)]
+
+
+def test_changed_columns_replace_the_table(connection):
+    upload_to_database(make_df([("Book A", "111", "Y")]), "Proquest", connection)
+    df = make_df([("Book A", "111", "Y")]).drop(columns=["Dal"])
+
+    counts = upload_to_database(df, "Proquest", connection)
+
+    assert counts["inserted"] == 1
+    assert table_sync.get_table_columns(connection, "Proquest") == df.columns.to_list()
+
+
+def test_row_hash_ignores_row_order_and_file_name():
+    df = make_df([("Book A", "978-0-306-40615-7", "Y"), ("Book B", "9780306406158", "N")])
+    reordered = df.iloc[::-1].assign(File_Name="other_file.csv")
+
+    assert table_sync.row_hash(df) == table_sync.row_hash(reordered)
+    changed = df.copy()
+    changed.loc[0, "UPEI"] = "N"
+    assert table_sync.row_hash(df) != table_sync.row_hash(changed)
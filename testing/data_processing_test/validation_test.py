@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+import pandas as pd
+from src.data_processing import validation
+from src.data_processing.Scraping import check_file_format
+
+COLUMNS = validation.HEADER_ROW + ["UPEI", "Dal", "Platform", "File_Name"]
+
+
+def make_df(rows):
+    data = [[f"Book {i}", "Pub", "2020", "9780306406157", "1", "AG", "Coll", "2024-01-02 10:30:00", "Y", "N",
+             "Proquest", "file.xlsx"] for i in range(rows)]
+    return pd.DataFrame(data, columns=COLUMNS, dtype=object)
+
+
+def test_valid_file():
+    report = validation.validate(make_df(5))
+
+    assert report.is_valid()
+    assert report.problems == {}
+    assert check_file_format(make_df(5)) is True
+
+
+def test_every_problem_is_reported_with_row_numbers():
+    df = make_df(20)
+    df.loc[[1, 7], "Title"] = [None, "  "]
+    df.loc[3, "UPEI"] = None
+    df.loc[4, "Dal"] = "maybe"
+    df.loc[5, "Dal"] = " y "
+    df.loc[6, "Platform_eISBN"] = "978-0-306-40615-8"
+    df.loc[8, "Platform_eISBN"] = "0-306-40615-2"
+    df.loc[9, "title_metadata_last_modified"] = "last tuesday"
+
+    report = validation.validate(df)
+
+    assert not report.is_valid()
+    assert report.summary() == ("2 errors found:\n"
+                                "Title: Missing title data. Rows 5, 11\n"
+                                "UPEI: Missing Y/N data. Row 7\n"
+                                "3 warnings:\n"
+                                "Dal: Value is not Y or N. Row 8\n"
+                                "Platform_eISBN: Invalid ISBN. Row 10\n"
+                                "title_metadata_last_modified: Unrecognized date. Row 13")
+
+
+def test_warnings_do_not_fail_the_file():
+    df = make_df(3)
+    df.loc[0, "Platform_eISBN"] = "12345"
+
+    assert check_file_format(df) is True
+    assert validation.validate(df).count(validation.WARNING) == 1
+
+
+def test_header_problem_stops_validation():
+    df = make_df(3).rename(columns={"Publisher": "Publisher Name"})
+    df.loc[0, "Title"] = None
+
+    assert check_file_format(df) == "The header row is incorrect."
+
+
+def test_report_is_capped_and_counts_across_chunks():
+    validator = validation.Validator()
+    for _ in range(3):
+        chunk = make_df(10)
+        chunk["Title"] = None
+        validator.update(chunk)
+
+    problem = validator.report.problems[(validation.ERROR, "Title", "Missing title data.")]
+    assert problem["count"] == 30
+    assert problem["rows"] == list(range(4, 4 + validation.MAX_ROWS_LISTED))
+    assert validator.result().endswith("... (30 rows)")
+
+
+def test_large_file_validates_quickly():
+    rows = 200_000
+    df = make_df(1).loc[np.zeros(rows, dtype=int)].reset_index(drop=True)
+    df["Title"] = [f"Book {i}" for i in range(rows)]
+
+    start = time.perf_counter()
+    report = validation.validate(df)
+
+    assert report.is_valid()
+    assert time.perf_counter() - start < 1
@@ -0,0 +1,102 @@
+import datetime
+import zipfile
+
+import openpyxl
+import pytest
+from src.data_processing import xlsx_reader
+from src.data_processing.Scraping import file_to_dataframe_excel, check_file_format
+
+HEADER = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name",
+          "title_metadata_last_modified", "UPEI", "Dal"]
+
+
+def make_workbook(path, rows, sheet_name="PA-Rights", platform="Proquest"):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = sheet_name
+    sheet.append([platform])
+    sheet.append(["Perpetual access rights"])
+    sheet.append(HEADER)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def book_row(i):
+    return [f"Book {i}", "Pub", 2020, 9780306406157 + i, 1000.0 + i, "AG", "Coll",
+            datetime.datetime(2024, 1, 2, 10, 30), "Y", "N"]
+
+
+def test_reader_streams_string_batches(tmp_path):
+    path = tmp_path / "file.xlsx"
+    make_workbook(path, [book_row(i) for i in range(5)] + [[None] * 10])
+
+    with xlsx_reader.PARightsSheet(path) as sheet:
+        batches = list(sheet.batches(batch_size=2))
+        assert sheet.platform == "Proquest"
+        assert sheet.header == HEADER
+
+    # Empty row skipped, last batch partial
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert batches[0][0] == ["Book 0", "Pub", "2020", "9780306406157", "1000", "AG", "Coll", "2024-01-02 10:30:00",
+                             "Y", "N"]
+
+
+def test_missing_sheet_raises_key_error(tmp_path):
+    path = tmp_path / "file.xlsx"
+    make_workbook(path, [book_row(0)], sheet_name="Sheet1")
+
+    with pytest.raises(KeyError):
+        xlsx_reader.PARightsSheet(path)
+    assert file_to_dataframe_excel("file.xlsx", path) == "PA-Rights"
+
+
+def test_file_to_dataframe_excel(tmp_path):
+    path = tmp_path / "file.xlsx"
+    make_workbook(path, [book_row(i) for i in range(3)])
+
+    df = file_to_dataframe_excel("file.xlsx", path)
+
+    assert df.columns.to_list() == HEADER + ["Platform", "File_Name"]
+    assert len(df) == 3
+    assert df["Platform_eISBN"].to_list() == ["9780306406157", "9780306406158", "9780306406159"]
+    assert set(df["Platform"]) == {"Proquest"}
+    assert check_file_format(df) is True
+
+
+def test_missing_platform(tmp_path):
+    path = tmp_path / "file.xlsx"
+    make_workbook(path, [book_row(0)], platform=None)
+
+    assert file_to_dataframe_excel("file.xlsx", path) == "No Platform"
+
+
+def test_shared_strings_dates_and_missing_rows(tmp_path):
+    # Minimal workbook as other tools write it - shared strings, relative targets, no XML for the empty second row
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    path = tmp_path / "file.xlsx"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("xl/workbook.xml",
+                         f'<workbook {ns} xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                         '<workbookPr date1904="1"/><sheets><sheet name="PA-Rights" sheetId="1" r:id="rId1"/></sheets>'
+                         '</workbook>')
+        archive.writestr("xl/_rels/workbook.xml.rels",
+                         '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Id="rId1" Type="http://x/worksheet" Target="worksheets/sheet1.xml"/>'
+                         '<Relationship Id="rId2" Type="http://x/sharedStrings" Target="sharedStrings.xml"/>'
+                         '<Relationship Id="rId3" Type="http://x/styles" Target="styles.xml"/></Relationships>')
+        archive.writestr("xl/sharedStrings.xml",
+                         f'<sst {ns}><si><t>Proquest</t></si><si><t>Title</t></si><si><t>Date</t></si>'
+                         '<si><r><t>Rich </t></r><r><t>Title</t></r></si></sst>')
+        archive.writestr("xl/styles.xml",
+                         f'<styleSheet {ns}><cellXfs><xf numFmtId="0"/><xf numFmtId="14"/></cellXfs></styleSheet>')
+        archive.writestr("xl/worksheets/sheet1.xml",
+                         f'<worksheet {ns}><sheetData><row r="1"><c r="A1" t="s"><v>0</v></c></row>'
+                         '<row r="3"><c r="A3" t="s"><v>1</v></c><c r="C3" t="s"><v>2</v></c></row>'
+                         '<row r="4"><c r="A4" t="s"><v>3</v></c><c r="C4" s="1"><v>0</v></c></row>'
+                         '</sheetData></worksheet>')
+
+    with xlsx_reader.PARightsSheet(path) as sheet:
+        assert sheet.platform == "Proquest"
+        assert sheet.header == ["Title", None, "Date"]
+        assert list(sheet.batches()) == [[["Rich Title", None, "1904-01-01 00:00:00"]]]
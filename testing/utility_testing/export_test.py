@@ -0,0 +1,124 @@
+import csv
+import datetime
+import gzip
+
+import openpyxl
+import pandas as pd
+import pytest
+from src.data_processing import database
+from src.data_processing.Scraping import update_tables, upload_to_database
+from src.utility import export
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+
+COLUMNS = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name",
+           "title_metadata_last_modified", "UPEI", "Dal", "Platform", "File_Name"]
+HEADERS = ["Access", "File_Name", "Platform", "Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN",
+           "agreement_code", "collection_name", "title_metadata_last_modified"]
+
+
+@pytest.fixture
+def local(tmp_path, monkeypatch):
+    """Two loaded CRKN files in a new database in tmp_path."""
+    monkeypatch.setattr(settings_manager, "settings_file", str(tmp_path / "settings.json"))
+    for key, value in {"database_name": str(tmp_path / "ebook_database.db"), "allow_CRKN": "True",
+                       "institution": "UPEI"}.items():
+        monkeypatch.setitem(settings_manager.settings, key, value)
+    connection = database.connect_to_database()
+    database.create_file_name_tables(connection)
+    for table, rows in [("Proquest", 25), ("Gale", 10)]:
+        df = pd.DataFrame([[f"{table} {i}", "Pub", "2020", str(9780306406157 + i * 10), str(i), "AG", "Coll",
+                            "2024-01-02", "Y" if i % 2 else "N", "N", table, f"{table}.csv"] for i in range(rows)],
+                          columns=COLUMNS)
+        upload_to_database(df, table, connection)
+        update_tables([table, "2024_01"], "CRKN", connection, "INSERT INTO")
+    database.close_database(connection)
+    return tmp_path
+
+
+def read_tsv(path):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="") as file:
+        return list(csv.reader(file, delimiter="\t"))
+
+
+@pytest.mark.parametrize("file_name", ["export.tsv", "export.tsv.gz"])
+def test_search_is_streamed_to_the_file(local, monkeypatch, file_name):
+    monkeypatch.setattr(export, "EXPORT_BATCH_ROWS", 4)
+    path = str(local / file_name)
+    progress = []
+    thread = export.ExportThread(path, HEADERS, search_query=(database.get_search_query("UPEI"), ["*"], ["Title"]))
+    thread.progress_update.connect(progress.append)
+
+    thread.run_task()
+
+    rows = read_tsv(path)
+    assert rows[0] == HEADERS
+    assert len(rows) == 36 and thread.rows_written == 35
+    assert rows[1][:4] == ["N", "Proquest.csv", "Proquest", "Proquest 0"]
+    assert progress[-1] == 100 and len(progress) > 3
+
+
+def test_search_is_streamed_to_xlsx_sheets_with_fixed_formats(local, monkeypatch):
+    monkeypatch.setattr(export, "XLSX_MAX_ROWS", 10)
+    path = str(local / "export.xlsx")
+    thread = export.ExportThread(path, HEADERS, search_query=(database.get_search_query("UPEI"), ["*"], ["Title"]))
+
+    thread.run_task()
+
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    sheets = [list(sheet.iter_rows(values_only=True)) for sheet in workbook.worksheets]
+    workbook.close()
+    # 35 rows, 10 per sheet, each sheet with the header row
+    assert workbook.sheetnames == ["Export", "Export 2", "Export 3", "Export 4"]
+    assert [len(rows) for rows in sheets] == [11, 11, 11, 6]
+    assert all(rows[0] == tuple(HEADERS) for rows in sheets)
+    first = sheets[0][1]
+    assert first[:4] == ("N", "Proquest.csv", "Proquest", "Proquest 0")
+    assert first[5:8] == (2020, "9780306406157", 0)
+    assert first[-1] == datetime.datetime(2024, 1, 2)
+
+
+def test_xlsx_export_drops_characters_excel_cannot_store(local):
+    path = str(local / "export.xlsx")
+
+    export.export_rows([(100, [("Title\x0b1", "97803\x0b06406157")])], path, ["Title", "Platform_eISBN"])
+
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    assert list(workbook.active.iter_rows(values_only=True)) == [("Title", "Platform_eISBN"),
+                                                                  ("Title1", "9780306406157")]
+    workbook.close()
+
+
+def test_results_on_screen_are_exported_when_there_is_no_search(local):
+    path = str(local / "export.tsv")
+    thread = export.ExportThread(path, ["A", "B"], results=[("Y", None), ("N", 2)])
+
+    thread.run_task()
+
+    assert read_tsv(path) == [["A", "B"], ["Y", ""], ["N", "2"]]
+
+
+def test_failed_export_removes_the_partial_file(local):
+    path = local / "export.tsv"
+
+    def batches():
+        yield 50, [("Y",)]
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        export.export_rows(batches(), str(path), ["A"])
+    assert not path.exists()
+
+
+def test_holdings_report_is_written_with_a_summary(local):
+    path = str(local / "holdings.tsv")
+    thread = export.HoldingsReportThread(path, "UPEI")
+
+    thread.run_task()
+
+    rows = read_tsv(path)
+    # Every other row of each file is Y for UPEI, and the two files share their ISBNs
+    assert rows[0][-1] == "Sources" and len(rows) == 1 + 12
+    assert thread.summary().startswith("12 titles from 2 files (5 duplicate rows removed)")
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+from PyQt6.QtCore import QCoreApplication
+from src.data_processing import database
+from src.utility.folder_watcher import FolderWatcher
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+# Timers need an application object
+app = QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    """Watcher of tmp_path, recording the files it would upload."""
+    monkeypatch.setitem(settings_manager.settings, "language", "English")
+    watcher = FolderWatcher()
+    watcher.set_folder(str(tmp_path))
+    watcher.uploads = []
+    monkeypatch.setattr(watcher, "upload", lambda paths: (watcher.uploads.append(sorted(paths)),
+                                                          watcher.uploaded.update({p: watcher.seen[p] for p in paths})))
+    return watcher
+
+
+def test_files_are_uploaded_once_they_settle(tmp_path, watcher):
+    path = tmp_path / "file.csv"
+    path.write_text("Proquest\n")
+    (tmp_path / "~$file.xlsx").write_text("lock")
+    (tmp_path / "notes.txt").write_text("notes")
+
+    # First seen - could still be copying
+    watcher.scan()
+    assert watcher.uploads == []
+    watcher.scan()
+    assert watcher.uploads == [[str(path)]]
+    # Uploaded, and unchanged since
+    watcher.scan()
+    assert watcher.uploads == [[str(path)]]
+
+
+def test_changed_file_is_uploaded_again(tmp_path, watcher):
+    path = tmp_path / "file.csv"
+    path.write_text("Proquest\n")
+    watcher.scan()
+    watcher.scan()
+
+    path.write_text("Proquest\nPA-Rights\n")
+    os.utime(path, ns=(0, 10 ** 9))
+    watcher.scan()
+    assert len(watcher.uploads) == 1
+    watcher.scan()
+    assert len(watcher.uploads) == 2
+
+
+def test_no_scan_while_another_writer_holds_the_database(tmp_path, watcher):
+    path = tmp_path / "file.csv"
+    path.write_text("Proquest\n")
+    watcher.scan()
+
+    with database.write_lock:
+        watcher.scan()
+        watcher.scan()
+    assert watcher.uploads == []
+    watcher.scan()
+    assert watcher.uploads == [[str(path)]]
+
+
+def test_missing_folder_is_reported(tmp_path, watcher):
+    watcher.set_folder(str(tmp_path / "missing"))
+
+    assert "not found" in watcher.status
+    watcher.scan()
+    assert watcher.uploads == []
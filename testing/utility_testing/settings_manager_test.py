@@ -61,3 +61,43 @@ class TestSettingsManager(unittest.TestCase):
     def test_get_setting_value(self):
         settings_manager = Settings(self.settings_path)
         self.assertEqual(settings_manager.get_setting("language"), self.default_settings["language"], "Failed to retrieve the correct setting value")
+
+
+class TestSettingsPersistence(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_manager = Settings()
+        self.saved = (self.settings_manager.settings_file, self.settings_manager.settings)
+        self.settings_manager.settings_file = os.path.join(self.temp_dir, 'settings.json')
+        self.settings_manager.settings = {"language": "English", "local_institutions": []}
+        self.settings_manager.save_settings()
+
+    def tearDown(self):
+        self.settings_manager.settings_file, self.settings_manager.settings = self.saved
+        shutil.rmtree(self.temp_dir)
+
+    def read_settings(self):
+        with open(self.settings_manager.settings_file, 'r') as file:
+            return json.load(file)
+
+    def test_batch_writes_the_settings_once_at_the_end(self):
+        with self.settings_manager.batch():
+            with self.settings_manager.batch():
+                self.settings_manager.add_local_institution("Dal")
+            self.settings_manager.add_local_institution("UPEI")
+            self.settings_manager.update_setting("language", "French")
+            self.assertEqual(self.read_settings()["local_institutions"], [], "Settings were written inside the batch")
+        self.assertEqual(self.read_settings(), {"language": "French", "local_institutions": ["Dal", "UPEI"]})
+
+    def test_failed_write_keeps_the_previous_file(self):
+        self.settings_manager.settings["language"] = object()
+        with self.assertRaises(TypeError):
+            self.settings_manager.save_settings()
+        self.assertEqual(self.read_settings()["language"], "English", "settings.json was partially written")
+        self.assertEqual(os.listdir(self.temp_dir), ['settings.json'], "The temporary file was not removed")
+
+    def test_write_keeps_the_permissions_of_the_file(self):
+        os.chmod(self.settings_manager.settings_file, 0o644)
+        self.settings_manager.update_setting("language", "French")
+        self.assertEqual(os.stat(self.settings_manager.settings_file).st_mode & 0o777, 0o644,
+                         "settings.json permissions were changed")
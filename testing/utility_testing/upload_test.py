@@ -0,0 +1,167 @@
+import csv
+import sqlite3
+
+import pytest
+from src.data_processing import database
+from src.utility import upload
+from src.utility.settings_manager import Settings
+
+settings_manager = Settings()
+
+HEADER = ["Title", "Publisher", "Platform_YOP", "Platform_eISBN", "OCN", "agreement_code", "collection_name",
+          "title_metadata_last_modified"]
+
+
+def write_file(path, rows, institutions=("UPEI", "Dal"), separator=","):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file, delimiter=separator)
+        writer.writerow(["Proquest"])
+        writer.writerow(["Perpetual access rights"])
+        writer.writerow(HEADER + list(institutions))
+        for i in range(rows):
+            writer.writerow([f"Book {i}", "Pub", "2020", str(9780306406157 + i * 10), str(i), "AG", "Coll",
+                             "2024-01-02", "Y", "N"])
+    return str(path)
+
+
+@pytest.fixture
+def local(tmp_path, monkeypatch):
+    """Settings pointed at a new database in tmp_path."""
+    monkeypatch.setattr(settings_manager, "settings_file", str(tmp_path / "settings.json"))
+    for key, value in {
+        "database_name": str(tmp_path / "ebook_database.db"),
+        "CRKN_institutions": ["UPEI"],
+        "local_institutions": [],
+        "sync_mode": "incremental",
+        "parse_processes": 2
+    }.items():
+        monkeypatch.setitem(settings_manager.settings, key, value)
+    monkeypatch.setattr(upload, "language", "English")
+    return tmp_path
+
+
+def run_upload(file_paths, answers=()):
+    """Run an upload on the calling thread, answering the yes/no questions in order."""
+    thread = upload.UploadThread(file_paths)
+    answers = list(answers)
+    questions = []
+    summaries = []
+
+    def answer(title, body, log):
+        log.append(body)
+        thread.receive_response(answers.pop(0) if log is questions and answers else True)
+    thread.get_answer_yes_no.connect(lambda title, body: answer(title, body, questions))
+    thread.get_okay.connect(lambda title, body: answer(title, body, summaries))
+    thread.error_signal.connect(lambda title, body: answer(title, body, summaries))
+    thread.run_task()
+    return questions, summaries
+
+
+def query(sql):
+    connection = sqlite3.connect(settings_manager.get_setting("database_name"))
+    try:
+        return connection.execute(sql).fetchall()
+    finally:
+        connection.close()
+
+
+def test_files_are_parsed_in_parallel_and_loaded(local):
+    paths = [write_file(local / f"file{i}.csv", rows=10 + i) for i in range(3)]
+
+    questions, summaries = run_upload(paths, answers=[True])
+
+    # One question for the new institution of all three files, asked before any of them was parsed
+    assert len(questions) == 1 and "Dal" in questions[0]
+    assert settings_manager.get_setting("local_institutions") == ["Dal"]
+    assert len(summaries) == 1 and summaries[0].count("Your file has been uploaded") == 3
+    assert query("SELECT file_name FROM local_file_names ORDER BY file_name") == [("file0",), ("file1",), ("file2",)]
+    assert [query(f"SELECT COUNT(*) FROM local_file{i}")[0][0] for i in range(3)] == [10, 11, 12]
+
+
+def test_declined_institutions_skip_only_those_files(local):
+    settings_manager.settings["CRKN_institutions"] = ["UPEI", "Dal"]
+    known = write_file(local / "known.csv", rows=5)
+    new = write_file(local / "new.csv", rows=5, institutions=("UPEI", "Acadia"))
+
+    questions, summaries = run_upload([known, new], answers=[False])
+
+    assert len(questions) == 1 and "Acadia" in questions[0]
+    assert query("SELECT file_name FROM local_file_names") == [("known",)]
+    assert "new.csv\nThis file will not be uploaded" in summaries[0]
+
+
+def test_invalid_file_does_not_stop_the_others(local):
+    good = write_file(local / "good.csv", rows=5)
+    bad = local / "bad.csv"
+    bad.write_text("not,a\nPA-Rights,file\n")
+    settings_manager.settings["local_institutions"] = ["Dal"]
+
+    _, summaries = run_upload([good, str(bad)])
+
+    assert query("SELECT file_name FROM local_file_names") == [("good",)]
+    assert "bad.csv\nAn error occurred during file processing" in summaries[0]
+    assert "good.csv\nYour file has been uploaded" in summaries[0]
+
+
+def test_reuploaded_identical_file_only_updates_metadata(local):
+    settings_manager.settings["local_institutions"] = ["Dal"]
+    path = write_file(local / "file.csv", rows=5)
+    run_upload([path])
+    rowids = query("SELECT rowid FROM local_file")
+
+    questions, summaries = run_upload([path], answers=[True])
+
+    assert len(questions) == 1 and "replace" in questions[0]
+    assert "identical" in summaries[0]
+    assert query("SELECT rowid FROM local_file") == rowids
+    connection = database.connect_to_database()
+    assert database.get_file_hashes(connection, "local")["file"][0] is not None
+    database.close_database(connection)
+
+
+def test_same_file_under_a_new_name_is_not_loaded_again(local):
+    settings_manager.settings["local_institutions"] = ["Dal"]
+    run_upload([write_file(local / "file.csv", rows=5)])
+    # Same bytes under a new name, the same rows as a tab separated file, and two copies in one upload
+    renamed = write_file(local / "renamed.csv", rows=5)
+    converted = write_file(local / "converted.tsv", rows=5, separator="\t")
+    new = [write_file(local / name, rows=7) for name in ("new.csv", "new copy.csv")]
+
+    questions, summaries = run_upload([renamed, converted] + new)
+
+    assert questions == []
+    assert summaries[0].count("This file is identical to file,") == 2
+    # Whichever copy is parsed first is loaded
+    stored = [row[0] for row in query("SELECT file_name FROM local_file_names ORDER BY file_name")]
+    assert stored in (["file", "new"], ["file", "new copy"])
+    assert f"This file is identical to {stored[1]}," in summaries[0]
+
+
+def test_large_file_is_streamed(local, monkeypatch):
+    monkeypatch.setitem(settings_manager.settings, "streaming_threshold_mb", 0)
+    settings_manager.settings["local_institutions"] = ["Dal"]
+    path = write_file(local / "file.tsv", rows=25, separator="\t")
+
+    _, summaries = run_upload([path])
+
+    assert "25 rows have been added" in summaries[0]
+    assert query("SELECT COUNT(*) FROM local_file") == [(25,)]
+    assert query("SELECT row_hash FROM local_file_names")[0][0] is not None
+
+
+def test_watched_folder_upload_asks_nothing(local):
+    settings_manager.settings["local_institutions"] = ["Dal"]
+    known = write_file(local / "known.csv", rows=5)
+    new = write_file(local / "new.csv", rows=5, institutions=("UPEI", "Acadia"))
+    run_upload([known])
+
+    thread = upload.UploadThread([known, new], auto_confirm=True)
+    log = []
+    thread.get_answer_yes_no.connect(lambda title, body: pytest.fail(body))
+    thread.log_message.connect(log.append)
+    thread.run_task()
+
+    # The unchanged file is skipped silently, the one with a new institution is left for a manual upload
+    assert len(log) == 1 and "known.csv" not in log[0] and "new.csv" in log[0]
+    assert settings_manager.get_setting("local_institutions") == ["Dal"]
+    assert query("SELECT file_name FROM local_file_names") == [("known",)]
@@ -0,0 +1,29 @@
+from PyQt6.QtCore import pyqtSignal
+from src.utility.worker import WorkerThread
+
+
+class QuestionThread(WorkerThread):
+    question = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.answers = []
+        self.errors = []
+
+    def run_task(self):
+        self.answers.append(self.ask(self.question, "first"))
+        self.answers.append(self.ask(self.question, "second"))
+        raise RuntimeError("stopped")
+
+    def task_failed(self, error):
+        self.errors.append(str(error))
+
+
+def test_ask_returns_the_answer_of_each_question():
+    thread = QuestionThread()
+    thread.question.connect(lambda text: thread.receive_response(text.upper()))
+
+    thread.run()
+
+    assert thread.answers == ["FIRST", "SECOND"]
+    assert thread.errors == ["stopped"]